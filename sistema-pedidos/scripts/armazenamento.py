@@ -0,0 +1,894 @@
+from importacao import ModuloAdiado
+import copy
+import json
+import sqlite3
+import threading
+import tempfile
+import uuid
+import os
+from contextlib import contextmanager
+
+pd = ModuloAdiado('pandas')
+openpyxl = ModuloAdiado('openpyxl')
+
+COLUNAS_PRODUTOS = [
+    'id_produto', 'nome', 'descricao', 'preco_unitario', 'quantidade_estoque'
+]
+
+COLUNAS_HISTORICO = [
+    'id_pedido', 'id_produto', 'nome_produto', 'descricao_pedido',
+    'quantidade_pedida', 'preco_unitario', 'valor_total',
+    'data_pedido', 'status'
+]
+
+
+def linhas_do_dataframe(df, colunas):
+    """Converte um DataFrame em dicts com tipos nativos do Python (NaN vira None)"""
+    if df.empty:
+        return []
+    df = df[colunas]
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def _filtrar_periodo(historico, desde=None, ate=None):
+    """Filtra o histórico por data_pedido (textos no formato AAAA-MM-DD HH:MM:SS)"""
+    if desde is not None:
+        historico = historico[historico['data_pedido'].astype(str) >= desde]
+    if ate is not None:
+        historico = historico[historico['data_pedido'].astype(str) <= ate]
+    return historico
+
+
+def _pagina(historico, apos, quantidade):
+    """Os `quantidade` menores id_pedido acima de `apos`, em ordem"""
+    return historico[historico['id_pedido'] > apos].nsmallest(quantidade, 'id_pedido').reset_index(drop=True)
+
+
+class Armazenamento:
+    """Interface dos mecanismos de armazenamento do sistema de pedidos"""
+
+    # Mecanismos que gravam por linha não precisam do estado completo em registrar()
+    grava_por_linha = False
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+
+        # Criar pasta se não existir
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+
+    def inicializar(self):
+        """Cria o armazenamento vazio se ainda não existir"""
+        raise NotImplementedError
+
+    def carregar(self):
+        """Retorna os DataFrames (produtos, historico)"""
+        raise NotImplementedError
+
+    def carregar_produtos(self):
+        """Retorna apenas o DataFrame de produtos"""
+        return self.carregar()[0]
+
+    def carregar_historico(self, colunas=None, desde=None, ate=None):
+        """Retorna o histórico do período, opcionalmente apenas com as colunas informadas"""
+        historico = _filtrar_periodo(self.carregar()[1], desde, ate)
+        return historico if colunas is None else historico[colunas]
+
+    def carregar_pagina_historico(self, apos, quantidade, desde=None, ate=None):
+        """Até `quantidade` pedidos do período com id_pedido maior que `apos`, em ordem de id.
+
+        Paginação por chave: menos de `quantidade` linhas significa que não há mais
+        pedidos após a página.
+        """
+        return _pagina(self.carregar_historico(desde=desde, ate=ate), apos, quantidade)
+
+    @contextmanager
+    def retrato(self):
+        """Leitor cujas leituras veem todas a mesma versão dos dados, sem esperar gravações.
+
+        Mecanismos sem esse isolamento retornam o próprio armazenamento: cada
+        leitura isolada é consistente, mas leituras seguidas podem ver versões diferentes.
+        """
+        yield self
+
+    def descartar_cache(self):
+        """Descarta o que foi mantido em memória: os dados mudaram em outro processo"""
+
+    def buscar_produto(self, id_produto):
+        """Retorna um DataFrame com a linha do produto (vazio se não existir)"""
+        produtos = self.carregar_produtos()
+        return produtos[produtos['id_produto'] == id_produto]
+
+    def buscar_pedido(self, id_pedido):
+        """Retorna um DataFrame com a linha do pedido (vazio se não existir)"""
+        historico = self.carregar_historico()
+        return historico[historico['id_pedido'] == id_pedido]
+
+    def proximo_id_pedido(self):
+        """Próximo id_pedido livre"""
+        ids = self.carregar_historico(['id_pedido'])['id_pedido']
+        return 1 if ids.empty else int(ids.max()) + 1
+
+    def salvar(self, produtos, historico):
+        """Substitui todo o conteúdo pelos DataFrames informados"""
+        raise NotImplementedError
+
+    def registrar(self, registros, produtos, historico):
+        """Persiste registros de operação.
+
+        `produtos` e `historico` são o estado já com os registros aplicados;
+        mecanismos sem atualização por linha simplesmente gravam esse estado.
+        """
+        self.salvar(produtos, historico)
+
+
+class ArmazenamentoExcel(Armazenamento):
+    """Arquivo Excel com as abas Produtos e Historico.
+
+    Grava por registro: a planilha fica aberta em memória (openpyxl) entre as
+    operações, e cada gravação altera só as células afetadas (nova linha no
+    histórico, estoque do produto, status do pedido) antes de salvar o arquivo
+    (temporário + rename). As abas lidas também ficam em memória e são
+    atualizadas pelas próprias gravações; o arquivo só é relido quando outro
+    processo o substitui.
+    """
+
+    grava_por_linha = True
+
+    # Colunas (base 1) alteradas no lugar
+    _COLUNA_ESTOQUE = COLUNAS_PRODUTOS.index('quantidade_estoque') + 1
+    _COLUNA_STATUS = COLUNAS_HISTORICO.index('status') + 1
+
+    def __init__(self, caminho):
+        super().__init__(caminho)
+        self._lock = threading.Lock()
+        self._dados = None  # (assinatura do arquivo, produtos, historico), nunca alterados no lugar
+        # (assinatura do arquivo, Workbook, {id_produto: linha}, {id_pedido: linha}, {aba: próxima linha livre})
+        self._livro = None
+
+    def inicializar(self):
+        """Cria arquivo Excel com duas abas se não existir"""
+        if not os.path.exists(self.caminho):
+            # Abas de produtos e histórico (vazias inicialmente)
+            self.salvar(pd.DataFrame(columns=COLUNAS_PRODUTOS), pd.DataFrame(columns=COLUNAS_HISTORICO))
+
+    def _assinatura(self):
+        """Identifica a versão do arquivo: muda a cada substituição (rename) ou alteração"""
+        try:
+            estado = os.stat(self.caminho)
+        except OSError as e:
+            raise Exception(f"Erro ao carregar dados: {e}")
+        return estado.st_ino, estado.st_size, estado.st_mtime_ns
+
+    def _dados_atuais(self):
+        """(assinatura, produtos, historico) do arquivo atual, relidos apenas se ele mudou"""
+        dados = self._dados
+        assinatura = self._assinatura()
+        if dados is not None and dados[0] == assinatura:
+            return dados
+        try:
+            with pd.ExcelFile(self.caminho) as planilha:
+                dados = (assinatura, pd.read_excel(planilha, sheet_name='Produtos'),
+                         pd.read_excel(planilha, sheet_name='Historico'))
+        except Exception as e:
+            raise Exception(f"Erro ao carregar dados: {e}")
+        self._dados = dados
+        return dados
+
+    def descartar_cache(self):
+        self._dados = None
+        with self._lock:
+            self._livro = None
+
+    # Abas fixadas por retrato(); None: cada leitura usa as abas em memória atuais
+    _abas = None
+
+    @contextmanager
+    def retrato(self):
+        """Leitor cujas leituras usam todas as mesmas abas em memória.
+
+        As gravações trocam as abas em memória por novas (e o arquivo por rename),
+        então o leitor continua vendo a versão que existia na abertura.
+        """
+        leitor = copy.copy(self)
+        leitor._abas = self._dados_atuais()[1:]
+        yield leitor
+
+    def _abas_atuais(self):
+        return self._abas if self._abas is not None else self._dados_atuais()[1:]
+
+    def carregar(self):
+        """Carrega dados das duas abas do Excel (da mesma versão do arquivo)"""
+        produtos, historico = self._abas_atuais()
+        return produtos.copy(), historico.copy()
+
+    def carregar_produtos(self):
+        """Carrega apenas a aba Produtos"""
+        return self._abas_atuais()[0].copy()
+
+    def carregar_historico(self, colunas=None, desde=None, ate=None):
+        """Carrega a aba Historico, opcionalmente apenas com as colunas informadas"""
+        historico = _filtrar_periodo(self._abas_atuais()[1], desde, ate)
+        return historico.copy() if colunas is None else historico[colunas].copy()
+
+    def carregar_pagina_historico(self, apos, quantidade, desde=None, ate=None):
+        """Página do histórico em memória, sem copiar a aba inteira"""
+        return _pagina(_filtrar_periodo(self._abas_atuais()[1], desde, ate), apos, quantidade)
+
+    def salvar(self, produtos, historico):
+        """Grava as duas abas do Excel (arquivo temporário + rename atômico)"""
+        def gravar(caminho_tmp):
+            with pd.ExcelWriter(caminho_tmp, engine='openpyxl') as writer:
+                produtos.to_excel(writer, sheet_name='Produtos', index=False)
+                historico.to_excel(writer, sheet_name='Historico', index=False)
+        self._substituir_arquivo(gravar)
+        self.descartar_cache()
+
+    def _substituir_arquivo(self, gravar):
+        """Chama gravar(caminho_tmp) e troca o arquivo pelo temporário com rename atômico"""
+        pasta = os.path.dirname(self.caminho) or '.'
+        descritor, caminho_tmp = tempfile.mkstemp(dir=pasta, suffix='.xlsx')
+        os.close(descritor)
+        try:
+            gravar(caminho_tmp)
+            os.replace(caminho_tmp, self.caminho)
+        except Exception as e:
+            if os.path.exists(caminho_tmp):
+                os.remove(caminho_tmp)
+            raise Exception(f"Erro ao salvar dados: {e}")
+
+    def _livro_atual(self):
+        """Planilha aberta para alteração, reaberta apenas se o arquivo mudou (chamar com o lock)"""
+        assinatura = self._assinatura()
+        if self._livro is None or self._livro[0] != assinatura:
+            try:
+                livro = openpyxl.load_workbook(self.caminho)
+            except Exception as e:
+                raise Exception(f"Erro ao carregar dados: {e}")
+            linhas = [
+                {linha[0].value: linha[0].row for linha in livro[aba].iter_rows(min_row=2, max_col=1)
+                 if linha[0].value is not None}
+                for aba in ('Produtos', 'Historico')
+            ]
+            # max_row percorre todas as células da aba: calculado só aqui, ao abrir a planilha
+            proximas = {aba: livro[aba].max_row + 1 for aba in ('Produtos', 'Historico')}
+            self._livro = (assinatura, livro, *linhas, proximas)
+        return self._livro
+
+    @staticmethod
+    def _acrescentar_linha(aba, proximas, valores):
+        """Grava os valores na próxima linha livre da aba e retorna o número da linha"""
+        linha = proximas[aba.title]
+        for coluna, valor in enumerate(valores, 1):
+            aba.cell(linha, coluna, valor)
+        proximas[aba.title] = linha + 1
+        return linha
+
+    def registrar(self, registros, produtos=None, historico=None):
+        """Aplica os registros às células afetadas e salva o arquivo (idempotente, como o SQLite)"""
+        with self._lock:
+            assinatura, livro, linhas_produtos, linhas_pedidos, proximas = self._livro_atual()
+            aba_produtos, aba_pedidos = livro['Produtos'], livro['Historico']
+            novos_produtos, novos_pedidos, estoque, cancelados = [], [], {}, []
+            try:
+                for registro in registros:
+                    operacao = registro['operacao']
+                    if operacao == 'produto':
+                        if registro['id_produto'] in linhas_produtos:
+                            continue
+                        linhas_produtos[registro['id_produto']] = self._acrescentar_linha(
+                            aba_produtos, proximas, [registro[coluna] for coluna in COLUNAS_PRODUTOS])
+                        novos_produtos.append(registro)
+                        continue
+                    if operacao == 'pedido':
+                        if registro['id_pedido'] in linhas_pedidos:
+                            continue
+                        linhas_pedidos[registro['id_pedido']] = self._acrescentar_linha(
+                            aba_pedidos, proximas, [registro[coluna] for coluna in COLUNAS_HISTORICO])
+                        novos_pedidos.append(registro)
+                        delta = -registro['quantidade_pedida']
+                    elif operacao == 'cancelamento':
+                        linha = linhas_pedidos.get(registro['id_pedido'])
+                        if linha is None or aba_pedidos.cell(linha, self._COLUNA_STATUS).value != 'ativo':
+                            continue
+                        aba_pedidos.cell(linha, self._COLUNA_STATUS).value = 'cancelado'
+                        cancelados.append(registro['id_pedido'])
+                        delta = registro['quantidade_pedida']
+                    else:
+                        raise ValueError(f"Operação desconhecida no registro: {operacao}")
+                    celula = aba_produtos.cell(linhas_produtos[registro['id_produto']], self._COLUNA_ESTOQUE)
+                    celula.value += delta
+                    estoque[registro['id_produto']] = celula.value
+
+                self._substituir_arquivo(livro.save)
+            except Exception:
+                # A planilha em memória pode ter alterações que não chegaram ao arquivo
+                self._livro = None
+                raise
+            nova_assinatura = self._assinatura()
+            self._livro = (nova_assinatura, livro, linhas_produtos, linhas_pedidos, proximas)
+
+            # Abas em memória: novas versões com as mesmas alterações, se estavam em dia
+            dados = self._dados
+            if dados is not None and dados[0] == assinatura:
+                self._dados = (nova_assinatura,
+                               *self._alterar_abas(dados[1], dados[2], novos_produtos, novos_pedidos,
+                                                   estoque, cancelados))
+
+    @staticmethod
+    def _acrescentar(aba, registros, colunas):
+        """Nova versão da aba com as linhas dos registros ao final"""
+        novas = pd.DataFrame(registros, columns=colunas)
+        return novas if aba.empty else pd.concat([aba, novas], ignore_index=True)
+
+    @classmethod
+    def _alterar_abas(cls, produtos, historico, novos_produtos, novos_pedidos, estoque, cancelados):
+        """Cópias das abas com as alterações gravadas (as originais podem estar em uso por retratos)"""
+        produtos = cls._acrescentar(produtos, novos_produtos, COLUNAS_PRODUTOS) if novos_produtos else produtos.copy()
+        if estoque:
+            alterados = produtos['id_produto'].isin(list(estoque))
+            produtos.loc[alterados, 'quantidade_estoque'] = produtos.loc[alterados, 'id_produto'].map(estoque)
+        if novos_pedidos:
+            historico = cls._acrescentar(historico, novos_pedidos, COLUNAS_HISTORICO)
+        elif cancelados:
+            historico = historico.copy()
+        if cancelados:
+            historico.loc[historico['id_pedido'].isin(cancelados), 'status'] = 'cancelado'
+        return produtos, historico
+
+
+class ArmazenamentoSQLite(Armazenamento):
+    """Banco SQLite com atualização por linha para estoque e histórico"""
+
+    grava_por_linha = True
+
+    def inicializar(self):
+        """Cria as tabelas e índices se não existirem"""
+        with self._conexao() as conexao:
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("""
+                CREATE TABLE IF NOT EXISTS produtos (
+                    id_produto INTEGER PRIMARY KEY,
+                    nome TEXT NOT NULL,
+                    descricao TEXT,
+                    preco_unitario REAL NOT NULL,
+                    quantidade_estoque INTEGER NOT NULL
+                )
+            """)
+            conexao.execute("""
+                CREATE TABLE IF NOT EXISTS historico (
+                    id_pedido INTEGER PRIMARY KEY,
+                    id_produto INTEGER NOT NULL,
+                    nome_produto TEXT,
+                    descricao_pedido TEXT,
+                    quantidade_pedida INTEGER NOT NULL,
+                    preco_unitario REAL,
+                    valor_total REAL,
+                    data_pedido TEXT,
+                    status TEXT NOT NULL
+                )
+            """)
+            conexao.execute("CREATE INDEX IF NOT EXISTS idx_historico_id_produto ON historico (id_produto)")
+            conexao.execute("CREATE INDEX IF NOT EXISTS idx_historico_data_pedido ON historico (data_pedido)")
+
+    # Conexão com a transação de leitura aberta por retrato()
+    _conexao_leitura = None
+
+    @contextmanager
+    def retrato(self):
+        """Leitor cujas consultas rodam numa única transação de leitura.
+
+        Em modo WAL, a transação vê a versão do banco do primeiro SELECT, e
+        gravações concorrentes não a bloqueiam.
+        """
+        with self._conexao() as conexao:
+            conexao.execute("BEGIN")
+            leitor = copy.copy(self)
+            leitor._conexao_leitura = conexao
+            yield leitor
+
+    @contextmanager
+    def _conexao(self):
+        """Abre uma conexão por operação, com commit ou rollback ao final"""
+        if self._conexao_leitura is not None:
+            yield self._conexao_leitura
+            return
+        try:
+            conexao = sqlite3.connect(self.caminho, timeout=30)
+        except sqlite3.Error as e:
+            raise Exception(f"Erro ao abrir banco de dados: {e}")
+        try:
+            yield conexao
+            conexao.commit()
+        except Exception:
+            conexao.rollback()
+            raise
+        finally:
+            conexao.close()
+
+    def carregar(self):
+        """Carrega as tabelas de produtos e histórico"""
+        try:
+            with self._conexao() as conexao:
+                produtos = pd.read_sql_query(
+                    f"SELECT {', '.join(COLUNAS_PRODUTOS)} FROM produtos ORDER BY id_produto", conexao
+                )
+                historico = pd.read_sql_query(
+                    f"SELECT {', '.join(COLUNAS_HISTORICO)} FROM historico ORDER BY id_pedido", conexao
+                )
+            return produtos, historico
+        except Exception as e:
+            raise Exception(f"Erro ao carregar dados: {e}")
+
+    def _consultar(self, consulta, parametros=()):
+        """Executa um SELECT e retorna o resultado como DataFrame"""
+        try:
+            with self._conexao() as conexao:
+                return pd.read_sql_query(consulta, conexao, params=parametros)
+        except Exception as e:
+            raise Exception(f"Erro ao carregar dados: {e}")
+
+    def carregar_produtos(self):
+        """Carrega apenas a tabela de produtos, sem ler o histórico"""
+        return self._consultar(f"SELECT {', '.join(COLUNAS_PRODUTOS)} FROM produtos ORDER BY id_produto")
+
+    def buscar_produto(self, id_produto):
+        """Busca o produto pela chave primária"""
+        return self._consultar(f"SELECT {', '.join(COLUNAS_PRODUTOS)} FROM produtos WHERE id_produto = ?",
+                               (id_produto,))
+
+    def _consultar_historico(self, colunas, condicoes, parametros, desde=None, ate=None, limite=None):
+        """SELECT no histórico com as condições, o período e o limite informados"""
+        condicoes, parametros = list(condicoes), list(parametros)
+        if desde is not None:
+            condicoes.append("data_pedido >= ?")
+            parametros.append(desde)
+        if ate is not None:
+            condicoes.append("data_pedido <= ?")
+            parametros.append(ate)
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+        consulta = f"SELECT {', '.join(colunas)} FROM historico {where} ORDER BY id_pedido"
+        if limite is not None:
+            consulta += " LIMIT ?"
+            parametros.append(limite)
+        return self._consultar(consulta, parametros)
+
+    def carregar_historico(self, colunas=None, desde=None, ate=None):
+        """Carrega o histórico do período lendo apenas as colunas informadas"""
+        return self._consultar_historico(colunas or COLUNAS_HISTORICO, [], [], desde, ate)
+
+    def carregar_pagina_historico(self, apos, quantidade, desde=None, ate=None):
+        """Página pela chave primária: lê só as linhas da página"""
+        return self._consultar_historico(COLUNAS_HISTORICO, ["id_pedido > ?"], [apos], desde, ate, quantidade)
+
+    def buscar_pedido(self, id_pedido):
+        """Busca o pedido pela chave primária"""
+        return self._consultar(f"SELECT {', '.join(COLUNAS_HISTORICO)} FROM historico WHERE id_pedido = ?",
+                               (id_pedido,))
+
+    def proximo_id_pedido(self):
+        """Próximo id_pedido livre"""
+        with self._conexao() as conexao:
+            return conexao.execute("SELECT COALESCE(MAX(id_pedido), 0) + 1 FROM historico").fetchone()[0]
+
+    def salvar(self, produtos, historico):
+        """Substitui o conteúdo das tabelas numa única transação"""
+        try:
+            with self._conexao() as conexao:
+                conexao.execute("DELETE FROM produtos")
+                conexao.execute("DELETE FROM historico")
+                conexao.executemany(
+                    f"INSERT INTO produtos ({', '.join(COLUNAS_PRODUTOS)}) VALUES (?, ?, ?, ?, ?)",
+                    self._linhas(produtos, COLUNAS_PRODUTOS)
+                )
+                conexao.executemany(
+                    f"INSERT INTO historico ({', '.join(COLUNAS_HISTORICO)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    self._linhas(historico, COLUNAS_HISTORICO)
+                )
+        except Exception as e:
+            raise Exception(f"Erro ao salvar dados: {e}")
+
+    @staticmethod
+    def _linhas(df, colunas):
+        """Converte um DataFrame em linhas com tipos nativos do Python"""
+        df = df[colunas]
+        return df.astype(object).where(df.notna(), None).values.tolist()
+
+    def registrar(self, registros, produtos=None, historico=None):
+        """Aplica os registros com INSERT/UPDATE por linha numa única transação"""
+        try:
+            with self._conexao() as conexao:
+                for registro in registros:
+                    self._aplicar(conexao, registro)
+        except Exception as e:
+            raise Exception(f"Erro ao salvar dados: {e}")
+
+    @staticmethod
+    def _aplicar(conexao, registro):
+        """Executa um registro de operação (idempotente, como EstadoPedidos.aplicar)"""
+        operacao = registro['operacao']
+
+        if operacao == 'produto':
+            conexao.execute(
+                f"INSERT OR IGNORE INTO produtos ({', '.join(COLUNAS_PRODUTOS)}) VALUES (?, ?, ?, ?, ?)",
+                [registro[coluna] for coluna in COLUNAS_PRODUTOS]
+            )
+
+        elif operacao == 'pedido':
+            cursor = conexao.execute(
+                f"INSERT OR IGNORE INTO historico ({', '.join(COLUNAS_HISTORICO)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [registro[coluna] for coluna in COLUNAS_HISTORICO]
+            )
+            if cursor.rowcount:
+                conexao.execute(
+                    "UPDATE produtos SET quantidade_estoque = quantidade_estoque - ? WHERE id_produto = ?",
+                    (registro['quantidade_pedida'], registro['id_produto'])
+                )
+
+        elif operacao == 'cancelamento':
+            cursor = conexao.execute(
+                "UPDATE historico SET status = 'cancelado' WHERE id_pedido = ? AND status = 'ativo'",
+                (registro['id_pedido'],)
+            )
+            if cursor.rowcount:
+                conexao.execute(
+                    "UPDATE produtos SET quantidade_estoque = quantidade_estoque + ? WHERE id_produto = ?",
+                    (registro['quantidade_pedida'], registro['id_produto'])
+                )
+
+        else:
+            raise ValueError(f"Operação desconhecida no registro: {operacao}")
+
+
+def _pyarrow():
+    """Importa o pyarrow, dependência opcional usada apenas pelo ArmazenamentoParquet"""
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("ArmazenamentoParquet requer o pacote pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+class ArmazenamentoParquet(Armazenamento):
+    """Produtos num arquivo Parquet pequeno e histórico como dataset Parquet append-only,
+    particionado por mês de data_pedido.
+
+    Estrutura do diretório `caminho`:
+        produtos.parquet                          regravado a cada alteração (catálogo pequeno)
+        historico/mes=AAAA-MM/parte-*.parquet     pedidos novos, um arquivo por gravação
+        cancelamentos/mes=AAAA-MM/parte-*.parquet id_pedido dos pedidos cancelados no mês do pedido
+
+    Os arquivos de histórico nunca são reescritos; o status é resolvido na leitura
+    a partir dos cancelamentos. Novos pedidos só tocam a partição do mês corrente,
+    e consultas por período abrem apenas as partições do intervalo. compactar()
+    consolida as partes de cada mês num único arquivo.
+
+    A troca de produtos.parquet é o ponto de confirmação de cada gravação: os
+    metadados do arquivo listam as partes gravadas junto com ele (ver registrar).
+    """
+
+    grava_por_linha = True
+
+    def __init__(self, caminho):
+        super().__init__(caminho)
+        self.caminho_produtos = os.path.join(caminho, 'produtos.parquet')
+        self.pasta_historico = os.path.join(caminho, 'historico')
+        self.pasta_cancelamentos = os.path.join(caminho, 'cancelamentos')
+
+        # Índice id_pedido -> mês da partição e IDs cancelados, montados na primeira
+        # gravação ou busca; também tornam registrar() idempotente sem reler o dataset
+        self._mes_do_pedido = None
+        self._ids_cancelados = None
+
+    @staticmethod
+    def _esquema_produtos():
+        pa = _pyarrow()
+        return pa.schema([
+            ('id_produto', pa.int64()), ('nome', pa.string()), ('descricao', pa.string()),
+            ('preco_unitario', pa.float64()), ('quantidade_estoque', pa.int64())
+        ])
+
+    @staticmethod
+    def _esquema_historico():
+        pa = _pyarrow()
+        return pa.schema([
+            ('id_pedido', pa.int64()), ('id_produto', pa.int64()), ('nome_produto', pa.string()),
+            ('descricao_pedido', pa.string()), ('quantidade_pedida', pa.int64()),
+            ('preco_unitario', pa.float64()), ('valor_total', pa.float64()),
+            ('data_pedido', pa.string()), ('status', pa.string())
+        ])
+
+    @staticmethod
+    def _esquema_cancelamentos():
+        pa = _pyarrow()
+        return pa.schema([('id_pedido', pa.int64())])
+
+    @staticmethod
+    def _mes(data_pedido):
+        """Partição (AAAA-MM) de uma data_pedido"""
+        return str(data_pedido)[:7]
+
+    def inicializar(self):
+        """Cria a estrutura de diretórios e o arquivo de produtos vazio"""
+        os.makedirs(self.pasta_historico, exist_ok=True)
+        os.makedirs(self.pasta_cancelamentos, exist_ok=True)
+        if not os.path.exists(self.caminho_produtos):
+            self._gravar_tabela(self.caminho_produtos, [], self._esquema_produtos())
+        self._concluir_gravacao()
+
+    @staticmethod
+    def _temporario(caminho):
+        """Arquivo temporário de um caminho; o prefixo '.' faz a leitura do dataset ignorá-lo"""
+        pasta, nome = os.path.split(caminho)
+        return os.path.join(pasta, f".{nome}.tmp")
+
+    @classmethod
+    def _preparar_tabela(cls, caminho, linhas, esquema):
+        """Grava linhas (dicts) no arquivo temporário de caminho e retorna o caminho dele"""
+        pa = _pyarrow()
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        caminho_tmp = cls._temporario(caminho)
+        try:
+            pa.parquet.write_table(pa.Table.from_pylist(linhas, schema=esquema), caminho_tmp)
+        except Exception:
+            if os.path.exists(caminho_tmp):
+                os.remove(caminho_tmp)
+            raise
+        return caminho_tmp
+
+    @classmethod
+    def _gravar_tabela(cls, caminho, linhas, esquema):
+        """Grava linhas (dicts) num arquivo Parquet via arquivo temporário + rename"""
+        os.replace(cls._preparar_tabela(caminho, linhas, esquema), caminho)
+
+    @staticmethod
+    def _caminho_parte(pasta, mes):
+        """Caminho de uma nova parte imutável na partição do mês"""
+        return os.path.join(pasta, f"mes={mes}", f"parte-{uuid.uuid4().hex}.parquet")
+
+    def _concluir_parte(self, caminho):
+        """Move a parte temporária para o dataset (tolera quem já a moveu)"""
+        try:
+            os.replace(self._temporario(caminho), caminho)
+        except FileNotFoundError:
+            if not os.path.exists(caminho):
+                raise
+
+    def _concluir_gravacao(self):
+        """Move para o dataset as partes da última gravação confirmada que ainda não foram movidas.
+
+        Uma queda entre a troca dos produtos e a das partes deixa as partes como
+        temporárias; como os produtos já as listam, elas são concluídas aqui.
+        """
+        metadados = _pyarrow().parquet.read_schema(self.caminho_produtos).metadata or {}
+        for relativo in json.loads(metadados.get(b'partes', b'[]')):
+            caminho = os.path.join(self.caminho, relativo)
+            if not os.path.exists(caminho):
+                self._concluir_parte(caminho)
+
+    def _acrescentar_parte(self, pasta, mes, linhas, esquema):
+        """Grava uma nova parte imutável na partição do mês"""
+        self._gravar_tabela(self._caminho_parte(pasta, mes), linhas, esquema)
+
+    @staticmethod
+    def _meses(pasta):
+        """Meses com partição no dataset, em ordem"""
+        return sorted(
+            nome[len('mes='):] for nome in os.listdir(pasta)
+            if nome.startswith('mes=') and os.path.isdir(os.path.join(pasta, nome))
+        )
+
+    @staticmethod
+    def _arquivos(pasta, meses):
+        """Arquivos de dados das partições informadas"""
+        arquivos = []
+        for mes in meses:
+            pasta_mes = os.path.join(pasta, f"mes={mes}")
+            if os.path.isdir(pasta_mes):
+                arquivos.extend(
+                    os.path.join(pasta_mes, nome) for nome in sorted(os.listdir(pasta_mes))
+                    if not nome.startswith('.')
+                )
+        return arquivos
+
+    def _ler(self, pasta, meses, esquema, colunas, filtro=None):
+        """Lê as colunas informadas apenas das partições dos meses informados.
+
+        `filtro` (expressão do pyarrow.dataset) é aplicado na leitura: arquivos e row
+        groups cujas estatísticas o excluem não são lidos.
+        """
+        pa = _pyarrow()
+        dataset = pa.dataset.dataset(self._arquivos(pasta, meses), format='parquet', schema=esquema)
+        return dataset.to_table(columns=colunas, filter=filtro).to_pandas()
+
+    def _meses_no_periodo(self, desde=None, ate=None):
+        """Poda de partições: meses do histórico que podem ter pedidos no período"""
+        return [
+            mes for mes in self._meses(self.pasta_historico)
+            if (desde is None or mes >= self._mes(desde)) and (ate is None or mes <= self._mes(ate))
+        ]
+
+    def _carregar_indice(self):
+        """Monta o índice id_pedido -> mês lendo apenas a coluna id_pedido de cada partição"""
+        if self._mes_do_pedido is not None:
+            return
+        mes_do_pedido = {}
+        for mes in self._meses(self.pasta_historico):
+            ids = self._ler(self.pasta_historico, [mes], self._esquema_historico(), ['id_pedido'])['id_pedido']
+            mes_do_pedido.update(dict.fromkeys(ids.tolist(), mes))
+        cancelados = self._ler(self.pasta_cancelamentos, self._meses(self.pasta_cancelamentos),
+                               self._esquema_cancelamentos(), ['id_pedido'])
+        self._mes_do_pedido = mes_do_pedido
+        self._ids_cancelados = set(cancelados['id_pedido'].tolist())
+
+    def carregar_produtos(self):
+        """Carrega o arquivo de produtos"""
+        try:
+            return _pyarrow().parquet.read_table(self.caminho_produtos).to_pandas()
+        except Exception as e:
+            raise Exception(f"Erro ao carregar dados: {e}")
+
+    def _carregar_meses(self, meses, colunas, desde=None, ate=None, filtro=None):
+        """Lê as partições informadas com projeção de colunas e status resolvido"""
+        lidas = list(colunas)
+        for coluna in ('id_pedido', 'data_pedido'):
+            if coluna not in lidas:
+                lidas.append(coluna)
+        historico = self._ler(self.pasta_historico, meses, self._esquema_historico(), lidas, filtro)
+        historico = _filtrar_periodo(historico, desde, ate)
+        if 'status' in colunas:
+            cancelados = self._ler(self.pasta_cancelamentos, meses, self._esquema_cancelamentos(), ['id_pedido'])
+            historico.loc[historico['id_pedido'].isin(cancelados['id_pedido']), 'status'] = 'cancelado'
+        return historico.sort_values('id_pedido', ignore_index=True)[colunas]
+
+    def carregar_historico(self, colunas=None, desde=None, ate=None):
+        """Lê do histórico só as colunas pedidas e só as partições do período"""
+        try:
+            return self._carregar_meses(self._meses_no_periodo(desde, ate), colunas or COLUNAS_HISTORICO, desde, ate)
+        except Exception as e:
+            raise Exception(f"Erro ao carregar dados: {e}")
+
+    def carregar_pagina_historico(self, apos, quantidade, desde=None, ate=None):
+        """Página por chave com poda de partições e de row groups.
+
+        Escolhe os IDs lendo só id_pedido e data_pedido acima do cursor (filtro aplicado
+        na leitura) e lê as demais colunas apenas dos meses desses IDs.
+        """
+        try:
+            campo = _pyarrow().dataset.field('id_pedido')
+            chaves = self._ler(self.pasta_historico, self._meses_no_periodo(desde, ate), self._esquema_historico(),
+                               ['id_pedido', 'data_pedido'], campo > apos)
+            chaves = _pagina(_filtrar_periodo(chaves, desde, ate), apos, quantidade)
+            if chaves.empty:
+                return pd.DataFrame(columns=COLUNAS_HISTORICO)
+            meses = sorted({self._mes(data) for data in chaves['data_pedido']})
+            return self._carregar_meses(meses, COLUNAS_HISTORICO,
+                                        filtro=campo.isin(chaves['id_pedido'].tolist()))
+        except Exception as e:
+            raise Exception(f"Erro ao carregar dados: {e}")
+
+    def descartar_cache(self):
+        """Descarta os índices de pedidos, que serão remontados na próxima gravação ou busca"""
+        self._mes_do_pedido = self._ids_cancelados = None
+
+    def buscar_pedido(self, id_pedido):
+        """Localiza a partição do pedido pelo índice e lê apenas ela"""
+        try:
+            self._carregar_indice()
+            mes = self._mes_do_pedido.get(id_pedido)
+            if mes is None:
+                return pd.DataFrame(columns=COLUNAS_HISTORICO)
+            historico = self._carregar_meses([mes], COLUNAS_HISTORICO)
+            return historico[historico['id_pedido'] == id_pedido]
+        except Exception as e:
+            raise Exception(f"Erro ao carregar dados: {e}")
+
+    def proximo_id_pedido(self):
+        """Próximo id_pedido, a partir do índice"""
+        self._carregar_indice()
+        return max(self._mes_do_pedido, default=0) + 1
+
+    def carregar(self):
+        """Carrega produtos e histórico completo"""
+        return self.carregar_produtos(), self.carregar_historico()
+
+    def salvar(self, produtos, historico):
+        """Substitui todo o conteúdo: produtos e um arquivo de histórico por mês"""
+        try:
+            self.inicializar()
+            partes_antigas = self._arquivos(self.pasta_historico, self._meses(self.pasta_historico)) + \
+                self._arquivos(self.pasta_cancelamentos, self._meses(self.pasta_cancelamentos))
+            self._gravar_tabela(self.caminho_produtos, linhas_do_dataframe(produtos, COLUNAS_PRODUTOS),
+                                self._esquema_produtos())
+            linhas = linhas_do_dataframe(historico, COLUNAS_HISTORICO)
+            for mes in sorted({self._mes(linha['data_pedido']) for linha in linhas}):
+                self._acrescentar_parte(self.pasta_historico, mes,
+                                        [linha for linha in linhas if self._mes(linha['data_pedido']) == mes],
+                                        self._esquema_historico())
+            for caminho in partes_antigas:
+                os.remove(caminho)
+            self._mes_do_pedido = self._ids_cancelados = None
+        except Exception as e:
+            raise Exception(f"Erro ao salvar dados: {e}")
+
+    def compactar(self):
+        """Consolida as partes de histórico e os cancelamentos num arquivo por mês"""
+        self.salvar(*self.carregar())
+
+    def registrar(self, registros, produtos=None, historico=None):
+        """Acrescenta partes novas às partições e regrava apenas o arquivo de produtos.
+
+        Pedidos vão para a partição do mês de data_pedido; cancelamentos vão para a
+        partição do pedido, localizada pelo índice. As partes novas são gravadas como
+        temporárias (ignoradas na leitura), e o arquivo de produtos, com o estoque
+        novo, é gravado listando-as nos metadados. A troca desse arquivo confirma a
+        gravação inteira: se algo falhar antes dela, as temporárias são removidas e
+        nada muda; depois dela, as partes são movidas para o dataset, e uma queda no
+        meio é concluída na próxima abertura ou gravação (_concluir_gravacao). Assim
+        a baixa do estoque e o pedido aparecem juntos, e reaplicar o registro não
+        baixa o estoque de novo.
+        """
+        try:
+            self._concluir_gravacao()
+            self._carregar_indice()
+            produtos = {
+                linha['id_produto']: linha
+                for linha in linhas_do_dataframe(self.carregar_produtos(), COLUNAS_PRODUTOS)
+            }
+            pedidos, cancelamentos = {}, {}
+            produtos_alterados = False
+
+            for registro in registros:
+                operacao = registro['operacao']
+                if operacao == 'produto':
+                    if registro['id_produto'] not in produtos:
+                        produtos[registro['id_produto']] = {coluna: registro[coluna] for coluna in COLUNAS_PRODUTOS}
+                        produtos_alterados = True
+                elif operacao == 'pedido':
+                    if registro['id_pedido'] not in self._mes_do_pedido:
+                        mes = self._mes(registro['data_pedido'])
+                        pedidos.setdefault(mes, []).append({coluna: registro[coluna] for coluna in COLUNAS_HISTORICO})
+                        self._mes_do_pedido[registro['id_pedido']] = mes
+                        produtos[registro['id_produto']]['quantidade_estoque'] -= registro['quantidade_pedida']
+                        produtos_alterados = True
+                elif operacao == 'cancelamento':
+                    if registro['id_pedido'] not in self._ids_cancelados:
+                        mes = self._mes_do_pedido[registro['id_pedido']]
+                        cancelamentos.setdefault(mes, []).append({'id_pedido': registro['id_pedido']})
+                        self._ids_cancelados.add(registro['id_pedido'])
+                        produtos[registro['id_produto']]['quantidade_estoque'] += registro['quantidade_pedida']
+                        produtos_alterados = True
+                else:
+                    raise ValueError(f"Operação desconhecida no registro: {operacao}")
+
+            partes = []  # caminhos definitivos das partes novas
+            try:
+                for pasta, grupos, esquema in ((self.pasta_historico, pedidos, self._esquema_historico()),
+                                               (self.pasta_cancelamentos, cancelamentos,
+                                                self._esquema_cancelamentos())):
+                    for mes, linhas in grupos.items():
+                        caminho = self._caminho_parte(pasta, mes)
+                        self._preparar_tabela(caminho, linhas, esquema)
+                        partes.append(caminho)
+                if produtos_alterados:
+                    manifesto = json.dumps([os.path.relpath(caminho, self.caminho) for caminho in partes])
+                    self._gravar_tabela(self.caminho_produtos, list(produtos.values()),
+                                        self._esquema_produtos().with_metadata({'partes': manifesto}))
+            except Exception:
+                for caminho in partes:
+                    os.remove(self._temporario(caminho))
+                raise
+            for caminho in partes:
+                self._concluir_parte(caminho)
+        except Exception as e:
+            self._mes_do_pedido = self._ids_cancelados = None
+            raise Exception(f"Erro ao salvar dados: {e}")
+
+
+def migrar(origem, destino):
+    """Copia todo o conteúdo de um armazenamento para outro (ex.: Excel -> SQLite)"""
+    destino.inicializar()
+    destino.salvar(*origem.carregar())
@@ -0,0 +1,212 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+import pandas as pd
+from main import SistemaPedidos, MODO_SINCRONO, MODO_RESIDENTE
+from armazenamento import ArmazenamentoExcel, ArmazenamentoSQLite, ArmazenamentoParquet
+
+MECANISMOS = {
+    'excel': (ArmazenamentoExcel, 'sistema_pedidos.xlsx'),
+    'sqlite': (ArmazenamentoSQLite, 'sistema_pedidos.db'),
+    'parquet': (ArmazenamentoParquet, 'sistema_pedidos'),
+}
+
+OPERACOES = ['fazer_pedido', 'cancelar_pedido', 'listar_estoque', 'ver_historico', 'obter_estatisticas']
+
+
+def percentil(valores, p):
+    """Percentil pelo método do posto mais próximo (valores já ordenados)"""
+    if not valores:
+        return None
+    return valores[max(0, math.ceil(p / 100 * len(valores)) - 1)]
+
+
+def semear(armazenamento, tamanho):
+    """Grava um catálogo e um histórico de `tamanho` linhas cada, de forma vetorizada"""
+    ids = pd.RangeIndex(1, tamanho + 1)
+    produtos = pd.DataFrame({
+        'id_produto': ids,
+        'nome': [f"Produto {i}" for i in ids],
+        'descricao': "",
+        'preco_unitario': 10.0 + (ids % 100),
+        # Estoque folgado para que os pedidos do benchmark não falhem por falta de produto
+        'quantidade_estoque': 1_000_000
+    })
+    inicio = datetime.now() - timedelta(days=365)
+    id_produto = (ids % tamanho) + 1
+    historico = pd.DataFrame({
+        'id_pedido': ids,
+        'id_produto': id_produto,
+        'nome_produto': [f"Produto {i}" for i in id_produto],
+        'descricao_pedido': "",
+        'quantidade_pedida': 1,
+        'preco_unitario': 10.0 + (id_produto % 100),
+        'valor_total': 10.0 + (id_produto % 100),
+        'data_pedido': [(inicio + timedelta(seconds=int(i) * 31_536_000 // tamanho)).strftime('%Y-%m-%d %H:%M:%S')
+                        for i in ids],
+        'status': 'ativo'
+    })
+    armazenamento.salvar(produtos, historico)
+
+
+def medir(sistema, operacao, threads, operacoes, tamanho, pedidos_para_cancelar):
+    """Executa `operacoes` chamadas divididas entre `threads` e retorna as métricas"""
+    latencias = []
+    falhas = [0]
+    lock = threading.Lock()
+    por_thread = [operacoes // threads + (1 if i < operacoes % threads else 0) for i in range(threads)]
+
+    def chamar():
+        if operacao == 'fazer_pedido':
+            return sistema.fazer_pedido(random.randint(1, tamanho), 1)[0]
+        if operacao == 'cancelar_pedido':
+            with lock:
+                id_pedido = next(pedidos_para_cancelar)
+            return sistema.cancelar_pedido(id_pedido)[0]
+        if operacao == 'ver_historico':
+            sistema.ver_historico()
+        else:
+            getattr(sistema, operacao)()
+        return True
+
+    def trabalhar(quantidade):
+        medidas, erros = [], 0
+        for _ in range(quantidade):
+            inicio = time.perf_counter()
+            try:
+                sucesso = chamar()
+            except Exception:
+                sucesso = False
+            medidas.append(time.perf_counter() - inicio)
+            erros += not sucesso
+        with lock:
+            latencias.extend(medidas)
+            falhas[0] += erros
+
+    trabalhadores = [threading.Thread(target=trabalhar, args=(quantidade,)) for quantidade in por_thread]
+    # listar_estoque e ver_historico imprimem tudo; a saída é descartada durante a medição
+    with contextlib.redirect_stdout(io.StringIO()):
+        inicio = time.perf_counter()
+        for trabalhador in trabalhadores:
+            trabalhador.start()
+        for trabalhador in trabalhadores:
+            trabalhador.join()
+        duracao = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        'operacao': operacao,
+        'threads': threads,
+        'operacoes': len(latencias),
+        'falhas': falhas[0],
+        'duracao_s': duracao,
+        'vazao_ops_s': len(latencias) / duracao if duracao > 0 else None,
+        'media_ms': 1000 * sum(latencias) / len(latencias) if latencias else None,
+        'p50_ms': 1000 * percentil(latencias, 50) if latencias else None,
+        'p95_ms': 1000 * percentil(latencias, 95) if latencias else None,
+        'p99_ms': 1000 * percentil(latencias, 99) if latencias else None,
+    }
+
+
+def executar(tamanhos, threads, operacoes, mecanismo='excel', modo=MODO_SINCRONO, pasta='dados_benchmark',
+             selecionadas=None):
+    """Roda o benchmark para cada tamanho, operação e número de threads; retorna o relatório"""
+    classe, nome_arquivo = MECANISMOS[mecanismo]
+    resultados = []
+
+    for tamanho in tamanhos:
+        if os.path.exists(pasta):
+            shutil.rmtree(pasta)
+        armazenamento = classe(os.path.join(pasta, nome_arquivo))
+        armazenamento.inicializar()
+        inicio = time.perf_counter()
+        semear(armazenamento, tamanho)
+        semeadura = time.perf_counter() - inicio
+
+        sistema = SistemaPedidos(armazenamento=armazenamento, modo=modo)
+        # Cada cancelamento usa um pedido semeado diferente, ainda ativo
+        ids = list(range(1, tamanho + 1))
+        random.shuffle(ids)
+        pedidos_para_cancelar = itertools.chain(ids, itertools.count(tamanho + 1))
+        try:
+            for operacao in selecionadas or OPERACOES:
+                for quantidade_threads in threads:
+                    resultado = medir(sistema, operacao, quantidade_threads, operacoes, tamanho,
+                                      pedidos_para_cancelar)
+                    resultado.update({'tamanho': tamanho, 'semeadura_s': semeadura})
+                    resultados.append(resultado)
+                    print(f"{tamanho:>9} linhas | {operacao:<18} | {quantidade_threads:>3} threads | "
+                          f"p50 {resultado['p50_ms']:.2f} ms | p95 {resultado['p95_ms']:.2f} ms | "
+                          f"p99 {resultado['p99_ms']:.2f} ms | {resultado['vazao_ops_s']:.1f} ops/s")
+        finally:
+            sistema.fechar()
+            shutil.rmtree(pasta, ignore_errors=True)
+
+    return {
+        'ambiente': {
+            'data': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'plataforma': platform.platform(),
+        },
+        'configuracao': {
+            'tamanhos': list(tamanhos), 'threads': list(threads), 'operacoes': operacoes,
+            'mecanismo': mecanismo, 'modo': modo,
+        },
+        'resultados': resultados,
+    }
+
+
+def comparar(atual, anterior):
+    """Imprime a variação de p95 e vazão em relação a uma execução anterior"""
+    chave = lambda resultado: (resultado['tamanho'], resultado['operacao'], resultado['threads'])
+    base = {chave(resultado): resultado for resultado in anterior['resultados']}
+    print("\nCOMPARAÇÃO COM A EXECUÇÃO ANTERIOR (p95 e vazão; positivo = piorou)")
+    for resultado in atual['resultados']:
+        antigo = base.get(chave(resultado))
+        if antigo is None or not antigo['p95_ms'] or not antigo['vazao_ops_s']:
+            continue
+        variacao_p95 = 100 * (resultado['p95_ms'] / antigo['p95_ms'] - 1)
+        variacao_vazao = 100 * (1 - resultado['vazao_ops_s'] / antigo['vazao_ops_s'])
+        print(f"{resultado['tamanho']:>9} | {resultado['operacao']:<18} | {resultado['threads']:>3} threads | "
+              f"p95 {variacao_p95:+.1f}% | vazão {variacao_vazao:+.1f}%")
+
+
+def main():
+    """Mede latência e vazão das operações do SistemaPedidos e grava o resultado em JSON"""
+    parser = argparse.ArgumentParser(description="Benchmark das operações do sistema de pedidos")
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=[1_000],
+                        help="Linhas de catálogo e de histórico semeadas (ex.: 1000 100000 1000000)")
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 16], help="Números de threads")
+    parser.add_argument('--operacoes', type=int, default=50, help="Chamadas por operação e número de threads")
+    parser.add_argument('--apenas', choices=OPERACOES, nargs='+', help="Medir apenas estas operações")
+    parser.add_argument('--mecanismo', choices=MECANISMOS, default='excel', help="Armazenamento (padrão: excel)")
+    parser.add_argument('--modo', choices=[MODO_SINCRONO, MODO_RESIDENTE], default=MODO_SINCRONO)
+    parser.add_argument('--pasta', default='dados_benchmark', help="Pasta temporária dos dados semeados")
+    parser.add_argument('--saida', default='benchmark.json', help="Arquivo JSON com os resultados")
+    parser.add_argument('--comparar', help="JSON de uma execução anterior para comparação")
+    args = parser.parse_args()
+
+    relatorio = executar(args.tamanhos, args.threads, args.operacoes, args.mecanismo, args.modo,
+                         args.pasta, args.apenas)
+    with open(args.saida, 'w', encoding='utf-8') as arquivo:
+        json.dump(relatorio, arquivo, ensure_ascii=False, indent=2)
+    print(f"\nResultados gravados em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            comparar(relatorio, json.load(arquivo))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import threading
+from collections import OrderedDict
+
+
+class CacheLeituras:
+    """Resultados de leituras por chave, válidos enquanto a versão dos dados não mudar.
+
+    A chave inclui os parâmetros da leitura (ex.: filtros do histórico). O cache é
+    limitado em chaves (`capacidade`) e no total de linhas guardadas (`max_linhas`,
+    informadas por quem chama): acima de qualquer um dos limites, a chave usada há
+    mais tempo é descartada (LRU), e um resultado com mais de `max_linhas` linhas não
+    é guardado. Os resultados são compartilhados entre chamadas e não devem ser
+    alterados por quem os recebe.
+    """
+
+    def __init__(self, capacidade=32, max_linhas=100_000):
+        self.capacidade = max(1, capacidade)
+        self.max_linhas = max_linhas
+        self._lock = threading.Lock()
+        self._itens = OrderedDict()  # chave -> (versão, resultado, linhas)
+        self._linhas = 0
+        self.acertos = 0
+        self.faltas = 0
+
+    def obter(self, chave, versao, calcular, linhas=None):
+        """Resultado em cache para (chave, versao), ou calcular() guardado para os próximos.
+
+        `versao` deve ser lida antes de calcular: se os dados mudarem no meio do
+        cálculo, o resultado fica sob a versão antiga e a próxima leitura o refaz.
+        `linhas(resultado)` informa o tamanho do resultado (1 se omitido).
+        """
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None and item[0] == versao:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return item[1]
+            self.faltas += 1
+
+        # Calculado fora do lock: leituras de outras chaves não esperam
+        resultado = calcular()
+        tamanho = linhas(resultado) if linhas is not None else 1
+        with self._lock:
+            self._descartar(chave)
+            if tamanho > self.max_linhas:
+                return resultado
+            self._itens[chave] = (versao, resultado, tamanho)
+            self._linhas += tamanho
+            while len(self._itens) > self.capacidade or self._linhas > self.max_linhas:
+                self._descartar(next(iter(self._itens)))
+        return resultado
+
+    def _descartar(self, chave):
+        """Remove a chave, se houver (chamar com o lock)"""
+        item = self._itens.pop(chave, None)
+        if item is not None:
+            self._linhas -= item[2]
+
+    @property
+    def linhas(self):
+        """Total de linhas guardadas"""
+        with self._lock:
+            return self._linhas
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._linhas = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._itens)
@@ -0,0 +1,93 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem fcntl, o lock vale apenas entre threads do processo
+    fcntl = None
+
+
+class ConflitoVersao(Exception):
+    """Os dados foram alterados por outro processo entre a leitura e a gravação"""
+
+
+class CoordenacaoProcessos:
+    """Coordenação entre processos que usam o mesmo armazenamento.
+
+    Arquivos ao lado dos dados:
+        <base>.lock          travado com fcntl.flock durante cada gravação
+        <base>.versao        versão dos dados, incrementada a cada gravação
+        <base>.estatisticas  contadores de estatísticas e a versão a que correspondem
+
+    Leitores comparam a versão para saber se precisam recarregar; escritores
+    conferem, já com o lock, se a versão ainda é a que leram.
+    """
+
+    def __init__(self, caminho_base):
+        self.caminho_lock = caminho_base + '.lock'
+        self.caminho_versao = caminho_base + '.versao'
+        self.caminho_estatisticas = caminho_base + '.estatisticas'
+        self._local = threading.local()
+        # Sem fcntl, um lock comum mantém ao menos a exclusão entre threads
+        self._lock_local = threading.Lock()
+
+    @contextmanager
+    def travar(self):
+        """Lock exclusivo entre processos (reentrante na mesma thread)"""
+        if getattr(self._local, 'travado', False):
+            yield
+            return
+        if fcntl is None:
+            with self._lock_local:
+                self._local.travado = True
+                try:
+                    yield
+                finally:
+                    self._local.travado = False
+            return
+        # Cada abertura é uma descrição de arquivo própria: threads do mesmo processo
+        # também se excluem. Fechar o arquivo libera o lock.
+        with open(self.caminho_lock, 'a') as arquivo:
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX)
+            self._local.travado = True
+            try:
+                yield
+            finally:
+                self._local.travado = False
+
+    def versao(self):
+        """Versão atual dos dados (0 se nunca houve gravação coordenada)"""
+        try:
+            with open(self.caminho_versao, encoding='utf-8') as arquivo:
+                return int(arquivo.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def avancar_versao(self):
+        """Incrementa a versão dos dados (chamar com o lock) e retorna a nova versão"""
+        nova = self.versao() + 1
+        self._substituir(self.caminho_versao, str(nova))
+        return nova
+
+    @staticmethod
+    def _substituir(caminho, conteudo):
+        """Grava o conteúdo num arquivo temporário e o troca pelo arquivo por rename"""
+        caminho_tmp = caminho + '.tmp'
+        with open(caminho_tmp, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(conteudo)
+        os.replace(caminho_tmp, caminho)
+
+    def estatisticas(self, versao):
+        """Contadores gravados para a versão informada, ou None se não houver ou forem de outra versão"""
+        try:
+            with open(self.caminho_estatisticas, encoding='utf-8') as arquivo:
+                gravadas = json.load(arquivo)
+        except (FileNotFoundError, ValueError):
+            return None
+        return gravadas['contadores'] if gravadas.get('versao') == versao else None
+
+    def gravar_estatisticas(self, versao, contadores):
+        """Grava os contadores correspondentes à versão dos dados (chamar com o lock)"""
+        self._substituir(self.caminho_estatisticas, json.dumps({'versao': versao, 'contadores': contadores}))
@@ -0,0 +1,394 @@
+from importacao import ModuloAdiado
+import bisect
+import threading
+import math
+from armazenamento import COLUNAS_PRODUTOS, COLUNAS_HISTORICO
+from modelos import Produto, Pedido, IndiceNomes, produtos_do_dataframe, pedidos_do_dataframe
+
+pd = ModuloAdiado('pandas')
+
+
+# Contadores de obter_estatisticas mantidos incrementalmente
+CONTADORES = [
+    'total_produtos', 'produtos_em_estoque', 'produtos_sem_estoque',
+    'total_pedidos', 'pedidos_ativos', 'pedidos_cancelados',
+    'valor_total_pedidos_ativos', 'valor_total_geral'
+]
+
+
+def _faixa_estoque(quantidade):
+    """Contador ao qual um produto com essa quantidade pertence"""
+    if quantidade > 0:
+        return 'produtos_em_estoque'
+    if quantidade == 0:
+        return 'produtos_sem_estoque'
+    return None
+
+
+def _somar(contadores, deltas, sinal=1):
+    """Soma (ou subtrai, com sinal=-1) os deltas aos contadores"""
+    for nome, delta in deltas.items():
+        if nome is not None:
+            contadores[nome] += sinal * delta
+
+
+class Retrato:
+    """Versão publicada do estado: produtos, pedidos e estatísticas imutáveis.
+
+    Nada aqui é alterado depois de criado, então leitores usam o retrato sem lock
+    enquanto os escritores seguem alterando o estado vivo.
+    """
+
+    __slots__ = ('versao', 'produtos', 'pedidos', 'ids_pedidos', 'estatisticas')
+
+    def __init__(self, versao, produtos, pedidos, ids_pedidos, estatisticas):
+        self.versao = versao
+        self.produtos = produtos          # {id_produto: Produto}, cópias próprias
+        self.pedidos = pedidos            # {id_pedido: Pedido}
+        self.ids_pedidos = ids_pedidos    # ids de pedidos em ordem crescente
+        self.estatisticas = estatisticas
+
+    def pedidos_apos(self, id_pedido):
+        """Gera os pedidos com id maior que o informado, em ordem de id"""
+        for id_atual in self.ids_pedidos[bisect.bisect_right(self.ids_pedidos, id_pedido):]:
+            yield self.pedidos[id_atual]
+
+    def com_alteracoes(self, versao, publicacoes):
+        """Novo retrato com as publicações aplicadas (copia só os dicionários alterados)"""
+        produtos, pedidos, ids_pedidos = self.produtos, self.pedidos, self.ids_pedidos
+        if any(alterados for alterados, _, _ in publicacoes):
+            produtos = dict(produtos)
+        if any(alterados for _, alterados, _ in publicacoes):
+            pedidos, ids_pedidos = dict(pedidos), list(ids_pedidos)
+        estatisticas = dict(self.estatisticas)
+        novos_ids = []
+        for produtos_alterados, pedidos_alterados, deltas in publicacoes:
+            produtos.update(produtos_alterados)
+            novos_ids.extend(id_pedido for id_pedido in pedidos_alterados if id_pedido not in pedidos)
+            pedidos.update(pedidos_alterados)
+            _somar(estatisticas, deltas)
+        if novos_ids:
+            # Ids são alocados em ordem, mas escritores concorrentes podem publicar fora dela
+            novos_ids.sort()
+            if ids_pedidos and novos_ids[0] < ids_pedidos[-1]:
+                ids_pedidos = sorted(ids_pedidos + novos_ids)
+            else:
+                ids_pedidos.extend(novos_ids)
+        return Retrato(versao, produtos, pedidos, ids_pedidos, estatisticas)
+
+
+class EstadoPedidos:
+    """Produtos (Produto) e histórico (Pedido) em memória, um objeto por linha.
+
+    Produtos são alterados no lugar e devem ser protegidos pelo lock do produto.
+    Pedidos são imutáveis: o cancelamento troca o pedido inteiro, de modo que uma
+    cópia rasa da lista é um retrato consistente.
+
+    O histórico pode ser parcial (só os pedidos que a operação precisa); nesse caso
+    `proximo_id_pedido` informa o próximo ID livre no armazenamento.
+
+    `nomes` indexa os produtos pelo nome normalizado (ver IndiceNomes). O índice de
+    nomes e os contadores de estatísticas são montados no primeiro uso: uma operação
+    que não os consulta não varre o catálogo nem o histórico.
+    """
+
+    def __init__(self, produtos, historico, proximo_id_pedido=None, remover_acentos=False):
+        self.produtos = {produto.id_produto: produto for produto in produtos_do_dataframe(produtos)}
+        self.remover_acentos = remover_acentos
+        self._nomes = None
+        self._lock_nomes = threading.Lock()
+        self._definir_historico(historico)
+
+        # Alocação de IDs e escrita no histórico têm locks próprios e curtos
+        self._lock_ids = threading.Lock()
+        self._lock_historico = threading.Lock()
+        self._proximo_id_produto = max(self.produtos, default=0) + 1
+        if proximo_id_pedido is None:
+            proximo_id_pedido = max((pedido.id_pedido for pedido in self.historico), default=0) + 1
+        self._proximo_id_pedido = proximo_id_pedido
+
+        # Versão dos dados no armazenamento quando o estado foi carregado (modo síncrono)
+        self.versao = None
+
+        # Estatísticas calculadas no primeiro uso e atualizadas a cada registro aplicado
+        self._lock_contadores = threading.Lock()
+        self._contadores = None
+
+        # Leituras isoladas (ver iniciar_retratos): alterações publicadas pelos
+        # escritores ao concluir e incorporadas ao retrato pelo primeiro leitor
+        self._retrato = None
+        self._publicacoes = []
+        self._lock_publicacao = threading.Lock()
+        self._lock_retrato = threading.Lock()
+
+    def _definir_historico(self, historico):
+        """Carrega o histórico (None: vazio) e o índice id_pedido -> posição na lista.
+
+        A lista só cresce, então as posições não mudam.
+        """
+        self.historico = pedidos_do_dataframe(historico) if historico is not None else []
+        self._posicao_pedido = {pedido.id_pedido: posicao for posicao, pedido in enumerate(self.historico)}
+
+    def trocar_historico(self, historico):
+        """Substitui o histórico parcial, mantendo produtos, nomes e próximos IDs.
+
+        Usado no modo síncrono para reaproveitar o estado entre operações da mesma
+        versão dos dados, lendo só os pedidos que cada operação precisa. Os contadores
+        deixam de valer e são recalculados se consultados.
+        """
+        self._definir_historico(historico)
+        with self._lock_contadores:
+            self._contadores = None
+
+    @property
+    def nomes(self):
+        """Índice de nomes dos produtos, montado no primeiro uso"""
+        if self._nomes is None:
+            with self._lock_nomes:
+                if self._nomes is None:
+                    self._nomes = IndiceNomes(self.produtos.values(), self.remover_acentos)
+        return self._nomes
+
+    def alocar_id_produto(self):
+        """Reserva o próximo ID de produto"""
+        with self._lock_ids:
+            novo_id = self._proximo_id_produto
+            self._proximo_id_produto += 1
+            return novo_id
+
+    def alocar_ids_produto(self, quantidade):
+        """Reserva um bloco contíguo de IDs de produto e retorna o primeiro"""
+        with self._lock_ids:
+            primeiro = self._proximo_id_produto
+            self._proximo_id_produto += quantidade
+            return primeiro
+
+    def alocar_id_pedido(self):
+        """Reserva o próximo ID de pedido"""
+        with self._lock_ids:
+            novo_id = self._proximo_id_pedido
+            self._proximo_id_pedido += 1
+            return novo_id
+
+    def possui_pedidos(self):
+        """Indica se algum pedido já foi registrado (vale também para histórico parcial)"""
+        with self._lock_ids:
+            return self._proximo_id_pedido > 1
+
+    def buscar_pedido(self, id_pedido):
+        """Retorna (posição, linha) do pedido no histórico, ou (None, None)"""
+        posicao = self._posicao_pedido.get(id_pedido)
+        if posicao is None:
+            return None, None
+        return posicao, self.historico[posicao]
+
+    def pedidos_apos(self, id_pedido):
+        """Gera os pedidos com id maior que o informado, em ordem de id, pelo índice"""
+        proximo = self._proximo_id_pedido
+        for id_atual in range(id_pedido + 1, proximo):
+            posicao = self._posicao_pedido.get(id_atual)
+            if posicao is not None:
+                yield self.historico[posicao]
+
+    def aplicar(self, registro):
+        """Aplica um registro de operação (idempotente, usado também na reaplicação do diário).
+
+        Retorna os deltas somados aos contadores (vazio se o registro já estava aplicado).
+        """
+        operacao = registro['operacao']
+
+        if operacao == 'produto':
+            if registro['id_produto'] in self.produtos:
+                return {}
+            self.produtos[registro['id_produto']] = Produto.do_registro(registro)
+            if self._nomes is not None:
+                self._nomes.adicionar(registro['nome'], registro['id_produto'])
+            with self._lock_ids:
+                self._proximo_id_produto = max(self._proximo_id_produto, registro['id_produto'] + 1)
+            deltas = {'total_produtos': 1, _faixa_estoque(registro['quantidade_estoque']): 1}
+
+        elif operacao == 'pedido':
+            if registro['id_pedido'] in self._posicao_pedido:
+                return {}
+            with self._lock_historico:
+                self.historico.append(Pedido.do_registro(registro))
+                self._posicao_pedido[registro['id_pedido']] = len(self.historico) - 1
+            deltas = self._alterar_estoque(registro['id_produto'], -registro['quantidade_pedida'])
+            with self._lock_ids:
+                self._proximo_id_pedido = max(self._proximo_id_pedido, registro['id_pedido'] + 1)
+            deltas.update({
+                'total_pedidos': 1,
+                'pedidos_ativos': 1,
+                'valor_total_pedidos_ativos': registro['valor_total'],
+                'valor_total_geral': registro['valor_total']
+            })
+
+        elif operacao == 'cancelamento':
+            posicao, pedido = self.buscar_pedido(registro['id_pedido'])
+            if pedido.status != 'ativo':
+                return {}
+            with self._lock_historico:
+                self.historico[posicao] = pedido.cancelado()
+            deltas = self._alterar_estoque(pedido.id_produto, pedido.quantidade_pedida)
+            deltas.update({
+                'pedidos_ativos': -1,
+                'pedidos_cancelados': 1,
+                'valor_total_pedidos_ativos': -pedido.valor_total
+            })
+
+        else:
+            raise ValueError(f"Operação desconhecida no registro: {operacao}")
+
+        self._ajustar(deltas)
+        return deltas
+
+    def iniciar_retratos(self):
+        """Publica o estado atual como primeiro retrato (chamar sem operações em andamento).
+
+        Monta também o índice de nomes, consultado depois sem os locks dos escritores.
+        """
+        self.nomes
+        produtos, historico = self.copiar()
+        pedidos = {pedido.id_pedido: pedido for pedido in historico}
+        self._retrato = Retrato(0, {produto.id_produto: produto for produto in produtos}, pedidos,
+                                sorted(pedidos), self.estatisticas())
+
+    def publicar(self, registros, deltas):
+        """Publica o resultado de registros já aplicados, como uma única alteração.
+
+        Chamar ao fim da operação, ainda com os locks dela: os valores copiados são os
+        que a operação deixou. `deltas` são os retornos de aplicar(). O custo é
+        proporcional aos registros; quem monta o retrato novo é o próximo leitor.
+        """
+        if self._retrato is None:
+            return
+        produtos, pedidos, somados = {}, {}, {}
+        for registro in registros:
+            produtos[registro['id_produto']] = self.produtos[registro['id_produto']].copiar()
+            if registro['operacao'] != 'produto':
+                pedidos[registro['id_pedido']] = self.buscar_pedido(registro['id_pedido'])[1]
+        for delta in deltas:
+            for nome, valor in delta.items():
+                if nome is not None:
+                    somados[nome] = somados.get(nome, 0) + valor
+        with self._lock_publicacao:
+            self._publicacoes.append((produtos, pedidos, somados))
+
+    def _pendentes(self):
+        """(retrato atual, publicações ainda não incorporadas a ele)"""
+        with self._lock_publicacao:
+            return self._retrato, list(self._publicacoes)
+
+    def retrato(self):
+        """Retrato com todas as alterações já publicadas.
+
+        Não espera escritores: o lock de publicação só protege a lista de alterações.
+        Leitores concorrentes esperam uns pelos outros para montar um único retrato novo.
+        """
+        retrato, publicacoes = self._pendentes()
+        if not publicacoes:
+            return retrato
+        with self._lock_retrato:
+            retrato, publicacoes = self._pendentes()
+            if not publicacoes:
+                return retrato
+            novo = retrato.com_alteracoes(retrato.versao + len(publicacoes), publicacoes)
+            with self._lock_publicacao:
+                self._retrato = novo
+                del self._publicacoes[:len(publicacoes)]
+            return novo
+
+    def versao_publicada(self):
+        """Quantidade de operações publicadas: muda a cada operação concluída"""
+        with self._lock_publicacao:
+            return self._retrato.versao + len(self._publicacoes)
+
+    def estatisticas_publicadas(self):
+        """Estatísticas do último retrato mais as publicações pendentes, sem montar o retrato"""
+        retrato, publicacoes = self._pendentes()
+        estatisticas = dict(retrato.estatisticas)
+        for _, _, deltas in publicacoes:
+            _somar(estatisticas, deltas)
+        return estatisticas
+
+    def _alterar_estoque(self, id_produto, delta):
+        """Altera o estoque do produto e retorna o ajuste dos contadores de estoque"""
+        produto = self.produtos[id_produto]
+        antes = produto.quantidade_estoque
+        produto.quantidade_estoque = antes + delta
+        faixa_antes, faixa_depois = _faixa_estoque(antes), _faixa_estoque(antes + delta)
+        if faixa_antes == faixa_depois:
+            return {}
+        return {faixa_antes: -1, faixa_depois: 1}
+
+    def _ajustar(self, deltas):
+        """Soma os deltas aos contadores"""
+        with self._lock_contadores:
+            if self._contadores is None:
+                return
+            for nome, delta in deltas.items():
+                if nome is not None:
+                    self._contadores[nome] += delta
+
+    def _contar(self):
+        """Calcula as estatísticas com uma varredura completa"""
+        produtos = list(self.produtos.values())
+        historico = list(self.historico)
+        contadores = dict.fromkeys(CONTADORES, 0)
+        contadores['valor_total_pedidos_ativos'] = 0.0
+        contadores['valor_total_geral'] = 0.0
+        contadores['total_produtos'] = len(produtos)
+        contadores['total_pedidos'] = len(historico)
+        for produto in produtos:
+            faixa = _faixa_estoque(produto.quantidade_estoque)
+            if faixa is not None:
+                contadores[faixa] += 1
+        for pedido in historico:
+            contadores['valor_total_geral'] += pedido.valor_total
+            if pedido.status == 'ativo':
+                contadores['pedidos_ativos'] += 1
+                contadores['valor_total_pedidos_ativos'] += pedido.valor_total
+            elif pedido.status == 'cancelado':
+                contadores['pedidos_cancelados'] += 1
+        return contadores
+
+    def estatisticas(self):
+        """Retorna os contadores mantidos incrementalmente (O(1) após o primeiro uso)"""
+        with self._lock_contadores:
+            if self._contadores is None:
+                self._contadores = self._contar()
+            return dict(self._contadores)
+
+    def recalcular_estatisticas(self):
+        """Confere os contadores com uma varredura completa e os corrige.
+
+        Deve ser chamado sem operações em andamento. Retorna um dict
+        {contador: (valor_mantido, valor_recalculado)} com as divergências.
+        """
+        recalculado = self._contar()
+        with self._lock_contadores:
+            if self._contadores is None:
+                self._contadores = recalculado
+                return {}
+            divergencias = {
+                nome: (self._contadores[nome], recalculado[nome])
+                for nome in CONTADORES
+                if not math.isclose(self._contadores[nome], recalculado[nome], abs_tol=1e-6)
+            }
+            self._contadores = recalculado
+        return divergencias
+
+    def copiar(self):
+        """Retorna (produtos, historico) como listas independentes do estado vivo"""
+        return [produto.copiar() for produto in self.produtos.values()], list(self.historico)
+
+    @staticmethod
+    def montar_dataframes(produtos, historico):
+        """Monta os DataFrames de exportação a partir de listas de Produto e Pedido"""
+        historico = sorted(historico, key=lambda pedido: pedido.id_pedido)
+        return (pd.DataFrame.from_records([produto.valores() for produto in produtos], columns=COLUNAS_PRODUTOS),
+                pd.DataFrame.from_records(historico, columns=COLUNAS_HISTORICO))
+
+    def para_dataframes(self):
+        """Converte o estado atual em DataFrames (produtos, historico)"""
+        return self.montar_dataframes(*self.copiar())
@@ -0,0 +1,24 @@
+import importlib
+import sys
+
+
+class ModuloAdiado:
+    """Módulo importado apenas no primeiro acesso a um de seus atributos.
+
+    Permite manter `pd = ModuloAdiado('pandas')` no topo do arquivo sem pagar o
+    custo da importação em caminhos que não usam o módulo (ex.: abrir o menu).
+    """
+
+    def __init__(self, nome):
+        self._nome = nome
+        self._modulo = None
+
+    def __getattr__(self, atributo):
+        # Só é chamado para atributos que não existem no próprio objeto
+        if self._modulo is None:
+            self._modulo = importlib.import_module(self._nome)
+        return getattr(self._modulo, atributo)
+
+    def carregado(self):
+        """Indica se o módulo já foi importado (por este objeto ou por outro código)"""
+        return self._nome in sys.modules
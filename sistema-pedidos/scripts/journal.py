@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+
+class Journal:
+    """Diário append-only de operações, uma linha JSON por operação.
+
+    Uma operação com vários registros (pedido com vários itens, lote) ocupa uma
+    única linha com a lista de registros: como a linha truncada por uma queda é
+    descartada, a operação é reaplicada inteira ou não é reaplicada.
+
+    Group commit: o lock de escrita cobre só o write e o flush. O fsync é feito
+    fora dele por uma thread (a líder) em nome de todas as linhas já escritas;
+    quem escreveu enquanto isso aguarda e, se o fsync da líder não cobriu a sua
+    linha, uma delas lidera o próximo.
+    """
+
+    def __init__(self, caminho, fsync=True):
+        self.caminho = caminho
+        # Trecho do diário que está sendo compactado no Excel
+        self.caminho_compactando = caminho + '.compactando'
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        # Linhas escritas e linhas já cobertas por um fsync, e se há um fsync em andamento
+        self._escritas = 0
+        self._sincronizadas = 0
+        self._sincronizando = False
+        self._condicao = threading.Condition()
+        for caminho in (self.caminho_compactando, self.caminho):
+            self._descartar_linha_truncada(caminho)
+        self._arquivo = open(self.caminho, 'a', encoding='utf-8')
+
+    @staticmethod
+    def _descartar_linha_truncada(caminho):
+        """Remove o final incompleto deixado por uma queda durante a gravação"""
+        if not os.path.exists(caminho):
+            return
+        with open(caminho, 'rb+') as arquivo:
+            conteudo = arquivo.read()
+            if conteudo and not conteudo.endswith(b'\n'):
+                arquivo.truncate(conteudo.rfind(b'\n') + 1)
+
+    def registrar(self, registros):
+        """Acrescenta os registros de uma operação ao diário e retorna quando estão em disco"""
+        linha = json.dumps(registros[0] if len(registros) == 1 else registros, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._arquivo.write(linha)
+            self._arquivo.flush()
+            self._escritas += 1
+            posicao = self._escritas
+        if self.fsync:
+            self._sincronizar(posicao)
+
+    def _sincronizar(self, posicao):
+        """Aguarda um fsync que cubra a linha `posicao`, fazendo-o se nenhuma thread estiver"""
+        with self._condicao:
+            while self._sincronizadas < posicao and self._sincronizando:
+                self._condicao.wait()
+            if self._sincronizadas >= posicao:
+                return
+            # Líder: o fsync cobre todas as linhas escritas até aqui, inclusive as de outras threads
+            self._sincronizando = True
+            with self._lock:
+                alvo = self._escritas
+                arquivo = self._arquivo
+        concluido = False
+        try:
+            os.fsync(arquivo.fileno())
+            concluido = True
+        finally:
+            with self._condicao:
+                self._sincronizando = False
+                if concluido:
+                    self._sincronizadas = alvo
+                self._condicao.notify_all()
+
+    def ler_pendentes(self):
+        """Retorna os registros ainda não compactados, na ordem em que foram gravados"""
+        registros = []
+        for caminho in (self.caminho_compactando, self.caminho):
+            if not os.path.exists(caminho):
+                continue
+            with open(caminho, encoding='utf-8') as arquivo:
+                for linha in arquivo:
+                    if not linha.strip():
+                        continue
+                    conteudo = json.loads(linha)
+                    registros.extend(conteudo if isinstance(conteudo, list) else [conteudo])
+        return registros
+
+    @contextmanager
+    def _trocar_arquivo(self):
+        """Fecha o diário atual, sem fsync em andamento, depois de levar ao disco o que foi escrito.
+
+        Enquanto o bloco roda, nenhuma thread começa um fsync nem escreve.
+        """
+        with self._condicao:
+            while self._sincronizando:
+                self._condicao.wait()
+            with self._lock:
+                if self.fsync:
+                    os.fsync(self._arquivo.fileno())
+                self._arquivo.close()
+                self._sincronizadas = self._escritas
+                yield
+
+    def rotacionar(self):
+        """Separa o diário atual para compactação e abre um diário vazio"""
+        with self._trocar_arquivo():
+            if os.path.exists(self.caminho_compactando):
+                # Compactação anterior falhou: acumular no mesmo trecho
+                with open(self.caminho, encoding='utf-8') as origem, \
+                        open(self.caminho_compactando, 'a', encoding='utf-8') as destino:
+                    destino.write(origem.read())
+                os.remove(self.caminho)
+            else:
+                os.replace(self.caminho, self.caminho_compactando)
+            self._arquivo = open(self.caminho, 'a', encoding='utf-8')
+
+    def concluir_compactacao(self):
+        """Descarta o trecho já incorporado ao Excel"""
+        if os.path.exists(self.caminho_compactando):
+            os.remove(self.caminho_compactando)
+
+    def fechar(self):
+        """Fecha o arquivo do diário"""
+        with self._trocar_arquivo():
+            pass
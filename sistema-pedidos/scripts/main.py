@@ -1,130 +1,869 @@
-import pandas as pd
+import time
+_INICIO_IMPORTACAO = time.perf_counter()  # Para o relatório de --tempo-inicializacao
+
+import argparse
+import contextlib
+import io
+import sys
 import threading
-from datetime import datetime
+import atexit
+import functools
+import math
+import random
+from contextlib import contextmanager, ExitStack
+from datetime import datetime, date
 import os
+from journal import Journal
+from coordenacao import CoordenacaoProcessos, ConflitoVersao
+from metricas import MetricasOperacoes
+from tabela_estoque import TabelaEstoque, VERSAO_INVALIDA
+from armazenamento import ArmazenamentoExcel, COLUNAS_PRODUTOS, COLUNAS_HISTORICO
+from modelos import Produto, IndiceNomes, normalizar_nomes, produtos_do_dataframe, pedidos_do_dataframe
+from estado import EstadoPedidos, CONTADORES
+from reservas import Reservas
+from cache_leituras import CacheLeituras
+from importacao import ModuloAdiado
+
+# pandas (e openpyxl, por meio dele) só é importado quando usado
+pd = ModuloAdiado('pandas')
+
+# Modos de persistência
+MODO_SINCRONO = 'sincrono'    # Lê e grava o armazenamento a cada operação
+MODO_RESIDENTE = 'residente'  # Mantém dados em memória e grava em segundo plano
+
+def _repetir_em_conflito(metodo):
+    """Reexecuta a operação quando outro processo gravou entre a leitura e a gravação.
+    
+    A última tentativa segura o lock entre processos desde a leitura e, portanto,
+    sempre conclui.
+    """
+    @functools.wraps(metodo)
+    def executar(self, *args, **kwargs):
+        for tentativa in range(self.tentativas_conflito):
+            self._local.ultima_tentativa = tentativa == self.tentativas_conflito - 1
+            try:
+                return metodo(self, *args, **kwargs)
+            except ConflitoVersao:
+                # Espera aleatória crescente para os processos não colidirem de novo
+                time.sleep(random.uniform(0, 0.005 * 2 ** tentativa))
+            finally:
+                self._local.ultima_tentativa = False
+    return executar
+
+def _instrumentar(metodo):
+    """Registra nas métricas o tempo de cada chamada do método público"""
+    @functools.wraps(metodo)
+    def executar(self, *args, **kwargs):
+        with self._metricas.operacao(metodo.__name__):
+            return metodo(self, *args, **kwargs)
+    return executar
 
 class SistemaPedidos:
-    def __init__(self, arquivo_excel='dados/sistema_pedidos.xlsx'):
-        # Lock para garantir atomicidade em operações concorrentes
+    def __init__(self, arquivo_excel='dados/sistema_pedidos.xlsx', modo=MODO_SINCRONO, intervalo_flush=5.0,
+                 journal=True, armazenamento=None, faixas_lock=64, tentativas_conflito=5,
+                 arquivo_metricas=None, intervalo_metricas=60.0, tabela_estoque=True, remover_acentos=False,
+                 intervalo_reservas=1.0, capacidade_cache=32, max_linhas_cache=100_000):
+        if modo not in (MODO_SINCRONO, MODO_RESIDENTE):
+            raise ValueError(f"Modo inválido: {modo}")
+        
+        # Lock global: no modo síncrono as operações compartilham a planilha em memória e o arquivo
         self.lock = threading.Lock()
         
-        # Arquivo único do sistema
+        # Modo residente: locks por faixa de id_produto, para que pedidos de produtos
+        # diferentes prossigam em paralelo, e um lock de catálogo para novos produtos
+        self._locks_produto = [threading.Lock() for _ in range(faixas_lock)]
+        self._lock_catalogo = threading.Lock()
+        
+        # Mecanismo de armazenamento (Excel por padrão)
+        self.armazenamento = armazenamento if armazenamento is not None else ArmazenamentoExcel(arquivo_excel)
         self.arquivo_excel = arquivo_excel
+        self.modo = modo
+        self.intervalo_flush = intervalo_flush
+        
+        # Nomes de produto comparados sem diferenciar maiúsculas e, opcionalmente, acentos
+        self.remover_acentos = remover_acentos
+        
+        # Inicializar armazenamento se não existir
+        self.armazenamento.inicializar()
+        
+        # Coordenação com outros processos: lock de arquivo e versão dos dados
+        self._coordenacao = CoordenacaoProcessos(os.path.splitext(self.armazenamento.caminho)[0])
+        self.tentativas_conflito = max(1, tentativas_conflito)
+        self._local = threading.local()
+        self._versao_vista = None
+        
+        # Modo síncrono: estado da última versão lida (produtos, nomes, próximos IDs),
+        # reaproveitado enquanto nenhum outro processo gravar. As gravações deste
+        # processo já são aplicadas a ele; se uma falhar, ele é descartado.
+        self._estado_sincrono = None
         
-        # Criar pasta se não existir
-        pasta = os.path.dirname(arquivo_excel)
-        if pasta:
-            os.makedirs(pasta, exist_ok=True)
-        
-        # Inicializar arquivo se não existir
-        self._inicializar_arquivo()
-    
-    def _inicializar_arquivo(self):
-        """Cria arquivo Excel com duas abas se não existir"""
-        if not os.path.exists(self.arquivo_excel):
-            # Aba de produtos (vazia inicialmente)
-            produtos_df = pd.DataFrame(columns=[
-                'id_produto', 'nome', 'descricao', 'preco_unitario', 'quantidade_estoque'
-            ])
-            
-            # Aba de histórico de pedidos (vazia inicialmente)
-            historico_df = pd.DataFrame(columns=[
-                'id_pedido', 'id_produto', 'nome_produto', 'descricao_pedido', 
-                'quantidade_pedida', 'preco_unitario', 'valor_total', 
-                'data_pedido', 'status'
-            ])
-            
-            # Salvar arquivo com duas abas
-            with pd.ExcelWriter(self.arquivo_excel, engine='openpyxl') as writer:
-                produtos_df.to_excel(writer, sheet_name='Produtos', index=False)
-                historico_df.to_excel(writer, sheet_name='Historico', index=False)
+        # Resultados de leituras (estoque, estatísticas, páginas do histórico) por versão
+        # dos dados, limitados em chaves e em linhas (produtos ou pedidos) guardadas
+        self._cache_leituras = CacheLeituras(capacidade_cache, max_linhas_cache)
+        
+        # Modo síncrono: estoque e preço espelhados num arquivo mapeado em memória,
+        # lido por todos os processos sem abrir o armazenamento. A conferência (e, se
+        # preciso, a reconstrução) fica para o primeiro uso, para não atrasar a abertura.
+        self._tabela = None
+        self._tabela_conferida = False
+        self._catalogo = (None, {}, IndiceNomes())  # (versão do catálogo, {id_produto: Produto}, nomes)
+        if modo == MODO_SINCRONO and tabela_estoque:
+            self._tabela = TabelaEstoque(os.path.splitext(self.armazenamento.caminho)[0] + '.estoque')
+        
+        # Métricas por operação e, opcionalmente, gravação periódica num arquivo JSON
+        self._metricas = MetricasOperacoes()
+        self.arquivo_metricas = arquivo_metricas
+        self.intervalo_metricas = intervalo_metricas
+        self._parar_metricas = threading.Event()
+        self._thread_metricas = None
+        
+        # Reservas de estoque em memória (deste processo); a thread que libera as
+        # vencidas só é criada na primeira reserva
+        self._reservas = Reservas()
+        self.intervalo_reservas = intervalo_reservas
+        self._parar_reservas = threading.Event()
+        self._thread_reservas = None
+        self._lock_thread_reservas = threading.Lock()
+        
+        # Estado residente (usado apenas no modo residente)
+        self._estado = None
+        self._pendentes = []  # Registros aplicados em memória e ainda não persistidos
+        self._lock_escrita = threading.Lock()  # Serializa gravações do flusher
+        self._parar_flush = threading.Event()
+        self._thread_flush = None
+        self._journal = None
+        
+        if self.modo == MODO_RESIDENTE:
+            self._estado = EstadoPedidos(*self.armazenamento.carregar(), remover_acentos=remover_acentos)
+            
+            # Diário de operações: reaplicar o que não foi persistido e continuar registrando
+            if journal:
+                self._journal = Journal(os.path.splitext(self.armazenamento.caminho)[0] + '.journal')
+                for registro in self._journal.ler_pendentes():
+                    self._estado.aplicar(registro)
+                    self._pendentes.append(registro)
+            
+            # Leituras passam a usar retratos publicados pelas operações concluídas
+            self._estado.iniciar_retratos()
+            
+            self._thread_flush = threading.Thread(
+                target=self._loop_flush, name='flush-pedidos', daemon=True
+            )
+            self._thread_flush.start()
+        
+        if self.arquivo_metricas is not None:
+            self._thread_metricas = threading.Thread(
+                target=self._loop_metricas, name='metricas-pedidos', daemon=True
+            )
+            self._thread_metricas.start()
+        
+        if self._thread_flush is not None or self._thread_metricas is not None:
+            atexit.register(self.fechar)
     
-    def _carregar_dados(self):
-        """Carrega dados das duas abas do Excel"""
-        try:
-            produtos = pd.read_excel(self.arquivo_excel, sheet_name='Produtos')
-            historico = pd.read_excel(self.arquivo_excel, sheet_name='Historico')
-            return produtos, historico
-        except Exception as e:
-            raise Exception(f"Erro ao carregar dados: {e}")
+    def __enter__(self):
+        return self
     
-    def _salvar_dados(self, produtos, historico):
-        """Salva dados nas duas abas do Excel"""
-        try:
-            with pd.ExcelWriter(self.arquivo_excel, engine='openpyxl') as writer:
-                produtos.to_excel(writer, sheet_name='Produtos', index=False)
-                historico.to_excel(writer, sheet_name='Historico', index=False)
-        except Exception as e:
-            raise Exception(f"Erro ao salvar dados: {e}")
+    def __exit__(self, exc_type, exc, tb):
+        self.fechar()
     
-    def adicionar_produto(self, nome, descricao, preco_unitario, quantidade_estoque):
-        """Adiciona um novo produto ao sistema"""
-        # Lock necessário para evitar IDs duplicados em operações concorrentes
-        with self.lock:
-            produtos, historico = self._carregar_dados()
+    def _carregar_dados(self):
+        """Carrega dados das duas abas (do estado em memória no modo residente)"""
+        if self.modo == MODO_RESIDENTE:
+            return EstadoPedidos.montar_dataframes(*self._copiar_estado())
+        with self._metricas.medir('carga'):
+            return self.armazenamento.carregar()
+    
+    def _obter_estado(self, id_pedido=None):
+        """Estado residente, ou o estado da versão atual do armazenamento no modo síncrono"""
+        if self.modo == MODO_RESIDENTE:
+            return self._estado
+        
+        # Versão lida antes dos dados: se outro processo gravar no meio, a gravação
+        # desta operação detecta o conflito
+        versao = self._coordenacao.versao()
+        if versao != self._versao_vista:
+            self.armazenamento.descartar_cache()
+            self._versao_vista = versao
+        
+        with self._metricas.medir('carga'), self.armazenamento.retrato() as leitor:
+            if not leitor.grava_por_linha:
+                estado = EstadoPedidos(*leitor.carregar(), remover_acentos=self.remover_acentos)
+                estado.versao = versao
+                return estado
             
-            # Validações de entrada
-            if not nome or not nome.strip():
-                return False, "Nome do produto não pode estar vazio!"
+            # Armazenamento por linha: produtos e próximo ID carregados uma vez por
+            # versão dos dados; do histórico, só o pedido informado, lido pela chave
+            estado = self._estado_sincrono
+            if estado is None or estado.versao != versao:
+                estado = EstadoPedidos(leitor.carregar_produtos(), None,
+                                       proximo_id_pedido=leitor.proximo_id_pedido(),
+                                       remover_acentos=self.remover_acentos)
+                estado.versao = versao
+                self._estado_sincrono = estado
+            estado.trocar_historico(leitor.buscar_pedido(id_pedido) if id_pedido is not None else None)
+        return estado
+    
+    def _versao_dados(self):
+        """Contador que muda a cada alteração dos dados.
+        
+        No modo síncrono é a versão compartilhada entre processos; no residente, o
+        número de operações publicadas.
+        """
+        if self.modo == MODO_RESIDENTE:
+            return self._estado.versao_publicada()
+        return self._coordenacao.versao()
+    
+    def _leitura_em_cache(self, chave, carregar, linhas=None):
+        """Resultado de carregar() reaproveitado enquanto a versão dos dados não mudar.
+        
+        `linhas(resultado)` dá o tamanho usado no limite do cache (ver CacheLeituras).
+        Só as leituras do armazenamento dentro de carregar() contam como carga; o
+        restante do cálculo conta como lógica.
+        """
+        return self._cache_leituras.obter(chave, self._versao_dados(), carregar, linhas)
+    
+    @contextmanager
+    def _travar_sincrono(self, id_pedido=None):
+        """Lock do processo e estado recém-carregado (modo síncrono).
+        
+        Na última tentativa após conflitos, segura também o lock entre processos.
+        """
+        with ExitStack() as pilha:
+            with self._metricas.medir('espera_lock'):
+                pilha.enter_context(self.lock)
+                if getattr(self._local, 'ultima_tentativa', False):
+                    pilha.enter_context(self._coordenacao.travar())
+            yield self._obter_estado(id_pedido)
+    
+    def _lock_do_produto(self, id_produto):
+        """Lock da faixa à qual o produto pertence"""
+        return self._locks_produto[hash(id_produto) % len(self._locks_produto)]
+    
+    @contextmanager
+    def _travar_produtos(self, ids_produto):
+        """Bloqueia os produtos informados e entrega o estado para a operação"""
+        if self.modo != MODO_RESIDENTE:
+            with self._travar_sincrono() as estado:
+                yield estado
+            return
+        
+        # Faixas em ordem canônica para evitar deadlock entre operações com vários produtos
+        faixas = sorted({hash(id_produto) % len(self._locks_produto) for id_produto in ids_produto})
+        with ExitStack() as pilha:
+            with self._metricas.medir('espera_lock'):
+                for faixa in faixas:
+                    pilha.enter_context(self._locks_produto[faixa])
+            yield self._estado
+    
+    @contextmanager
+    def _travar_pedido(self, id_pedido):
+        """Bloqueia o produto do pedido informado e entrega (estado, pedido ou None).
+        
+        O produto de um pedido nunca muda: localizado o pedido, basta o lock do produto,
+        e o pedido é relido sob ele. Se o pedido não existia antes do lock, nenhum
+        produto fica bloqueado e ele é tratado como não encontrado, mesmo que seja
+        gravado em seguida por outra thread.
+        """
+        if self.modo != MODO_RESIDENTE:
+            with self._travar_sincrono(id_pedido) as estado:
+                yield estado, estado.buscar_pedido(id_pedido)[1]
+            return
+        _, pedido = self._estado.buscar_pedido(id_pedido)
+        if pedido is None:
+            yield self._estado, None
+            return
+        with self._travar_produtos([pedido.id_produto]) as estado:
+            yield estado, estado.buscar_pedido(id_pedido)[1]
+    
+    @contextmanager
+    def _travar_catalogo(self):
+        """Bloqueia a inclusão de produtos (nomes e IDs únicos)"""
+        if self.modo != MODO_RESIDENTE:
+            with self._travar_sincrono() as estado:
+                yield estado
+            return
+        with ExitStack() as pilha:
+            with self._metricas.medir('espera_lock'):
+                pilha.enter_context(self._lock_catalogo)
+            yield self._estado
+    
+    @contextmanager
+    def _travar_novos_produtos(self, ids_produto):
+        """Modo residente: bloqueia os produtos recém-alocados até a operação publicá-los.
+        
+        O produto fica visível em estado.produtos ao ser aplicado; sem o lock, um pedido
+        para o novo ID poderia publicar o estoque baixado antes da inclusão, que então
+        sobrescreveria o retrato com o estoque inicial.
+        """
+        if self.modo != MODO_RESIDENTE:
+            yield
+            return
+        with self._travar_produtos(ids_produto):
+            yield
+    
+    @contextmanager
+    def _travar_tudo(self):
+        """Aguarda as operações em andamento e bloqueia novas (mesma ordem dos demais locks)"""
+        with ExitStack() as pilha:
+            with self._metricas.medir('espera_lock'):
+                pilha.enter_context(self._lock_catalogo)
+                for lock in self._locks_produto:
+                    pilha.enter_context(lock)
+            yield
+    
+    def _copiar_estado(self):
+        """Cópia consistente de (produtos, historico) do estado residente"""
+        with self._travar_tudo():
+            return self._estado.copiar()
+    
+    def _salvar_dados(self, estado, registros, deltas=()):
+        """Salva as alterações descritas pelos registros (adiando a gravação no modo residente).
+        
+        `deltas` são os retornos de estado.aplicar(): no modo síncrono, somados às
+        estatísticas gravadas junto com a versão dos dados.
+        """
+        if self.modo == MODO_RESIDENTE:
+            self._pendentes.extend(registros)
+            return
+        with ExitStack() as pilha:
+            with self._metricas.medir('espera_lock'):
+                pilha.enter_context(self._coordenacao.travar())
             
-            if preco_unitario <= 0:
-                return False, "Preço deve ser maior que zero!"
+            # Gravação otimista: só grava se nenhum outro processo gravou desde a leitura
+            with self._metricas.medir('gravacao'):
+                if self._coordenacao.versao() != estado.versao:
+                    raise ConflitoVersao("Dados alterados por outro processo")
+                produtos = historico = None
+                if not self.armazenamento.grava_por_linha:
+                    produtos, historico = estado.para_dataframes()
+                self.armazenamento.registrar(registros, produtos, historico)
+                self._versao_vista = self._coordenacao.avancar_versao()
+                self._atualizar_estatisticas(estado.versao, deltas)
+                if self._tabela is not None:
+                    self._atualizar_tabela(estado, registros)
+                # O estado já inclui a gravação: continua valendo para a nova versão
+                estado.versao = self._versao_vista
+    
+    def _atualizar_estatisticas(self, versao_anterior, deltas):
+        """Soma os deltas da gravação às estatísticas gravadas (com o lock entre processos).
+        
+        Se as gravadas não são da versão anterior (ex.: gravação do modo residente),
+        nada é gravado e a próxima leitura as recalcula (_estatisticas_gravadas).
+        """
+        contadores = self._coordenacao.estatisticas(versao_anterior)
+        if contadores is None:
+            return
+        for delta in deltas:
+            for nome, valor in delta.items():
+                if nome is not None:
+                    contadores[nome] += valor
+        self._coordenacao.gravar_estatisticas(self._versao_vista, contadores)
+    
+    def _atualizar_tabela(self, estado, registros):
+        """Reflete na tabela de estoque a gravação recém-feita (com o lock entre processos)"""
+        if self._tabela.versao_dados() != estado.versao:
+            # Tabela defasada (ex.: queda entre gravações): reconstruir com os produtos do estado
+            self._tabela.reconstruir(estado.produtos.values(), self._versao_vista)
+            return
+        # Versão inválida durante a alteração: leitores de vários slots não misturam
+        # valores de antes e depois desta gravação (ver _produtos_da_tabela)
+        self._tabela.definir_versao_dados(VERSAO_INVALIDA)
+        ids_produto = {registro['id_produto'] for registro in registros}
+        for id_produto in ids_produto:
+            produto = estado.produtos[id_produto]
+            self._tabela.definir(id_produto, produto.quantidade_estoque, produto.preco_unitario)
+        if any(registro['operacao'] == 'produto' for registro in registros):
+            self._tabela.avancar_versao_catalogo()
+        self._tabela.definir_versao_dados(self._versao_vista)
+    
+    def _conferir_tabela(self):
+        """Na primeira leitura, reconstrói a tabela se ela não espelhar os dados atuais.
+        
+        Depois disso cada gravação mantém a tabela em dia (_atualizar_tabela).
+        """
+        with self._coordenacao.travar():
+            versao = self._coordenacao.versao()
+            if self._tabela.versao_dados() != versao:
+                with self._metricas.medir('carga'):
+                    produtos = produtos_do_dataframe(self.armazenamento.carregar_produtos())
+                self._tabela.reconstruir(produtos, versao)
+        self._tabela_conferida = True
+    
+    def _tabela_em_dia(self):
+        """Indica se a tabela de estoque espelha a versão atual dos dados"""
+        if self._tabela is None:
+            return False
+        if not self._tabela_conferida:
+            self._conferir_tabela()
+        return self._tabela.versao_dados() == self._coordenacao.versao()
+    
+    def _carregar_catalogo(self):
+        """Produtos por id (nome, descrição) e índice de nomes, recarregados só quando o catálogo muda"""
+        versao = self._tabela.versao_catalogo()
+        if self._catalogo[0] != versao:
+            with self._metricas.medir('carga'):
+                produtos = produtos_do_dataframe(self.armazenamento.carregar_produtos())
+            self._catalogo = (versao, {produto.id_produto: produto for produto in produtos},
+                              IndiceNomes(produtos, self.remover_acentos))
+        return self._catalogo
+    
+    def _produtos_do_catalogo(self):
+        """Produtos por id do catálogo em cache.
+        
+        O estoque desses objetos não é atualizado; o valor atual vem da tabela.
+        """
+        return self._carregar_catalogo()[1]
+    
+    def _produtos_da_tabela(self):
+        """Produtos com estoque e preço lidos da tabela mapeada, ou None se ela não estiver em dia.
+        
+        A versão dos dados da tabela funciona como um seqlock: se mudar durante a
+        leitura, uma gravação alterou slots no meio dela e o resultado é descartado.
+        """
+        if not self._tabela_em_dia():
+            return None
+        versao = self._tabela.versao_dados()
+        if versao == VERSAO_INVALIDA:
+            return None
+        produtos = []
+        for produto in self._produtos_do_catalogo().values():
+            atual = self._tabela.ler(produto.id_produto)
+            if atual is None:
+                return None
+            quantidade, preco = atual
+            produtos.append(Produto(produto.id_produto, produto.nome, produto.descricao, preco, quantidade))
+        if self._tabela.versao_dados() != versao:
+            return None
+        return produtos
+    
+    def _recusar_pela_tabela(self, id_produto, quantidade_pedida):
+        """Valida o pedido pela tabela mapeada, sem ler o armazenamento.
+        
+        Retorna a mensagem de erro quando o pedido certamente não pode ser feito; None
+        quando pode prosseguir ou quando a tabela não permite decidir.
+        """
+        if not self._tabela_em_dia():
+            return None
+        produto = self._produtos_do_catalogo().get(id_produto)
+        atual = self._tabela.ler(id_produto) if isinstance(id_produto, int) else None
+        if (produto is None) != (atual is None):
+            return None  # Produto recém-incluído por outro processo
+        quantidade_disponivel = atual[0] if atual is not None else 0
+        return self._validar_pedido(id_produto, produto, quantidade_pedida, quantidade_disponivel)
+    
+    def _efetivar(self, estado, registros):
+        """Registra as operações no diário (se houver), aplica e salva tudo de uma vez"""
+        if self._journal is not None:
+            with self._metricas.medir('gravacao'):
+                self._journal.registrar(registros)
+        try:
+            deltas = [estado.aplicar(registro) for registro in registros]
+            self._salvar_dados(estado, registros, deltas)
+        except Exception:
+            # Modo síncrono: o estado em cache tem registros que não foram gravados
+            self._estado_sincrono = None
+            raise
+        # Modo residente: leitores passam a ver a operação inteira de uma vez
+        estado.publicar(registros, deltas)
+    
+    def _loop_flush(self):
+        """Grava periodicamente o estado residente alterado"""
+        while not self._parar_flush.wait(self.intervalo_flush):
+            try:
+                self.sincronizar()
+            except Exception as e:
+                print(f"Erro na gravação em segundo plano: {e}")
+    
+    @_instrumentar
+    def sincronizar(self):
+        """Grava imediatamente as alterações pendentes do modo residente.
+        
+        Com o diário ativo, esta é a etapa de compactação: o armazenamento passa a
+        conter todos os registros e o trecho correspondente do diário é descartado.
+        """
+        if self.modo != MODO_RESIDENTE:
+            return
+        
+        # Apenas um flush por vez, para que uma cópia antiga nunca sobrescreva uma mais nova
+        with self._lock_escrita:
+            # Copiar com as operações pausadas e gravar depois, sem bloquear os pedidos
+            with self._travar_tudo():
+                if not self._pendentes:
+                    return
+                registros = self._pendentes
+                self._pendentes = []
+                if not self.armazenamento.grava_por_linha:
+                    copia = self._estado.copiar()
+                if self._journal is not None:
+                    self._journal.rotacionar()
             
-            if quantidade_estoque < 0:
-                return False, "Quantidade em estoque não pode ser negativa!"
+            produtos = historico = None
+            try:
+                with self._metricas.medir('gravacao'):
+                    if not self.armazenamento.grava_por_linha:
+                        produtos, historico = EstadoPedidos.montar_dataframes(*copia)
+                with ExitStack() as pilha:
+                    with self._metricas.medir('espera_lock'):
+                        pilha.enter_context(self._coordenacao.travar())
+                    with self._metricas.medir('gravacao'):
+                        self.armazenamento.registrar(registros, produtos, historico)
+                        self._coordenacao.avancar_versao()
+            except Exception:
+                with self._travar_tudo():
+                    self._pendentes[:0] = registros
+                raise
             
-            # Verificar se produto já existe (case insensitive)
-            if not produtos.empty and nome.strip().lower() in produtos['nome'].str.lower().values:
+            if self._journal is not None:
+                self._journal.concluir_compactacao()
+    
+    def _loop_metricas(self):
+        """Grava periodicamente as métricas no arquivo configurado"""
+        while not self._parar_metricas.wait(self.intervalo_metricas):
+            try:
+                self._metricas.gravar(self.arquivo_metricas)
+            except Exception as e:
+                print(f"Erro ao gravar métricas: {e}")
+    
+    def _loop_reservas(self):
+        """Libera periodicamente o estoque das reservas vencidas"""
+        while not self._parar_reservas.wait(self.intervalo_reservas):
+            self._reservas.expirar()
+    
+    def _iniciar_varredura_reservas(self):
+        """Cria a thread de expiração de reservas, se ainda não existir"""
+        with self._lock_thread_reservas:
+            if self._thread_reservas is not None:
+                return
+            self._thread_reservas = threading.Thread(
+                target=self._loop_reservas, name='reservas-pedidos', daemon=True
+            )
+            self._thread_reservas.start()
+        atexit.register(self.fechar)
+    
+    def metricas(self):
+        """Histogramas de tempo por operação pública.
+        
+        Retorna {operacao: {fase: resumo}}, com as fases espera_lock, carga, logica,
+        gravacao e total; cada resumo traz contagem, soma, média, máximo, p50/p95/p99
+        (estimados pelos baldes) e a contagem por balde, em milissegundos.
+        """
+        return self._metricas.resumo()
+    
+    def fechar(self):
+        """Encerra as threads de segundo plano e grava as alterações pendentes"""
+        atexit.unregister(self.fechar)
+        if self._tabela is not None:
+            self._tabela.fechar()
+            self._tabela = None
+        if self._thread_metricas is not None:
+            self._parar_metricas.set()
+            self._thread_metricas.join()
+            self._thread_metricas = None
+            self._metricas.gravar(self.arquivo_metricas)
+        with self._lock_thread_reservas:
+            if self._thread_reservas is not None:
+                self._parar_reservas.set()
+                self._thread_reservas.join()
+                self._thread_reservas = None
+        if self._thread_flush is None:
+            return
+        self._parar_flush.set()
+        self._thread_flush.join()
+        self._thread_flush = None
+        self.sincronizar()
+        if self._journal is not None:
+            self._journal.fechar()
+    
+    @_instrumentar
+    def exportar_excel(self, caminho):
+        """Exporta produtos e histórico atuais para um arquivo Excel"""
+        ArmazenamentoExcel(caminho).salvar(*self._carregar_dados())
+    
+    @_instrumentar
+    @_repetir_em_conflito
+    def adicionar_produto(self, nome, descricao, preco_unitario, quantidade_estoque):
+        """Adiciona um novo produto ao sistema"""
+        # Validações de entrada
+        if not nome or not nome.strip():
+            return False, "Nome do produto não pode estar vazio!"
+        
+        if preco_unitario <= 0:
+            return False, "Preço deve ser maior que zero!"
+        
+        if quantidade_estoque < 0:
+            return False, "Quantidade em estoque não pode ser negativa!"
+        
+        # Modo síncrono: produtos não são removidos nem renomeados, então um nome já
+        # presente no catálogo em cache é recusado sem ler o armazenamento
+        if self._tabela_em_dia() and nome in self._carregar_catalogo()[2]:
+            return False, f"Produto '{nome}' já existe!"
+        
+        # Lock necessário para evitar IDs e nomes duplicados em operações concorrentes
+        with self._travar_catalogo() as estado:
+            # Verificar se produto já existe (índice de nomes normalizados)
+            if nome in estado.nomes:
                 return False, f"Produto '{nome}' já existe!"
             
             # Gerar novo ID sequencial
-            novo_id = 1 if produtos.empty else int(produtos['id_produto'].max()) + 1
-            
-            # Adicionar produto
-            novo_produto = pd.DataFrame([{
-                'id_produto': novo_id,
-                'nome': nome.strip(),
-                'descricao': descricao.strip() if descricao else '',
-                'preco_unitario': preco_unitario,
-                'quantidade_estoque': quantidade_estoque
-            }])
+            novo_id = estado.alocar_id_produto()
             
-            produtos = pd.concat([produtos, novo_produto], ignore_index=True)
-            
-            # Salvar alterações
-            self._salvar_dados(produtos, historico)
+            # Adicionar produto e salvar alterações
+            with self._travar_novos_produtos([novo_id]):
+                self._efetivar(estado, [{
+                    'operacao': 'produto',
+                    'id_produto': novo_id,
+                    'nome': nome.strip(),
+                    'descricao': descricao.strip() if descricao else '',
+                    'preco_unitario': float(preco_unitario),
+                    'quantidade_estoque': int(quantidade_estoque)
+                }])
             
             return True, f"Produto '{nome}' adicionado com sucesso! ID: {novo_id}"
     
+    @staticmethod
+    def _blocos_de_produtos(origem, tamanho_bloco):
+        """Gera blocos (DataFrames) de um CSV, de uma planilha Excel ou de um DataFrame"""
+        if isinstance(origem, pd.DataFrame):
+            dados = origem
+        else:
+            try:
+                if str(origem).lower().endswith('.csv'):
+                    # CSV: lido bloco a bloco, sem carregar o arquivo inteiro
+                    yield from pd.read_csv(origem, chunksize=tamanho_bloco, dtype={'nome': str, 'descricao': str},
+                                           keep_default_na=False, na_values={'preco_unitario': [''],
+                                                                             'quantidade_estoque': ['']})
+                    return
+                # Excel não tem leitura em blocos: a aba é lida de uma vez e validada em blocos
+                dados = pd.read_excel(origem, dtype={'nome': str, 'descricao': str})
+            except Exception as e:
+                raise Exception(f"Erro ao importar produtos: {e}")
+        dados = dados.reset_index(drop=True)
+        for inicio in range(0, len(dados), tamanho_bloco):
+            yield dados.iloc[inicio:inicio + tamanho_bloco]
+    
+    @staticmethod
+    def _validar_bloco(bloco, remover_acentos=False):
+        """Valida nome, preço e estoque de um bloco de uma vez.
+        
+        Retorna o bloco normalizado (colunas do catálogo, sem id_produto, mais `linha`
+        e `chave`) e a Series com o motivo da recusa de cada linha (NaN se válida).
+        """
+        ausentes = {'nome', 'preco_unitario', 'quantidade_estoque'} - set(bloco.columns)
+        if ausentes:
+            raise Exception(f"Erro ao importar produtos: colunas ausentes: {', '.join(sorted(ausentes))}")
+        
+        nome = bloco['nome'].fillna('').astype(str).str.strip()
+        descricao = (bloco['descricao'].fillna('').astype(str).str.strip() if 'descricao' in bloco
+                     else pd.Series('', index=bloco.index))
+        preco = pd.to_numeric(bloco['preco_unitario'], errors='coerce')
+        quantidade = pd.to_numeric(bloco['quantidade_estoque'], errors='coerce')
+        
+        # Primeiro motivo que se aplica a cada linha, na ordem de adicionar_produto
+        motivo = pd.Series(float('nan'), index=bloco.index, dtype=object)
+        for condicao, mensagem in [
+            (nome == '', "Nome do produto não pode estar vazio!"),
+            (preco.isna(), "Preço inválido!"),
+            (preco <= 0, "Preço deve ser maior que zero!"),
+            (quantidade.isna() | (quantidade % 1 != 0), "Quantidade em estoque deve ser um número inteiro!"),
+            (quantidade < 0, "Quantidade em estoque não pode ser negativa!"),
+        ]:
+            motivo = motivo.mask(condicao & motivo.isna(), mensagem)
+        
+        normalizado = pd.DataFrame({
+            # Linha na origem, contando o cabeçalho como linha 1
+            'linha': bloco.index + 2,
+            'nome': nome,
+            'descricao': descricao,
+            'preco_unitario': preco,
+            'quantidade_estoque': quantidade,
+            'chave': normalizar_nomes(nome, remover_acentos),
+        })
+        return normalizado, motivo
+    
+    @_instrumentar
+    def adicionar_produtos_em_lote(self, origem, tamanho_bloco=10_000):
+        """Importa produtos de um CSV, de uma planilha Excel ou de um DataFrame, gravando uma única vez.
+        
+        A origem precisa das colunas nome, preco_unitario e quantidade_estoque
+        (descricao é opcional). Retorna (quantidade_importada, recusas), em que recusas
+        é uma lista de dicts {'linha', 'nome', 'motivo'} na ordem da origem.
+        """
+        validos = []
+        recusas = []
+        for bloco in self._blocos_de_produtos(origem, tamanho_bloco):
+            normalizado, motivo = self._validar_bloco(bloco, self.remover_acentos)
+            recusado = motivo.notna()
+            recusas.extend(zip(normalizado['linha'][recusado], normalizado['nome'][recusado], motivo[recusado]))
+            validos.append(normalizado[~recusado])
+        
+        quantidade_importada = 0
+        candidatos = pd.concat(validos, ignore_index=True) if validos else pd.DataFrame()
+        if not candidatos.empty:
+            quantidade_importada, duplicados = self._incluir_produtos(candidatos)
+            recusas.extend(duplicados)
+        
+        recusas.sort()
+        return quantidade_importada, [{'linha': int(linha), 'nome': nome, 'motivo': motivo}
+                                      for linha, nome, motivo in recusas]
+    
+    @_repetir_em_conflito
+    def _incluir_produtos(self, candidatos):
+        """Descarta nomes repetidos (no lote ou no catálogo) e inclui o restante com IDs contíguos.
+        
+        Retorna a quantidade incluída e as recusas por nome duplicado, como (linha, nome, motivo).
+        """
+        with self._travar_catalogo() as estado:
+            duplicado = candidatos['chave'].isin(estado.nomes.chaves()) | candidatos['chave'].duplicated()
+            recusas = [(linha, nome, f"Produto '{nome}' já existe!")
+                       for linha, nome in zip(candidatos['linha'][duplicado], candidatos['nome'][duplicado])]
+            novos = candidatos[~duplicado]
+            if novos.empty:
+                return 0, recusas
+            
+            primeiro_id = estado.alocar_ids_produto(len(novos))
+            ids_produto = range(primeiro_id, primeiro_id + len(novos))
+            with self._travar_novos_produtos(ids_produto):
+                self._efetivar(estado, [
+                    {
+                        'operacao': 'produto',
+                        'id_produto': id_produto,
+                        'nome': nome,
+                        'descricao': descricao,
+                        'preco_unitario': float(preco),
+                        'quantidade_estoque': int(quantidade)
+                    }
+                    for id_produto, nome, descricao, preco, quantidade in zip(
+                        ids_produto, novos['nome'], novos['descricao'],
+                        novos['preco_unitario'], novos['quantidade_estoque'])
+                ])
+            return len(novos), recusas
+    
+    def _produtos(self):
+        """Produtos do catálogo com o estoque atual (objetos que não devem ser alterados)"""
+        if self.modo == MODO_RESIDENTE:
+            return list(self._estado.retrato().produtos.values())
+        # Modo síncrono: estoque da tabela mapeada; sem ela, recarregar apenas se
+        # outro processo gravou desde a última leitura
+        produtos = self._produtos_da_tabela()
+        if produtos is None:
+            def carregar():
+                with self._metricas.medir('carga'):
+                    return produtos_do_dataframe(self.armazenamento.carregar_produtos())
+            produtos = self._leitura_em_cache('produtos', carregar, len)
+        return produtos
+    
+    def _estoque_disponivel(self):
+        """(há produtos cadastrados, produtos com estoque > 0, DataFrame deles), uma vez por versão dos dados"""
+        def calcular():
+            produtos = self._produtos()
+            disponiveis = tuple(produto.copiar() for produto in produtos if produto.quantidade_estoque > 0)
+            df = pd.DataFrame.from_records([produto.valores() for produto in disponiveis], columns=COLUNAS_PRODUTOS)
+            return bool(produtos), disponiveis, df
+        return self._leitura_em_cache('estoque', calcular, lambda estoque: len(estoque[1]))
+    
+    @_instrumentar
+    def produtos_disponiveis(self):
+        """Retorna cópias dos produtos com estoque > 0, sem imprimir"""
+        return [produto.copiar() for produto in self._estoque_disponivel()[1]]
+    
+    @_instrumentar
+    def buscar_produto_por_nome(self, nome):
+        """Retorna uma cópia do produto com esse nome (mesma normalização da checagem de duplicatas), ou None"""
+        if self.modo == MODO_RESIDENTE:
+            id_produto = self._estado.nomes.buscar(nome)
+            produto = self._estado.retrato().produtos.get(id_produto)
+            return produto.copiar() if produto is not None else None
+        
+        # Modo síncrono: índice do catálogo em cache e estoque atual da tabela
+        if self._tabela_em_dia():
+            _, produtos, nomes = self._carregar_catalogo()
+            id_produto = nomes.buscar(nome)
+            if id_produto is None:
+                return None
+            atual = self._tabela.ler(id_produto)
+            if atual is not None:
+                produto = produtos[id_produto]
+                return Produto(id_produto, produto.nome, produto.descricao, atual[1], atual[0])
+        
+        # Sem a tabela: índice montado uma vez por versão dos dados
+        def indexar():
+            produtos = self._produtos()
+            return IndiceNomes(produtos, self.remover_acentos), {produto.id_produto: produto for produto in produtos}
+        nomes, produtos = self._leitura_em_cache('nomes', indexar, lambda indice: len(indice[1]))
+        produto = produtos.get(nomes.buscar(nome))
+        return produto.copiar() if produto is not None else None
+    
+    @_instrumentar
     def listar_estoque(self):
         """Lista produtos disponíveis em estoque"""
-        produtos, _ = self._carregar_dados()
-        
-        if produtos.empty:
+        # Filtrados apenas produtos com estoque > 0; sem gravações desde a última
+        # listagem, o resultado vem do cache
+        cadastrados, produtos_disponiveis, df = self._estoque_disponivel()
+        if not cadastrados:
             print("\nNenhum produto cadastrado no sistema.")
             return pd.DataFrame()
         
-        # Filtrar apenas produtos com estoque > 0
-        produtos_disponiveis = produtos[produtos['quantidade_estoque'] > 0].copy()
-        
         print("\nESTOQUE DISPONIVEL")
         print("=" * 80)
         
-        if produtos_disponiveis.empty:
+        if not produtos_disponiveis:
             print("Nenhum produto disponível em estoque.")
             return pd.DataFrame()
         
-        for _, produto in produtos_disponiveis.iterrows():
-            print(f"ID: {int(produto['id_produto'])} | "
-                  f"{produto['nome']} | "
-                  f"R$ {produto['preco_unitario']:.2f} | "
-                  f"Estoque: {int(produto['quantidade_estoque'])} unidades")
-            if produto['descricao']:
-                print(f"   Descrição: {produto['descricao']}")
+        for produto in produtos_disponiveis:
+            print(f"ID: {int(produto.id_produto)} | "
+                  f"{produto.nome} | "
+                  f"R$ {produto.preco_unitario:.2f} | "
+                  f"Estoque: {int(produto.quantidade_estoque)} unidades")
+            if produto.descricao:
+                print(f"   Descrição: {produto.descricao}")
             print("-" * 80)
         
-        return produtos_disponiveis
+        return df.copy()
     
+    def _validar_pedido(self, id_produto, produto, quantidade_pedida, quantidade_disponivel):
+        """Retorna a mensagem de erro do pedido, ou None se ele for válido"""
+        if quantidade_pedida <= 0:
+            return "Quantidade deve ser maior que zero!"
+        
+        # Validação: Produto existe?
+        if produto is None:
+            return f"Produto com ID {id_produto} não existe!"
+        
+        # Validação: Quantidade disponível em estoque?
+        if quantidade_disponivel == 0:
+            return f"Produto '{produto.nome}' está fora de estoque!"
+        
+        if quantidade_pedida > quantidade_disponivel:
+            return f"Quantidade solicitada ({quantidade_pedida}) maior que disponível ({quantidade_disponivel})!"
+        
+        return None
+    
+    def _montar_pedido(self, estado, produto, quantidade_pedida, descricao_pedido):
+        """Cria o registro de um novo pedido (alocando seu ID)"""
+        return {
+            'operacao': 'pedido',
+            'id_pedido': estado.alocar_id_pedido(),
+            'id_produto': int(produto.id_produto),
+            'nome_produto': produto.nome,
+            'descricao_pedido': descricao_pedido if descricao_pedido else f"Pedido de {quantidade_pedida}x {produto.nome}",
+            'quantidade_pedida': int(quantidade_pedida),
+            'preco_unitario': float(produto.preco_unitario),
+            'valor_total': float(quantidade_pedida * produto.preco_unitario),
+            'data_pedido': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'status': 'ativo'
+        }
+    
+    @staticmethod
+    def _mensagem_pedido(registro):
+        """Mensagem de sucesso de um pedido"""
+        return f"Pedido #{registro['id_pedido']} realizado com sucesso!\n" \
+               f"   Produto: {registro['nome_produto']}\n" \
+               f"   Quantidade: {registro['quantidade_pedida']}\n" \
+               f"   Valor total: R$ {registro['valor_total']:.2f}"
+    
+    @_instrumentar
+    @_repetir_em_conflito
     def fazer_pedido(self, id_produto, quantidade_pedida, descricao_pedido=""):
         """Faz um pedido de produto"""
         
@@ -132,156 +871,448 @@ class SistemaPedidos:
         if quantidade_pedida <= 0:
             return False, "Quantidade deve ser maior que zero!"
         
-        # Lock crítico para garantir atomicidade da operação
-        with self.lock:
-            produtos, historico = self._carregar_dados()
-            
-            # Validação: Produto existe?
-            if produtos.empty or id_produto not in produtos['id_produto'].values:
-                return False, f"Produto com ID {id_produto} não existe!"
+        # Modo síncrono: recusar pela tabela de estoque, sem ler o armazenamento
+        if self._tabela is not None:
+            erro = self._recusar_pela_tabela(id_produto, quantidade_pedida)
+            if erro:
+                return False, erro
+        
+        # Lock crítico (do produto, no modo residente) para garantir atomicidade da operação
+        with self._travar_produtos([id_produto]) as estado:
+            produto = estado.produtos.get(id_produto)
+            quantidade_disponivel = 0
+            if produto is not None:
+                # Estoque reservado por outros clientes não está disponível
+                quantidade_disponivel = int(produto.quantidade_estoque) - self._reservas.reservado(id_produto)
             
-            produto = produtos[produtos['id_produto'] == id_produto].iloc[0]
+            erro = self._validar_pedido(id_produto, produto, quantidade_pedida, quantidade_disponivel)
+            if erro:
+                return False, erro
             
-            # Validação: Quantidade disponível em estoque?
-            quantidade_disponivel = int(produto['quantidade_estoque'])
+            # Criar o pedido, atualizar estoque e salvar atomicamente
+            registro = self._montar_pedido(estado, produto, quantidade_pedida, descricao_pedido)
+            self._efetivar(estado, [registro])
             
-            if quantidade_disponivel == 0:
-                return False, f"Produto '{produto['nome']}' está fora de estoque!"
+            return True, self._mensagem_pedido(registro)
+    
+    @_instrumentar
+    @_repetir_em_conflito
+    def fazer_pedidos_em_lote(self, pedidos):
+        """Faz vários pedidos de uma vez: valida todos sobre o mesmo estado e persiste uma única vez.
+        
+        Recebe uma lista de tuplas (id_produto, quantidade, descricao) e retorna, na mesma
+        ordem, uma lista de (sucesso, mensagem) como a de fazer_pedido.
+        """
+        pedidos = [(item[0], item[1], item[2] if len(item) > 2 else "") for item in pedidos]
+        resultados = []
+        registros = []
+        
+        with self._travar_produtos([id_produto for id_produto, _, _ in pedidos]) as estado:
+            # Estoque consumido pelos itens anteriores do próprio lote
+            consumido = {}
             
-            if quantidade_pedida > quantidade_disponivel:
-                return False, f"Quantidade solicitada ({quantidade_pedida}) maior que disponível ({quantidade_disponivel})!"
+            for id_produto, quantidade_pedida, descricao_pedido in pedidos:
+                produto = estado.produtos.get(id_produto)
+                quantidade_disponivel = 0
+                if produto is not None:
+                    quantidade_disponivel = (int(produto.quantidade_estoque) - consumido.get(id_produto, 0)
+                                             - self._reservas.reservado(id_produto))
+                
+                erro = self._validar_pedido(id_produto, produto, quantidade_pedida, quantidade_disponivel)
+                if erro:
+                    resultados.append((False, erro))
+                    continue
+                
+                registro = self._montar_pedido(estado, produto, quantidade_pedida, descricao_pedido)
+                consumido[id_produto] = consumido.get(id_produto, 0) + quantidade_pedida
+                registros.append(registro)
+                resultados.append((True, self._mensagem_pedido(registro)))
             
-            # Criar o pedido
-            novo_id_pedido = 1 if historico.empty else int(historico['id_pedido'].max()) + 1
-            valor_total = quantidade_pedida * produto['preco_unitario']
+            # Group commit: um único registro no diário e uma única gravação
+            if registros:
+                self._efetivar(estado, registros)
+        
+        return resultados
+    
+    @_instrumentar
+    @_repetir_em_conflito
+    def fazer_pedido_multiplo(self, itens, descricao_pedido=""):
+        """Faz um pedido com vários itens, todos ou nenhum.
+        
+        Recebe uma lista de (id_produto, quantidade). Todos os itens são validados
+        sobre o mesmo estado; se algum for recusado, nenhum estoque é alterado. Cada
+        item vira um pedido no histórico, gravados juntos (uma entrada no diário e
+        uma gravação). Retorna (sucesso, mensagem) como fazer_pedido.
+        """
+        itens = [(id_produto, quantidade_pedida) for id_produto, quantidade_pedida in itens]
+        if not itens:
+            return False, "O pedido deve ter ao menos um item!"
+        
+        for posicao, (id_produto, quantidade_pedida) in enumerate(itens, 1):
+            if quantidade_pedida <= 0:
+                return False, f"Item {posicao}: Quantidade deve ser maior que zero!"
             
-            novo_pedido = pd.DataFrame([{
-                'id_pedido': novo_id_pedido,
-                'id_produto': id_produto,
-                'nome_produto': produto['nome'],
-                'descricao_pedido': descricao_pedido if descricao_pedido else f"Pedido de {quantidade_pedida}x {produto['nome']}",
-                'quantidade_pedida': quantidade_pedida,
-                'preco_unitario': produto['preco_unitario'],
-                'valor_total': valor_total,
-                'data_pedido': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'status': 'ativo'
-            }])
+            # Modo síncrono: recusar pela tabela de estoque, sem ler o armazenamento
+            if self._tabela is not None:
+                erro = self._recusar_pela_tabela(id_produto, quantidade_pedida)
+                if erro:
+                    return False, f"Item {posicao}: {erro}"
+        
+        # Locks dos produtos em ordem canônica (ver _travar_produtos): carrinhos com os
+        # mesmos produtos em ordens diferentes não se bloqueiam mutuamente
+        with self._travar_produtos([id_produto for id_produto, _ in itens]) as estado:
+            # Validar todos os itens antes de alocar qualquer ID de pedido
+            consumido = {}
+            for posicao, (id_produto, quantidade_pedida) in enumerate(itens, 1):
+                produto = estado.produtos.get(id_produto)
+                quantidade_disponivel = 0
+                if produto is not None:
+                    quantidade_disponivel = (int(produto.quantidade_estoque) - consumido.get(id_produto, 0)
+                                             - self._reservas.reservado(id_produto))
+                
+                erro = self._validar_pedido(id_produto, produto, quantidade_pedida, quantidade_disponivel)
+                if erro:
+                    return False, f"Item {posicao}: {erro}"
+                consumido[id_produto] = consumido.get(id_produto, 0) + quantidade_pedida
             
-            # Adicionar pedido ao histórico
-            historico = pd.concat([historico, novo_pedido], ignore_index=True)
+            registros = [self._montar_pedido(estado, estado.produtos[id_produto], quantidade_pedida, descricao_pedido)
+                         for id_produto, quantidade_pedida in itens]
+            self._efetivar(estado, registros)
+        
+        ids_pedidos = ', '.join(f"#{registro['id_pedido']}" for registro in registros)
+        valor_total = sum(registro['valor_total'] for registro in registros)
+        return True, f"Pedido com {len(registros)} item(ns) realizado com sucesso!\n" \
+                     f"   Pedidos: {ids_pedidos}\n" \
+                     f"   Valor total: R$ {valor_total:.2f}"
+    
+    @contextmanager
+    def _travar_estoque(self, id_produto):
+        """Bloqueia o produto e entrega (produto, quantidade_estoque), lendo o mínimo possível.
+        
+        No modo síncrono usa a tabela de estoque quando ela está em dia; sem ela, lê
+        do armazenamento apenas a linha do produto.
+        """
+        if self.modo == MODO_RESIDENTE:
+            with self._travar_produtos([id_produto]) as estado:
+                produto = estado.produtos.get(id_produto)
+                yield produto, int(produto.quantidade_estoque) if produto is not None else 0
+            return
+        with ExitStack() as pilha:
+            with self._metricas.medir('espera_lock'):
+                pilha.enter_context(self.lock)
+            em_dia = self._tabela_em_dia()
+            if em_dia:
+                produto = self._produtos_do_catalogo().get(id_produto)
+                atual = self._tabela.ler(id_produto) if isinstance(id_produto, int) else None
+            if not em_dia or (produto is None) != (atual is None):
+                # Sem tabela, ou produto recém-incluído por outro processo: só a linha do produto
+                with self._metricas.medir('carga'):
+                    produto = next(iter(produtos_do_dataframe(self.armazenamento.buscar_produto(id_produto))), None)
+                atual = (produto.quantidade_estoque, produto.preco_unitario) if produto is not None else None
+            yield produto, int(atual[0]) if atual is not None else 0
+    
+    @_instrumentar
+    def reservar_estoque(self, id_produto, quantidade, ttl=300.0):
+        """Reserva estoque por ttl segundos, para confirmar o pedido depois (ex.: após o pagamento).
+        
+        Retorna (True, token) ou (False, mensagem de erro). O token é usado em
+        confirmar_reserva ou liberar_reserva; sem isso, a reserva expira e o estoque
+        volta a ficar disponível. As reservas valem neste processo.
+        """
+        if quantidade <= 0:
+            return False, "Quantidade deve ser maior que zero!"
+        
+        if ttl <= 0:
+            return False, "Validade da reserva deve ser maior que zero!"
+        
+        # Sob o lock do produto, para não prometer estoque que um pedido está consumindo
+        with self._travar_estoque(id_produto) as (produto, quantidade_estoque):
+            quantidade_disponivel = quantidade_estoque - self._reservas.reservado(id_produto)
+            erro = self._validar_pedido(id_produto, produto, quantidade, quantidade_disponivel)
+            if erro:
+                return False, erro
+            token = self._reservas.criar(id_produto, int(quantidade), ttl)
+        
+        self._iniciar_varredura_reservas()
+        return True, token
+    
+    @_instrumentar
+    @_repetir_em_conflito
+    def confirmar_reserva(self, token, descricao_pedido=""):
+        """Transforma uma reserva válida em pedido (mesmo retorno de fazer_pedido)"""
+        reserva = self._reservas.buscar(token)
+        if reserva is None:
+            return False, "Reserva não encontrada ou expirada!"
+        
+        with self._travar_produtos([reserva.id_produto]) as estado:
+            # Retirada sob o lock: uma confirmação simultânea ou a expiração não a usam de novo
+            reserva = self._reservas.retirar(token)
+            if reserva is None:
+                return False, "Reserva não encontrada ou expirada!"
+            try:
+                produto = estado.produtos.get(reserva.id_produto)
+                quantidade_disponivel = 0
+                if produto is not None:
+                    quantidade_disponivel = (int(produto.quantidade_estoque)
+                                             - self._reservas.reservado(reserva.id_produto))
+                
+                # Só falha se outro processo consumiu o estoque (reservas valem por processo)
+                erro = self._validar_pedido(reserva.id_produto, produto, reserva.quantidade, quantidade_disponivel)
+                if erro:
+                    return False, erro
+                
+                registro = self._montar_pedido(estado, produto, reserva.quantidade, descricao_pedido)
+                self._efetivar(estado, [registro])
+            except Exception:
+                # Gravação falhou (ou conflito, que será repetido): a reserva continua valendo
+                self._reservas.devolver(reserva)
+                raise
             
-            # Atualizar estoque (operação crítica)
-            produtos.loc[produtos['id_produto'] == id_produto, 'quantidade_estoque'] -= quantidade_pedida
+            return True, self._mensagem_pedido(registro)
+    
+    @_instrumentar
+    def liberar_reserva(self, token):
+        """Desiste de uma reserva, devolvendo o estoque imediatamente"""
+        reserva = self._reservas.retirar(token)
+        if reserva is None:
+            return False, "Reserva não encontrada ou expirada!"
+        return True, f"Reserva de {reserva.quantidade} unidade(s) do produto {reserva.id_produto} liberada."
+    
+    @staticmethod
+    def _imprimir_pedido(pedido):
+        """Imprime um pedido do histórico"""
+        status_symbol = "[ATIVO]" if pedido.status == 'ativo' else "[CANCELADO]"
+        print(f"{status_symbol} Pedido #{int(pedido.id_pedido)} | "
+              f"{pedido.nome_produto} | "
+              f"Qtd: {int(pedido.quantidade_pedida)} | "
+              f"R$ {pedido.valor_total:.2f}")
+        print(f"   Descrição: {pedido.descricao_pedido}")
+        print(f"   Data: {pedido.data_pedido} | Status: {pedido.status.upper()}")
+        print("-" * 80)
+    
+    @staticmethod
+    def _normalizar_data(valor, fim_do_dia):
+        """Converte date/datetime/str no formato de data_pedido, para comparação direta"""
+        if valor is None:
+            return None
+        if isinstance(valor, datetime):
+            return valor.strftime('%Y-%m-%d %H:%M:%S')
+        if isinstance(valor, date):
+            valor = valor.strftime('%Y-%m-%d')
+        if len(valor) == 10:
+            return valor + (' 23:59:59' if fim_do_dia else ' 00:00:00')
+        return valor
+    
+    def _carregar_pagina(self, apos, quantidade, desde, ate):
+        """Página do histórico lida do armazenamento, como tupla de Pedido"""
+        with self._metricas.medir('carga'):
+            historico = self.armazenamento.carregar_pagina_historico(apos, quantidade, desde, ate)
+        return tuple(pedidos_do_dataframe(historico))
+    
+    def iterar_historico(self, apenas_ativos=False, desde=None, ate=None, limite=None, cursor=None,
+                         tamanho_pagina=100):
+        """Gera páginas do histórico em ordem de id_pedido, sem materializar o histórico inteiro.
+        
+        Cada página é uma lista de até `tamanho_pagina` pedidos (Pedido, imutáveis). A
+        paginação é por chave: `cursor` é o último id_pedido já visto, e a próxima página
+        começa após ele. `desde`/`ate` filtram data_pedido (date, datetime ou texto).
+        """
+        desde = self._normalizar_data(desde, fim_do_dia=False)
+        ate = self._normalizar_data(ate, fim_do_dia=True)
+        if self.modo == MODO_RESIDENTE:
+            # Todas as páginas vêm do mesmo retrato
+            pedidos_apos = self._estado.retrato().pedidos_apos
+        else:
+            # Modo síncrono: o armazenamento lê só a página após o cursor (ex.: LIMIT no
+            # SQLite, poda de partições no Parquet); cada página fica em cache até a
+            # próxima gravação
+            def pedidos_apos(id_pedido):
+                while True:
+                    chave = ('historico', desde, ate, id_pedido, tamanho_pagina)
+                    pagina = self._leitura_em_cache(chave, functools.partial(
+                        self._carregar_pagina, id_pedido, tamanho_pagina, desde, ate), len)
+                    yield from pagina
+                    if len(pagina) < tamanho_pagina:
+                        return
+                    id_pedido = pagina[-1].id_pedido
+        restantes = limite
+        cursor = cursor or 0
+        
+        while restantes is None or restantes > 0:
+            tamanho = tamanho_pagina if restantes is None else min(tamanho_pagina, restantes)
+            pagina = []
+            # Cada página é uma operação nas métricas; o tempo do consumidor entre
+            # páginas fica de fora
+            with self._metricas.operacao('iterar_historico'):
+                for pedido in pedidos_apos(cursor):
+                    cursor = pedido.id_pedido
+                    if apenas_ativos and pedido.status != 'ativo':
+                        continue
+                    if desde is not None and pedido.data_pedido < desde:
+                        continue
+                    if ate is not None and pedido.data_pedido > ate:
+                        continue
+                    pagina.append(pedido)
+                    if len(pagina) == tamanho:
+                        break
             
-            # Salvar todas as alterações atomicamente
-            self._salvar_dados(produtos, historico)
+            if not pagina:
+                return
+            yield pagina
+            if restantes is not None:
+                restantes -= len(pagina)
             
-            return True, f"Pedido #{novo_id_pedido} realizado com sucesso!\n" \
-                        f"   Produto: {produto['nome']}\n" \
-                        f"   Quantidade: {quantidade_pedida}\n" \
-                        f"   Valor total: R$ {valor_total:.2f}"
+            # Página incompleta: não há mais pedidos após o cursor
+            if len(pagina) < tamanho:
+                return
     
+    @_instrumentar
     def ver_historico(self, apenas_ativos=False):
         """Mostra histórico de pedidos"""
-        _, historico = self._carregar_dados()
+        titulo = "PEDIDOS ATIVOS" if apenas_ativos else "HISTÓRICO COMPLETO DE PEDIDOS"
         
-        if historico.empty:
+        if next(self.iterar_historico(limite=1), None) is None:
             print("\nNenhum pedido encontrado no histórico.")
             return pd.DataFrame()
         
-        # Filtrar se necessário
-        if apenas_ativos:
-            pedidos_filtrados = historico[historico['status'] == 'ativo']
-            titulo = "PEDIDOS ATIVOS"
-        else:
-            pedidos_filtrados = historico
-            titulo = "HISTÓRICO COMPLETO DE PEDIDOS"
-        
-        if pedidos_filtrados.empty:
-            print(f"\n{titulo}")
-            print("=" * 80)
-            print("Nenhum pedido encontrado.")
-            return pd.DataFrame()
-        
         print(f"\n{titulo}")
         print("=" * 80)
         
-        for _, pedido in pedidos_filtrados.iterrows():
-            status_symbol = "[ATIVO]" if pedido['status'] == 'ativo' else "[CANCELADO]"
-            print(f"{status_symbol} Pedido #{int(pedido['id_pedido'])} | "
-                  f"{pedido['nome_produto']} | "
-                  f"Qtd: {int(pedido['quantidade_pedida'])} | "
-                  f"R$ {pedido['valor_total']:.2f}")
-            print(f"   Descrição: {pedido['descricao_pedido']}")
-            print(f"   Data: {pedido['data_pedido']} | Status: {pedido['status'].upper()}")
-            print("-" * 80)
+        pedidos_filtrados = []
+        for pagina in self.iterar_historico(apenas_ativos=apenas_ativos):
+            for pedido in pagina:
+                self._imprimir_pedido(pedido)
+                pedidos_filtrados.append(pedido)
+        
+        if not pedidos_filtrados:
+            print("Nenhum pedido encontrado.")
+            return pd.DataFrame()
         
-        return pedidos_filtrados
+        return pd.DataFrame.from_records(pedidos_filtrados, columns=COLUNAS_HISTORICO)
     
+    @_instrumentar
+    @_repetir_em_conflito
     def cancelar_pedido(self, id_pedido):
         """Cancela um pedido e restaura o estoque"""
         # Lock necessário para operação atômica de cancelamento
-        with self.lock:
-            produtos, historico = self._carregar_dados()
-            
-            if historico.empty:
+        with self._travar_pedido(id_pedido) as (estado, pedido):
+            if not estado.possui_pedidos():
                 return False, "Nenhum pedido encontrado!"
             
-            # Encontrar o pedido
-            pedido_mask = historico['id_pedido'] == id_pedido
-            if not pedido_mask.any():
+            if pedido is None:
                 return False, f"Pedido #{id_pedido} não encontrado!"
             
-            pedido = historico[pedido_mask].iloc[0]
-            
-            if pedido['status'] != 'ativo':
+            if pedido.status != 'ativo':
                 return False, f"Pedido #{id_pedido} já foi cancelado!"
             
-            # Cancelar pedido
-            historico.loc[pedido_mask, 'status'] = 'cancelado'
-            
-            # Restaurar estoque (operação crítica)
-            produtos.loc[produtos['id_produto'] == pedido['id_produto'], 'quantidade_estoque'] += pedido['quantidade_pedida']
-            
-            # Salvar alterações atomicamente
-            self._salvar_dados(produtos, historico)
+            # Cancelar pedido, restaurar estoque e salvar atomicamente
+            self._efetivar(estado, [{
+                'operacao': 'cancelamento',
+                'id_pedido': int(id_pedido),
+                'id_produto': int(pedido.id_produto),
+                'quantidade_pedida': int(pedido.quantidade_pedida)
+            }])
             
             return True, f"Pedido #{id_pedido} cancelado com sucesso!\n" \
-                        f"   Estoque de '{pedido['nome_produto']}' foi restaurado."
+                        f"   Estoque de '{pedido.nome_produto}' foi restaurado."
     
+    @_instrumentar
     def obter_estatisticas(self):
         """Retorna estatísticas do sistema"""
-        produtos, historico = self._carregar_dados()
+        # Recalcular apenas se os dados mudaram desde a última leitura
+        if self.modo == MODO_RESIDENTE:
+            calcular = self._estado.estatisticas_publicadas
+        else:
+            calcular = self._estatisticas_gravadas
+        return dict(self._leitura_em_cache('estatisticas', calcular))
+    
+    def _estatisticas_gravadas(self):
+        """Estatísticas gravadas junto com a versão atual dos dados (modo síncrono).
+        
+        Cada gravação soma a elas os seus deltas (_atualizar_estatisticas). Se não
+        forem da versão atual, são recalculadas com uma varredura e gravadas.
+        """
+        versao = self._coordenacao.versao()
+        with self._metricas.medir('carga'):
+            estatisticas = self._coordenacao.estatisticas(versao)
+        if estatisticas is not None:
+            return estatisticas
+        estatisticas = self._calcular_estatisticas()
+        with self._coordenacao.travar():
+            if self._coordenacao.versao() == versao:
+                self._coordenacao.gravar_estatisticas(versao, estatisticas)
+        return estatisticas
+    
+    def _calcular_estatisticas(self):
+        """Calcula as estatísticas com uma varredura, lendo do histórico apenas as colunas usadas"""
+        # Produtos e histórico da mesma versão, mesmo com uma gravação em andamento
+        with self._metricas.medir('carga'), self.armazenamento.retrato() as leitor:
+            produtos = leitor.carregar_produtos()
+            historico = leitor.carregar_historico(['status', 'valor_total'])
+        ativos = historico[historico['status'] == 'ativo']
         
         stats = {
             'total_produtos': len(produtos),
-            'produtos_em_estoque': len(produtos[produtos['quantidade_estoque'] > 0]) if not produtos.empty else 0,
-            'produtos_sem_estoque': len(produtos[produtos['quantidade_estoque'] == 0]) if not produtos.empty else 0,
+            'produtos_em_estoque': int((produtos['quantidade_estoque'] > 0).sum()),
+            'produtos_sem_estoque': int((produtos['quantidade_estoque'] == 0).sum()),
             'total_pedidos': len(historico),
-            'pedidos_ativos': len(historico[historico['status'] == 'ativo']) if not historico.empty else 0,
-            'pedidos_cancelados': len(historico[historico['status'] == 'cancelado']) if not historico.empty else 0,
-            'valor_total_pedidos_ativos': historico[historico['status'] == 'ativo']['valor_total'].sum() if not historico.empty else 0,
-            'valor_total_geral': historico['valor_total'].sum() if not historico.empty else 0
+            'pedidos_ativos': len(ativos),
+            'pedidos_cancelados': int((historico['status'] == 'cancelado').sum()),
+            'valor_total_pedidos_ativos': float(ativos['valor_total'].sum()),
+            'valor_total_geral': float(historico['valor_total'].sum())
         }
         
         return stats
+    
+    @_instrumentar
+    def recalcular_estatisticas(self):
+        """Confere os contadores de estatísticas com uma varredura completa.
+        
+        Retorna (consistente, divergencias), onde divergencias mapeia cada contador
+        divergente para (valor_mantido, valor_recalculado). Os contadores são corrigidos.
+        No modo síncrono, os valores mantidos são as estatísticas gravadas junto com a
+        versão dos dados; havendo divergência, o cache de leituras é descartado.
+        """
+        if self.modo != MODO_RESIDENTE:
+            # Lock entre processos: contadores gravados e varredura da mesma versão
+            with self.lock, self._coordenacao.travar():
+                versao = self._coordenacao.versao()
+                recalculadas = self._calcular_estatisticas()
+                mantidas = self._coordenacao.estatisticas(versao) or recalculadas
+                divergencias = {
+                    nome: (mantidas[nome], recalculadas[nome])
+                    for nome in CONTADORES
+                    if not math.isclose(mantidas[nome], recalculadas[nome], abs_tol=1e-6)
+                }
+                self._coordenacao.gravar_estatisticas(versao, recalculadas)
+                if divergencias:
+                    self._cache_leituras.limpar()
+        else:
+            with self._travar_tudo():
+                divergencias = self._estado.recalcular_estatisticas()
+        return not divergencias, divergencias
+
+def imprimir_menu():
+    """Exibe as opções do menu principal"""
+    print("\n" + "=" * 60)
+    print("SISTEMA DE GERENCIAMENTO DE PEDIDOS")
+    print("=" * 60)
+    print("1. Listar estoque disponível")
+    print("2. Fazer pedido")
+    print("3. Ver histórico de pedidos")
+    print("4. Cancelar pedido")
+    print("5. Adicionar produto (Admin)")
+    print("6. Ver estatísticas")
+    print("7. Sair")
+    print("-" * 60)
 
 def menu_principal():
     """Interface principal do sistema"""
+    # A abertura não lê os dados: a primeira carga acontece na primeira opção escolhida
     sistema = SistemaPedidos()
     
     while True:
-        print("\n" + "=" * 60)
-        print("SISTEMA DE GERENCIAMENTO DE PEDIDOS")
-        print("=" * 60)
-        print("1. Listar estoque disponível")
-        print("2. Fazer pedido")
-        print("3. Ver histórico de pedidos")
-        print("4. Cancelar pedido")
-        print("5. Adicionar produto (Admin)")
-        print("6. Ver estatísticas")
-        print("7. Sair")
-        print("-" * 60)
+        imprimir_menu()
         
         try:
             opcao = input("Escolha uma opção (1-7): ").strip()
@@ -307,12 +1338,22 @@ def menu_principal():
                 print("2. Ver histórico completo")
                 
                 sub_opcao = input("Escolha (1-2): ").strip()
-                if sub_opcao == '1':
-                    sistema.ver_historico(apenas_ativos=True)
-                elif sub_opcao == '2':
-                    sistema.ver_historico(apenas_ativos=False)
-                else:
+                if sub_opcao not in ('1', '2'):
                     print("Opção inválida!")
+                    continue
+                
+                # Paginar o histórico em vez de imprimir tudo de uma vez
+                print(f"\n{'PEDIDOS ATIVOS' if sub_opcao == '1' else 'HISTÓRICO COMPLETO DE PEDIDOS'}")
+                print("=" * 80)
+                encontrou = False
+                for pagina in sistema.iterar_historico(apenas_ativos=(sub_opcao == '1'), tamanho_pagina=10):
+                    encontrou = True
+                    for pedido in pagina:
+                        sistema._imprimir_pedido(pedido)
+                    if input("Enter para a próxima página, 's' para sair: ").strip().lower() == 's':
+                        break
+                if not encontrou:
+                    print("Nenhum pedido encontrado.")
             
             elif opcao == '4':
                 pedidos_ativos = sistema.ver_historico(apenas_ativos=True)
@@ -362,5 +1403,52 @@ def menu_principal():
         except Exception as e:
             print(f"\nErro inesperado: {e}")
 
+def medir_inicializacao(arquivo_excel='dados/sistema_pedidos.xlsx'):
+    """Tempos (ms) da abertura do programa até o menu e até a primeira carga de dados.
+    
+    Informa também se pandas e openpyxl já estavam importados quando o menu apareceu.
+    """
+    tempos = {'importacao_ms': 1000 * _TEMPO_IMPORTACAO}
+    inicio = time.perf_counter()
+    sistema = SistemaPedidos(arquivo_excel)
+    tempos['construcao_ms'] = 1000 * (time.perf_counter() - inicio)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            inicio = time.perf_counter()
+            imprimir_menu()
+            tempos['menu_ms'] = 1000 * (time.perf_counter() - inicio)
+            tempos['ate_menu_ms'] = tempos['importacao_ms'] + tempos['construcao_ms'] + tempos['menu_ms']
+            tempos['pandas_antes_do_menu'] = 'pandas' in sys.modules
+            tempos['openpyxl_antes_do_menu'] = 'openpyxl' in sys.modules
+            # Primeira opção do menu: listar o estoque
+            inicio = time.perf_counter()
+            sistema.listar_estoque()
+            tempos['primeira_carga_ms'] = 1000 * (time.perf_counter() - inicio)
+    finally:
+        sistema.fechar()
+    return tempos
+
+def imprimir_tempos_inicializacao(tempos):
+    """Exibe o relatório de medir_inicializacao"""
+    print("TEMPO DE INICIALIZAÇÃO")
+    print("=" * 50)
+    print(f"Importação do módulo: {tempos['importacao_ms']:8.1f} ms")
+    print(f"Criação do sistema:   {tempos['construcao_ms']:8.1f} ms")
+    print(f"Exibição do menu:     {tempos['menu_ms']:8.1f} ms")
+    print(f"Total até o menu:     {tempos['ate_menu_ms']:8.1f} ms")
+    print(f"Primeira carga:       {tempos['primeira_carga_ms']:8.1f} ms (listar estoque)")
+    print(f"pandas importado antes do menu:   {'sim' if tempos['pandas_antes_do_menu'] else 'não'}")
+    print(f"openpyxl importado antes do menu: {'sim' if tempos['openpyxl_antes_do_menu'] else 'não'}")
+
+_TEMPO_IMPORTACAO = time.perf_counter() - _INICIO_IMPORTACAO
+
 if __name__ == "__main__":
-    menu_principal()
+    parser = argparse.ArgumentParser(description="Sistema de gerenciamento de pedidos")
+    parser.add_argument('--tempo-inicializacao', action='store_true',
+                        help="Mede o tempo até o menu e até a primeira carga de dados, sem abrir o menu")
+    parser.add_argument('--arquivo', default='dados/sistema_pedidos.xlsx', help="Planilha de dados")
+    args = parser.parse_args()
+    if args.tempo_inicializacao:
+        imprimir_tempos_inicializacao(medir_inicializacao(args.arquivo))
+    else:
+        menu_principal()
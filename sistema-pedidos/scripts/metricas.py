@@ -0,0 +1,128 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Fases em que o tempo de cada operação é dividido
+FASES = ['espera_lock', 'carga', 'logica', 'gravacao', 'total']
+
+# Limites superiores (ms) dos baldes dos histogramas; o último balde é ilimitado
+LIMITES_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class Histograma:
+    """Histograma de latências com baldes fixos em escala logarítmica"""
+
+    def __init__(self):
+        self.baldes = [0] * (len(LIMITES_MS) + 1)
+        self.contagem = 0
+        self.soma_ms = 0.0
+        self.maximo_ms = 0.0
+
+    def registrar(self, ms):
+        """Conta uma medição"""
+        self.baldes[bisect.bisect_left(LIMITES_MS, ms)] += 1
+        self.contagem += 1
+        self.soma_ms += ms
+        self.maximo_ms = max(self.maximo_ms, ms)
+
+    def percentil(self, p):
+        """Estimativa do percentil: limite superior do balde que o contém"""
+        alvo = p / 100 * self.contagem
+        acumulado = 0
+        for posicao, quantidade in enumerate(self.baldes):
+            acumulado += quantidade
+            if quantidade and acumulado >= alvo:
+                limite = LIMITES_MS[posicao] if posicao < len(LIMITES_MS) else self.maximo_ms
+                return min(limite, self.maximo_ms)
+        return self.maximo_ms
+
+    def resumo(self):
+        """Contagem, soma, média, máximo, percentis e baldes não vazios"""
+        nomes = [f"<={limite}" for limite in LIMITES_MS] + [f">{LIMITES_MS[-1]}"]
+        return {
+            'contagem': self.contagem,
+            'soma_ms': self.soma_ms,
+            'media_ms': self.soma_ms / self.contagem if self.contagem else 0.0,
+            'maximo_ms': self.maximo_ms,
+            'p50_ms': self.percentil(50),
+            'p95_ms': self.percentil(95),
+            'p99_ms': self.percentil(99),
+            'baldes': {nome: quantidade for nome, quantidade in zip(nomes, self.baldes) if quantidade},
+        }
+
+
+class MetricasOperacoes:
+    """Tempos por operação, divididos em espera por lock, carga, lógica e gravação.
+
+    operacao() delimita uma chamada pública; medir() soma o tempo de um trecho à
+    fase informada da operação em andamento na thread. A lógica é o restante, e as
+    fases somam o total.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogramas = {}  # operacao -> {fase: Histograma}
+        self._local = threading.local()
+
+    @contextmanager
+    def operacao(self, nome):
+        """Mede uma operação; chamadas aninhadas contam na operação externa"""
+        if getattr(self._local, 'fases', None) is not None:
+            yield
+            return
+        fases = {'espera_lock': 0.0, 'carga': 0.0, 'gravacao': 0.0}
+        self._local.fases = fases
+        self._local.abertas = set()
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            total = time.perf_counter() - inicio
+            self._local.fases = None
+            fases['logica'] = max(0.0, total - sum(fases.values()))
+            fases['total'] = total
+            with self._lock:
+                histogramas = self._histogramas.setdefault(nome, {fase: Histograma() for fase in FASES})
+                for fase, segundos in fases.items():
+                    histogramas[fase].registrar(segundos * 1000)
+
+    @contextmanager
+    def medir(self, fase):
+        """Soma a duração do trecho à fase da operação em andamento (se houver).
+        
+        Um trecho dentro de outro da mesma fase não é somado de novo: o externo já
+        inclui o tempo dele.
+        """
+        fases = getattr(self._local, 'fases', None)
+        if fases is None or fase in self._local.abertas:
+            yield
+            return
+        self._local.abertas.add(fase)
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            fases[fase] += time.perf_counter() - inicio
+            self._local.abertas.discard(fase)
+
+    def resumo(self):
+        """{operacao: {fase: resumo do histograma}}"""
+        with self._lock:
+            return {
+                operacao: {fase: histograma.resumo() for fase, histograma in histogramas.items()}
+                for operacao, histogramas in self._histogramas.items()
+            }
+
+    def gravar(self, caminho):
+        """Grava o resumo em JSON (arquivo temporário + rename)"""
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        caminho_tmp = caminho + '.tmp'
+        with open(caminho_tmp, 'w', encoding='utf-8') as arquivo:
+            json.dump({'gerado_em': time.strftime('%Y-%m-%d %H:%M:%S'), 'operacoes': self.resumo()},
+                      arquivo, ensure_ascii=False, indent=2)
+        os.replace(caminho_tmp, caminho)
@@ -0,0 +1,30 @@
+import argparse
+from armazenamento import ArmazenamentoExcel, ArmazenamentoSQLite, ArmazenamentoParquet, migrar
+
+MECANISMOS = {
+    'excel': ArmazenamentoExcel,
+    'sqlite': ArmazenamentoSQLite,
+    'parquet': ArmazenamentoParquet,
+}
+
+def main():
+    """Converte os dados do sistema entre mecanismos de armazenamento"""
+    parser = argparse.ArgumentParser(
+        description="Migra produtos e histórico entre mecanismos de armazenamento "
+                    "(ex.: dados/sistema_pedidos.xlsx -> dataset Parquet)"
+    )
+    parser.add_argument('origem', help="Caminho do armazenamento de origem")
+    parser.add_argument('destino', help="Caminho do armazenamento de destino")
+    parser.add_argument('--de', choices=MECANISMOS, default='excel', help="Mecanismo de origem (padrão: excel)")
+    parser.add_argument('--para', choices=MECANISMOS, default='parquet', help="Mecanismo de destino (padrão: parquet)")
+    args = parser.parse_args()
+
+    origem = MECANISMOS[args.de](args.origem)
+    destino = MECANISMOS[args.para](args.destino)
+    migrar(origem, destino)
+
+    produtos, historico = destino.carregar()
+    print(f"Migração concluída: {len(produtos)} produtos e {len(historico)} pedidos em {args.destino}")
+
+if __name__ == "__main__":
+    main()
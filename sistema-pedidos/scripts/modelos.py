@@ -0,0 +1,149 @@
+import re
+import unicodedata
+from collections import namedtuple
+from armazenamento import COLUNAS_PRODUTOS, COLUNAS_HISTORICO
+
+
+class Produto:
+    """Linha do catálogo em memória (com __slots__: sem dict por instância).
+
+    O estoque é alterado no lugar, sob o lock do produto. Os campos também podem
+    ser lidos pelo nome da coluna (produto['nome']).
+    """
+
+    __slots__ = tuple(COLUNAS_PRODUTOS)
+
+    def __init__(self, id_produto, nome, descricao, preco_unitario, quantidade_estoque):
+        self.id_produto = id_produto
+        self.nome = nome
+        self.descricao = descricao
+        self.preco_unitario = preco_unitario
+        self.quantidade_estoque = quantidade_estoque
+
+    @classmethod
+    def do_registro(cls, registro):
+        """Cria o produto a partir de um registro de operação"""
+        return cls(*map(registro.__getitem__, COLUNAS_PRODUTOS))
+
+    def __getitem__(self, coluna):
+        try:
+            return getattr(self, coluna)
+        except AttributeError:
+            raise KeyError(coluna) from None
+
+    def __eq__(self, outro):
+        return isinstance(outro, Produto) and self.valores() == outro.valores()
+
+    def __repr__(self):
+        return f"Produto{self.valores()!r}"
+
+    def valores(self):
+        """Campos na ordem de COLUNAS_PRODUTOS"""
+        return (self.id_produto, self.nome, self.descricao, self.preco_unitario, self.quantidade_estoque)
+
+    def copiar(self):
+        """Cópia independente (para retratos do estado)"""
+        return Produto(*self.valores())
+
+
+class Pedido(namedtuple('Pedido', COLUNAS_HISTORICO)):
+    """Linha do histórico em memória: tupla imutável com campos nomeados.
+
+    O cancelamento cria um novo Pedido (cancelado()), por isso uma cópia rasa da
+    lista do histórico é um retrato consistente. Os campos também podem ser lidos
+    pelo nome da coluna (pedido['status']).
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def do_registro(cls, registro):
+        """Cria o pedido a partir de um registro de operação"""
+        return cls._make(map(registro.__getitem__, COLUNAS_HISTORICO))
+
+    def __getitem__(self, chave):
+        if isinstance(chave, str):
+            try:
+                return getattr(self, chave)
+            except AttributeError:
+                raise KeyError(chave) from None
+        return tuple.__getitem__(self, chave)
+
+    def cancelado(self):
+        """Novo pedido igual a este, com status cancelado"""
+        return self._replace(status='cancelado')
+
+
+# Sinais diacríticos combinantes (acentos, cedilha, til) após a decomposição NFKD
+_DIACRITICOS = re.compile('[\u0300-\u036f]')
+
+
+def normalizar_nome(nome, remover_acentos=False):
+    """Chave de comparação de nomes de produto: sem espaços nas pontas e em minúsculas.
+
+    Com remover_acentos, 'Café' e 'cafe' têm a mesma chave.
+    """
+    vazio = nome is None or nome != nome  # None ou NaN vindo do pandas
+    nome = unicodedata.normalize('NFC', '' if vazio else str(nome).strip()).lower()
+    if remover_acentos:
+        nome = _DIACRITICOS.sub('', unicodedata.normalize('NFKD', nome))
+    return nome
+
+
+def normalizar_nomes(nomes, remover_acentos=False):
+    """normalizar_nome aplicado a uma Series de nomes, por coluna"""
+    nomes = nomes.fillna('').astype(str).str.strip().str.normalize('NFC').str.lower()
+    if remover_acentos:
+        nomes = nomes.str.normalize('NFKD').str.replace(_DIACRITICOS, '', regex=True)
+    return nomes
+
+
+class IndiceNomes:
+    """Nome normalizado -> id_produto, para checar duplicatas e buscar por nome em O(1).
+
+    Se o catálogo já tiver nomes com a mesma chave (ex.: acentos removidos depois de
+    cadastrados), vale o produto de menor id.
+    """
+
+    def __init__(self, produtos=(), remover_acentos=False):
+        self.remover_acentos = remover_acentos
+        self._ids = {}
+        for produto in sorted(produtos, key=lambda produto: produto.id_produto):
+            self.adicionar(produto.nome, produto.id_produto)
+
+    def chave(self, nome):
+        return normalizar_nome(nome, self.remover_acentos)
+
+    def adicionar(self, nome, id_produto):
+        self._ids.setdefault(self.chave(nome), id_produto)
+
+    def buscar(self, nome):
+        """id_produto com esse nome, ou None"""
+        return self._ids.get(self.chave(nome))
+
+    def chaves(self):
+        return self._ids.keys()
+
+    def __contains__(self, nome):
+        return self.chave(nome) in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+
+def _tuplas_do_dataframe(df, colunas):
+    """Linhas do DataFrame como tuplas de tipos nativos do Python (NaN vira None)"""
+    if df.empty:
+        return []
+    df = df[colunas]
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+
+def produtos_do_dataframe(df):
+    """Converte um DataFrame de produtos em uma lista de Produto"""
+    return [Produto(*valores) for valores in _tuplas_do_dataframe(df, COLUNAS_PRODUTOS)]
+
+
+def pedidos_do_dataframe(df):
+    """Converte um DataFrame de histórico em uma lista de Pedido"""
+    return list(map(Pedido._make, _tuplas_do_dataframe(df, COLUNAS_HISTORICO)))
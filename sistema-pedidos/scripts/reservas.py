@@ -0,0 +1,92 @@
+import heapq
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+# expira_em no relógio monotônico (time.monotonic), imune a ajustes do relógio do sistema
+Reserva = namedtuple('Reserva', ['token', 'id_produto', 'quantidade', 'expira_em'])
+
+
+class Reservas:
+    """Reservas de estoque em memória, com validade.
+
+    Guarda por produto o total reservado, para que pedidos e novas reservas
+    descontem do estoque o que já está prometido. Cada operação é uma atualização
+    de contadores sob um lock curto; a validação contra o estoque fica com quem
+    chama, sob o lock do produto.
+    """
+
+    def __init__(self, relogio=time.monotonic):
+        self._relogio = relogio
+        self._lock = threading.Lock()
+        self._reservas = {}     # token -> Reserva
+        self._reservado = {}    # id_produto -> quantidade reservada
+        self._vencimentos = []  # heap de (expira_em, token); entradas já retiradas são ignoradas
+
+    def _remover(self, reserva):
+        """Remove a reserva e desconta o total do produto (chamar com o lock)"""
+        del self._reservas[reserva.token]
+        restante = self._reservado[reserva.id_produto] - reserva.quantidade
+        if restante:
+            self._reservado[reserva.id_produto] = restante
+        else:
+            del self._reservado[reserva.id_produto]
+
+    def _expirar_vencidas(self):
+        """Remove as reservas vencidas (chamar com o lock); retorna quantas foram removidas"""
+        agora = self._relogio()
+        removidas = 0
+        while self._vencimentos and self._vencimentos[0][0] <= agora:
+            expira_em, token = heapq.heappop(self._vencimentos)
+            reserva = self._reservas.get(token)
+            if reserva is not None and reserva.expira_em == expira_em:
+                self._remover(reserva)
+                removidas += 1
+        return removidas
+
+    def criar(self, id_produto, quantidade, ttl):
+        """Registra uma reserva válida por ttl segundos e retorna seu token"""
+        with self._lock:
+            reserva = Reserva(uuid.uuid4().hex, id_produto, quantidade, self._relogio() + ttl)
+            self._reservas[reserva.token] = reserva
+            self._reservado[id_produto] = self._reservado.get(id_produto, 0) + quantidade
+            heapq.heappush(self._vencimentos, (reserva.expira_em, reserva.token))
+            return reserva.token
+
+    def buscar(self, token):
+        """Reserva ainda válida com esse token, ou None"""
+        with self._lock:
+            self._expirar_vencidas()
+            return self._reservas.get(token)
+
+    def reservado(self, id_produto):
+        """Quantidade do produto comprometida com reservas válidas"""
+        with self._lock:
+            self._expirar_vencidas()
+            return self._reservado.get(id_produto, 0)
+
+    def retirar(self, token):
+        """Remove e retorna a reserva válida com esse token, ou None"""
+        with self._lock:
+            self._expirar_vencidas()
+            reserva = self._reservas.get(token)
+            if reserva is not None:
+                self._remover(reserva)
+            return reserva
+
+    def devolver(self, reserva):
+        """Restaura uma reserva retirada (ex.: a confirmação falhou ao gravar)"""
+        with self._lock:
+            self._reservas[reserva.token] = reserva
+            self._reservado[reserva.id_produto] = self._reservado.get(reserva.id_produto, 0) + reserva.quantidade
+            heapq.heappush(self._vencimentos, (reserva.expira_em, reserva.token))
+
+    def expirar(self):
+        """Libera o estoque das reservas vencidas; retorna quantas foram liberadas"""
+        with self._lock:
+            return self._expirar_vencidas()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._reservas)
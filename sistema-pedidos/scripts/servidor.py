@@ -0,0 +1,281 @@
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from main import SistemaPedidos, MODO_SINCRONO, MODO_RESIDENTE
+from armazenamento import COLUNAS_PRODUTOS
+
+# Pedidos por resposta de GET /historico: padrão sem `limite` e teto para o informado
+LIMITE_HISTORICO = 100
+LIMITE_MAXIMO_HISTORICO = 1000
+
+
+class _Grupo:
+    """Leitura compartilhada pelas requisições que chegaram na mesma janela"""
+
+    def __init__(self):
+        self.pronto = threading.Event()
+        self.resultado = None
+        self.erro = None
+
+
+class LeiturasAgrupadas:
+    """Agrupa leituras iguais que chegam dentro de uma janela de tempo.
+
+    A primeira requisição de cada chave espera `janela` segundos e então executa a
+    leitura uma vez; as que chegaram nesse intervalo recebem o mesmo resultado (o
+    mesmo retrato dos dados). As que chegam depois do início da execução formam um
+    novo grupo, para nunca receberem dados anteriores à sua chegada.
+    """
+
+    def __init__(self, janela=0.005):
+        self.janela = janela
+        self._lock = threading.Lock()
+        self._grupos = {}  # chave -> _Grupo aguardando execução
+        self.execucoes = 0
+
+    def obter(self, chave, funcao):
+        with self._lock:
+            grupo = self._grupos.get(chave)
+            lider = grupo is None
+            if lider:
+                grupo = self._grupos[chave] = _Grupo()
+
+        if not lider:
+            grupo.pronto.wait()
+        else:
+            if self.janela > 0:
+                time.sleep(self.janela)
+            with self._lock:
+                del self._grupos[chave]
+                self.execucoes += 1
+            try:
+                grupo.resultado = funcao()
+            except Exception as e:
+                grupo.erro = e
+            finally:
+                grupo.pronto.set()
+
+        if grupo.erro is not None:
+            raise grupo.erro
+        return grupo.resultado
+
+
+class ServidorHTTP(HTTPServer):
+    """HTTPServer que atende as conexões num pool limitado de threads"""
+
+    def __init__(self, endereco, tratador, max_workers=8):
+        super().__init__(endereco, tratador)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='servidor-pedidos')
+
+    def process_request(self, request, client_address):
+        self._executor.submit(self._atender, request, client_address)
+
+    def _atender(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=True)
+
+
+def _para_json(valor):
+    """Converte escalares do numpy (estatísticas calculadas com pandas) para JSON"""
+    if hasattr(valor, 'item'):
+        return valor.item()
+    raise TypeError(f"Objeto não serializável: {type(valor).__name__}")
+
+
+def _inteiro(parametros, nome):
+    valor = parametros.get(nome)
+    return int(valor) if valor not in (None, '') else None
+
+
+class TratadorPedidos(BaseHTTPRequestHandler):
+    """Rotas JSON sobre o SistemaPedidos do servidor.
+
+        GET  /estoque                      produtos com estoque > 0
+        GET  /historico                    ?apenas_ativos=1&desde=&ate=&limite=&cursor=
+                                           (até LIMITE_HISTORICO pedidos por resposta)
+        GET  /estatisticas
+        POST /pedidos                      {"id_produto", "quantidade", "descricao"}
+                                           ou {"itens": [{"id_produto", "quantidade"}], "descricao"}
+        POST /pedidos/<id>/cancelar
+        POST /reservas                     {"id_produto", "quantidade", "ttl"} -> {"token"}
+        POST /reservas/<token>/confirmar   {"descricao"}
+        POST /reservas/<token>/liberar
+    """
+
+    # HTTP/1.0: a conexão fecha após a resposta e não prende uma thread do pool
+    protocol_version = 'HTTP/1.0'
+    servico = None  # ServicoPedidos, definido por criar_servidor
+
+    def log_message(self, formato, *args):
+        if self.servico.log:
+            super().log_message(formato, *args)
+
+    def _responder(self, status, corpo):
+        dados = json.dumps(corpo, ensure_ascii=False, default=_para_json).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _corpo(self):
+        tamanho = int(self.headers.get('Content-Length') or 0)
+        if not tamanho:
+            return {}
+        corpo = json.loads(self.rfile.read(tamanho))
+        if not isinstance(corpo, dict):
+            raise ValueError("O corpo deve ser um objeto JSON")
+        return corpo
+
+    def _tratar(self, rota):
+        try:
+            status, corpo = rota()
+        except (ValueError, KeyError, TypeError) as e:
+            status, corpo = 400, {'erro': f"Requisição inválida: {e}"}
+        except Exception as e:
+            status, corpo = 500, {'erro': str(e)}
+        self._responder(status, corpo)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parametros = {nome: valores[-1] for nome, valores in parse_qs(url.query).items()}
+        rotas = {
+            '/estoque': lambda: (200, self.servico.listar_estoque()),
+            '/historico': lambda: (200, self.servico.ver_historico(
+                apenas_ativos=parametros.get('apenas_ativos') in ('1', 'true', 'sim'),
+                desde=parametros.get('desde') or None, ate=parametros.get('ate') or None,
+                limite=_inteiro(parametros, 'limite'), cursor=_inteiro(parametros, 'cursor'))),
+            '/estatisticas': lambda: (200, self.servico.obter_estatisticas()),
+        }
+        rota = rotas.get(url.path.rstrip('/'))
+        self._tratar(rota or (lambda: (404, {'erro': f"Rota não encontrada: {url.path}"})))
+
+    def do_POST(self):
+        partes = urlsplit(self.path).path.strip('/').split('/')
+
+        def rota():
+            corpo = self._corpo()
+            if partes == ['pedidos'] and 'itens' in corpo:
+                itens = [(int(item['id_produto']), int(item['quantidade'])) for item in corpo['itens']]
+                sucesso, mensagem = self.servico.fazer_pedido_multiplo(itens, str(corpo.get('descricao', '')))
+            elif partes == ['pedidos']:
+                sucesso, mensagem = self.servico.fazer_pedido(
+                    int(corpo['id_produto']), int(corpo['quantidade']), str(corpo.get('descricao', '')))
+            elif len(partes) == 3 and partes[0] == 'pedidos' and partes[2] == 'cancelar':
+                sucesso, mensagem = self.servico.cancelar_pedido(int(partes[1]))
+            elif partes == ['reservas']:
+                sucesso, resultado = self.servico.reservar_estoque(
+                    int(corpo['id_produto']), int(corpo['quantidade']), float(corpo.get('ttl', 300)))
+                if sucesso:
+                    return 200, {'sucesso': True, 'token': resultado}
+                mensagem = resultado
+            elif len(partes) == 3 and partes[0] == 'reservas' and partes[2] == 'confirmar':
+                sucesso, mensagem = self.servico.confirmar_reserva(partes[1], str(corpo.get('descricao', '')))
+            elif len(partes) == 3 and partes[0] == 'reservas' and partes[2] == 'liberar':
+                sucesso, mensagem = self.servico.liberar_reserva(partes[1])
+            else:
+                return 404, {'erro': f"Rota não encontrada: {self.path}"}
+            return (200 if sucesso else 409), {'sucesso': sucesso, 'mensagem': mensagem}
+
+        self._tratar(rota)
+
+
+class ServicoPedidos:
+    """Operações do SistemaPedidos expostas pelo servidor, com leituras agrupadas.
+
+    As respostas são estruturas JSON (listas e dicts) em vez de DataFrames
+    impressos no terminal.
+    """
+
+    def __init__(self, sistema, janela_leituras=0.005, log=False):
+        self.sistema = sistema
+        self.leituras = LeiturasAgrupadas(janela_leituras)
+        self.log = log
+
+    def listar_estoque(self):
+        produtos = self.leituras.obter('estoque', self.sistema.produtos_disponiveis)
+        return {'produtos': [dict(zip(COLUNAS_PRODUTOS, produto.valores())) for produto in produtos]}
+
+    def ver_historico(self, apenas_ativos=False, desde=None, ate=None, limite=None, cursor=None):
+        # Uma página por resposta: sem limite, o histórico inteiro iria numa requisição
+        limite = min(limite or LIMITE_HISTORICO, LIMITE_MAXIMO_HISTORICO)
+        chave = ('historico', apenas_ativos, desde, ate, limite, cursor)
+        pedidos = self.leituras.obter(chave, lambda: [
+            pedido for pagina in self.sistema.iterar_historico(apenas_ativos=apenas_ativos, desde=desde, ate=ate,
+                                                               limite=limite, cursor=cursor, tamanho_pagina=limite)
+            for pedido in pagina
+        ])
+        # cursor: último id_pedido devolvido, para pedir a página seguinte
+        return {'pedidos': [pedido._asdict() for pedido in pedidos],
+                'cursor': pedidos[-1].id_pedido if pedidos else None}
+
+    def obter_estatisticas(self):
+        return self.leituras.obter('estatisticas', self.sistema.obter_estatisticas)
+
+    def fazer_pedido(self, id_produto, quantidade, descricao=""):
+        return self.sistema.fazer_pedido(id_produto, quantidade, descricao)
+
+    def fazer_pedido_multiplo(self, itens, descricao=""):
+        return self.sistema.fazer_pedido_multiplo(itens, descricao)
+
+    def cancelar_pedido(self, id_pedido):
+        return self.sistema.cancelar_pedido(id_pedido)
+
+    def reservar_estoque(self, id_produto, quantidade, ttl=300.0):
+        return self.sistema.reservar_estoque(id_produto, quantidade, ttl)
+
+    def confirmar_reserva(self, token, descricao=""):
+        return self.sistema.confirmar_reserva(token, descricao)
+
+    def liberar_reserva(self, token):
+        return self.sistema.liberar_reserva(token)
+
+
+def criar_servidor(sistema, host='127.0.0.1', porta=8080, max_workers=8, janela_leituras=0.005, log=False):
+    """Cria o servidor HTTP (ainda sem atender: chamar serve_forever)"""
+    servico = ServicoPedidos(sistema, janela_leituras, log)
+    tratador = type('Tratador', (TratadorPedidos,), {'servico': servico})
+    servidor = ServidorHTTP((host, porta), tratador, max_workers)
+    servidor.servico = servico
+    return servidor
+
+
+def main():
+    """Atende o sistema de pedidos por HTTP/JSON em localhost"""
+    parser = argparse.ArgumentParser(description="Servidor HTTP do sistema de pedidos")
+    parser.add_argument('--arquivo', default='dados/sistema_pedidos.xlsx', help="Planilha de dados")
+    parser.add_argument('--modo', choices=[MODO_SINCRONO, MODO_RESIDENTE], default=MODO_SINCRONO)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=8, help="Threads que atendem as requisições")
+    parser.add_argument('--janela-ms', type=float, default=5.0,
+                        help="Janela em que leituras iguais são agrupadas numa só (ms)")
+    parser.add_argument('--log', action='store_true', help="Registrar cada requisição")
+    args = parser.parse_args()
+
+    sistema = SistemaPedidos(args.arquivo, modo=args.modo)
+    servidor = criar_servidor(sistema, args.host, args.porta, args.workers, args.janela_ms / 1000, args.log)
+    print(f"Servidor de pedidos em http://{args.host}:{args.porta} ({args.workers} workers)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print("\nServidor encerrado pelo usuário!")
+    finally:
+        servidor.server_close()
+        sistema.fechar()
+
+
+if __name__ == "__main__":
+    main()
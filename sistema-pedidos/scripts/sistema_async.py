@@ -0,0 +1,175 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from main import SistemaPedidos, MODO_SINCRONO
+
+
+class AsyncSistemaPedidos:
+    """Fachada asyncio sobre SistemaPedidos.
+
+    As operações bloqueantes rodam num pool de threads limitado (`max_workers`), de
+    modo que o event loop nunca espera por arquivo ou lock. Para não ocupar o pool
+    com threads paradas em locks:
+      - pedidos concorrentes entram numa fila e são gravados juntos com
+        fazer_pedidos_em_lote (um lote por vez, até `max_lote` pedidos);
+      - no modo síncrono, as demais escritas aguardam um asyncio.Lock antes de
+        ocupar uma thread, pois ali todas disputariam o mesmo lock global;
+      - leituras idênticas simultâneas compartilham uma única execução.
+    """
+
+    def __init__(self, sistema=None, max_workers=4, max_lote=100, **kwargs):
+        self.sistema = sistema if sistema is not None else SistemaPedidos(**kwargs)
+        self.max_lote = max_lote
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sistema-pedidos-async')
+        self._lock_escrita = asyncio.Lock()
+        self._fila_pedidos = []       # [((id_produto, quantidade, descricao), futuro)]
+        self._tarefa_pedidos = None
+        self._leituras = {}           # chave da leitura -> futuro em andamento
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.fechar()
+
+    async def _executar(self, funcao, *args, **kwargs):
+        """Executa uma chamada bloqueante no pool de threads"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(funcao, *args, **kwargs))
+
+    @asynccontextmanager
+    async def _escrita(self):
+        """No modo síncrono, aguarda a vez de escrever sem bloquear uma thread do pool"""
+        if self.sistema.modo != MODO_SINCRONO:
+            yield
+            return
+        async with self._lock_escrita:
+            yield
+
+    async def _ler(self, chave, funcao, *args):
+        """Leitura coalescida: chamadas iguais em andamento aguardam o mesmo resultado"""
+        futuro = self._leituras.get(chave)
+        if futuro is None:
+            futuro = asyncio.ensure_future(self._executar(funcao, *args))
+            self._leituras[chave] = futuro
+            futuro.add_done_callback(lambda _: self._leituras.pop(chave, None))
+        return await asyncio.shield(futuro)
+
+    async def adicionar_produto(self, nome, descricao, preco_unitario, quantidade_estoque):
+        """Adiciona um novo produto ao sistema"""
+        async with self._escrita():
+            return await self._executar(self.sistema.adicionar_produto, nome, descricao,
+                                        preco_unitario, quantidade_estoque)
+
+    async def fazer_pedido(self, id_produto, quantidade_pedida, descricao_pedido=""):
+        """Faz um pedido; pedidos simultâneos são gravados num mesmo lote"""
+        futuro = asyncio.get_running_loop().create_future()
+        self._fila_pedidos.append(((id_produto, quantidade_pedida, descricao_pedido), futuro))
+        if self._tarefa_pedidos is None or self._tarefa_pedidos.done():
+            self._tarefa_pedidos = asyncio.ensure_future(self._processar_pedidos())
+        return await futuro
+
+    async def _gravar_lote(self, lote):
+        """Grava o lote e entrega a cada futuro o seu resultado.
+
+        Se o lote falhar (ex.: um item malformado), os pedidos são refeitos um a um,
+        para que a exceção chegue apenas a quem enviou o pedido que a causou.
+        """
+        try:
+            async with self._escrita():
+                resultados = await self._executar(self.sistema.fazer_pedidos_em_lote,
+                                                  [pedido for pedido, _ in lote])
+        except Exception as e:
+            if len(lote) == 1:
+                if not lote[0][1].done():
+                    lote[0][1].set_exception(e)
+                return
+            for item in lote:
+                await self._gravar_lote([item])
+            return
+        for (_, futuro), resultado in zip(lote, resultados):
+            if not futuro.done():
+                futuro.set_result(resultado)
+
+    async def _processar_pedidos(self):
+        """Esvazia a fila de pedidos, um lote por vez"""
+        while self._fila_pedidos:
+            lote = self._fila_pedidos[:self.max_lote]
+            del self._fila_pedidos[:self.max_lote]
+            await self._gravar_lote(lote)
+
+    async def fazer_pedidos_em_lote(self, pedidos):
+        """Faz vários pedidos de uma vez (ver SistemaPedidos.fazer_pedidos_em_lote)"""
+        async with self._escrita():
+            return await self._executar(self.sistema.fazer_pedidos_em_lote, pedidos)
+
+    async def fazer_pedido_multiplo(self, itens, descricao_pedido=""):
+        """Faz um pedido com vários itens, todos ou nenhum (ver SistemaPedidos.fazer_pedido_multiplo)"""
+        async with self._escrita():
+            return await self._executar(self.sistema.fazer_pedido_multiplo, itens, descricao_pedido)
+
+    async def cancelar_pedido(self, id_pedido):
+        """Cancela um pedido e restaura o estoque"""
+        async with self._escrita():
+            return await self._executar(self.sistema.cancelar_pedido, id_pedido)
+
+    async def reservar_estoque(self, id_produto, quantidade, ttl=300.0):
+        """Reserva estoque por ttl segundos (ver SistemaPedidos.reservar_estoque)"""
+        async with self._escrita():
+            return await self._executar(self.sistema.reservar_estoque, id_produto, quantidade, ttl)
+
+    async def confirmar_reserva(self, token, descricao_pedido=""):
+        """Transforma a reserva em pedido"""
+        async with self._escrita():
+            return await self._executar(self.sistema.confirmar_reserva, token, descricao_pedido)
+
+    async def liberar_reserva(self, token):
+        """Desiste da reserva, devolvendo o estoque"""
+        return await self._executar(self.sistema.liberar_reserva, token)
+
+    async def listar_estoque(self):
+        """Produtos com estoque > 0, como cópias de Produto, sem imprimir"""
+        produtos = await self._ler('listar_estoque', self.sistema.produtos_disponiveis)
+        return [produto.copiar() for produto in produtos]
+
+    async def obter_estatisticas(self):
+        """Retorna estatísticas do sistema"""
+        return dict(await self._ler('obter_estatisticas', self.sistema.obter_estatisticas))
+
+    async def ver_historico(self, apenas_ativos=False, desde=None, ate=None, limite=100, cursor=None):
+        """Uma página do histórico (lista de Pedido), sem imprimir nem carregar o histórico inteiro.
+
+        Até `limite` pedidos após `cursor`, o último id_pedido já visto (ver
+        SistemaPedidos.iterar_historico).
+        """
+        chave = ('ver_historico', apenas_ativos, desde, ate, limite, cursor)
+        return list(await self._ler(chave, self._pagina_historico, apenas_ativos, desde, ate, limite, cursor))
+
+    def _pagina_historico(self, apenas_ativos, desde, ate, limite, cursor):
+        """Pedidos de uma página do histórico (executado no pool)"""
+        return [
+            pedido for pagina in self.sistema.iterar_historico(apenas_ativos=apenas_ativos, desde=desde, ate=ate,
+                                                               limite=limite, cursor=cursor, tamanho_pagina=limite)
+            for pedido in pagina
+        ]
+
+    async def iterar_historico(self, **filtros):
+        """Gera páginas do histórico (ver SistemaPedidos.iterar_historico), lendo cada uma no pool"""
+        paginas = self.sistema.iterar_historico(**filtros)
+        while True:
+            pagina = await self._executar(next, paginas, None)
+            if pagina is None:
+                return
+            yield pagina
+
+    async def sincronizar(self):
+        """Persiste imediatamente as alterações pendentes (modo residente)"""
+        await self._executar(self.sistema.sincronizar)
+
+    async def fechar(self):
+        """Conclui os pedidos na fila, encerra o pool e fecha o sistema"""
+        if self._tarefa_pedidos is not None:
+            await self._tarefa_pedidos
+        await self._executar(self.sistema.fechar)
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,189 @@
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem fcntl, o lock de slot vale apenas entre threads do processo
+    fcntl = None
+
+# Cabeçalho: identificação, formato, capacidade (slots), versão dos dados espelhada
+# e versão do catálogo (muda quando produtos entram ou a tabela é reconstruída)
+_CABECALHO = struct.Struct('<4sIIQQ')
+_TAMANHO_CABECALHO = 64
+_IDENTIFICACAO = b'ESTQ'
+_FORMATO = 1
+
+# Slot por id_produto: sequência (seqlock), quantidade_estoque, preco_unitario, presente
+_SLOT = struct.Struct('<QqdQ')
+
+# Tentativas de leitura de um slot em escrita antes de desistir (quem lê recorre ao
+# armazenamento): a sequência fica ímpar para sempre se o escritor morrer no meio
+TENTATIVAS_LEITURA = 1000
+
+# Versão de uma tabela recém-criada ou em reconstrução: nunca coincide com a dos dados
+VERSAO_INVALIDA = 2 ** 64 - 1
+
+
+class TabelaEstoque:
+    """Estoque e preço por id_produto num arquivo binário de largura fixa, mapeado em memória.
+
+    Espelha o armazenamento na versão gravada no cabeçalho: quem lê confere essa
+    versão com a dos dados antes de confiar na tabela. Leituras não usam lock
+    (seqlock por slot); alterações de um slot usam um lock de registro (fcntl.lockf)
+    apenas sobre os bytes do slot, mais um lock entre as threads do processo.
+    """
+
+    def __init__(self, caminho, capacidade_inicial=1024, faixas_lock=64):
+        self.caminho = caminho
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self._fd = os.open(caminho, os.O_RDWR | os.O_CREAT, 0o644)
+        self._locks = [threading.Lock() for _ in range(faixas_lock)]
+        self._lock_mapa = threading.Lock()
+        with self._travar_bytes(0, _TAMANHO_CABECALHO):
+            if os.fstat(self._fd).st_size < _TAMANHO_CABECALHO:
+                os.ftruncate(self._fd, _TAMANHO_CABECALHO + capacidade_inicial * _SLOT.size)
+                self._mapa = mmap.mmap(self._fd, 0)
+                _CABECALHO.pack_into(self._mapa, 0, _IDENTIFICACAO, _FORMATO, capacidade_inicial,
+                                     VERSAO_INVALIDA, 0)
+            else:
+                self._mapa = mmap.mmap(self._fd, 0)
+        identificacao, formato, _, _, _ = _CABECALHO.unpack_from(self._mapa, 0)
+        if identificacao != _IDENTIFICACAO or formato != _FORMATO:
+            raise Exception(f"Erro ao abrir tabela de estoque: formato desconhecido em {caminho}")
+
+    @contextmanager
+    def _travar_bytes(self, inicio, tamanho):
+        """Lock de registro entre processos sobre um trecho do arquivo"""
+        if fcntl is None:
+            yield
+            return
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, tamanho, inicio)
+        try:
+            yield
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, tamanho, inicio)
+
+    def _capacidade(self):
+        return _CABECALHO.unpack_from(self._mapa, 0)[2]
+
+    def _offset(self, id_produto):
+        return _TAMANHO_CABECALHO + id_produto * _SLOT.size
+
+    def _mapa_com_slot(self, id_produto):
+        """Mapa que contém o slot, remapeando se outro processo aumentou o arquivo"""
+        mapa = self._mapa
+        if self._offset(id_produto) + _SLOT.size <= len(mapa):
+            return mapa
+        with self._lock_mapa:
+            if os.fstat(self._fd).st_size > len(self._mapa):
+                self._mapa = mmap.mmap(self._fd, 0)
+            mapa = self._mapa
+        return mapa if self._offset(id_produto) + _SLOT.size <= len(mapa) else None
+
+    def _garantir_capacidade(self, id_produto):
+        """Aumenta o arquivo (dobrando a capacidade) até caber o slot"""
+        if self._mapa_com_slot(id_produto) is not None:
+            return
+        with self._lock_mapa, self._travar_bytes(0, _TAMANHO_CABECALHO):
+            capacidade = max(self._capacidade(), 1)
+            while capacidade <= id_produto:
+                capacidade *= 2
+            tamanho = _TAMANHO_CABECALHO + capacidade * _SLOT.size
+            if os.fstat(self._fd).st_size < tamanho:
+                os.ftruncate(self._fd, tamanho)
+            self._mapa = mmap.mmap(self._fd, 0)
+            struct.pack_into('<I', self._mapa, 8, capacidade)
+
+    @contextmanager
+    def travar_slot(self, id_produto):
+        """Lock exclusivo de um slot, entre threads e entre processos"""
+        with self._locks[hash(id_produto) % len(self._locks)], \
+                self._travar_bytes(self._offset(id_produto), _SLOT.size):
+            yield
+
+    def ler(self, id_produto):
+        """(quantidade_estoque, preco_unitario) do produto, ou None se não houver.
+        
+        Também retorna None se o slot seguir em escrita após TENTATIVAS_LEITURA
+        leituras: quem chama trata como tabela indisponível e lê o armazenamento.
+        """
+        if id_produto < 0:
+            return None
+        mapa = self._mapa_com_slot(id_produto)
+        if mapa is None:
+            return None
+        offset = self._offset(id_produto)
+        for _ in range(TENTATIVAS_LEITURA):
+            sequencia, quantidade, preco, presente = _SLOT.unpack_from(mapa, offset)
+            # Sequência ímpar: escrita em andamento; mudou durante a leitura: ler de novo
+            if sequencia % 2 == 0 and struct.unpack_from('<Q', mapa, offset)[0] == sequencia:
+                return (quantidade, preco) if presente else None
+        return None
+
+    def _slot(self, id_produto):
+        """Campos do slot sem conferir a sequência, ou None se não couber no arquivo"""
+        mapa = self._mapa_com_slot(id_produto)
+        return _SLOT.unpack_from(mapa, self._offset(id_produto)) if mapa is not None else None
+
+    def _escrever(self, id_produto, quantidade, preco, presente=1):
+        """Grava o slot (chamar com o lock do slot)"""
+        self._garantir_capacidade(id_produto)
+        mapa = self._mapa
+        offset = self._offset(id_produto)
+        sequencia = struct.unpack_from('<Q', mapa, offset)[0]
+        # Próximo ímpar durante a escrita e o par seguinte ao final: uma sequência que
+        # ficou ímpar (escritor interrompido) volta a ser par aqui
+        em_escrita = sequencia + 1 if sequencia % 2 == 0 else sequencia + 2
+        struct.pack_into('<Q', mapa, offset, em_escrita)
+        _SLOT.pack_into(mapa, offset, em_escrita, quantidade, preco, presente)
+        struct.pack_into('<Q', mapa, offset, em_escrita + 1)
+
+    def definir(self, id_produto, quantidade_estoque, preco_unitario):
+        """Define estoque e preço de um produto"""
+        with self.travar_slot(id_produto):
+            self._escrever(id_produto, int(quantidade_estoque), float(preco_unitario))
+
+    def versao_dados(self):
+        """Versão dos dados que a tabela espelha"""
+        return _CABECALHO.unpack_from(self._mapa, 0)[3]
+
+    def definir_versao_dados(self, versao):
+        """Registra a versão dos dados espelhada (após aplicar a gravação correspondente)"""
+        struct.pack_into('<Q', self._mapa, 12, versao)
+
+    def versao_catalogo(self):
+        """Muda sempre que produtos entram na tabela"""
+        return _CABECALHO.unpack_from(self._mapa, 0)[4]
+
+    def avancar_versao_catalogo(self):
+        struct.pack_into('<Q', self._mapa, 20, self.versao_catalogo() + 1)
+
+    def reconstruir(self, produtos, versao):
+        """Regrava todos os slots a partir dos produtos (objetos Produto)"""
+        self.definir_versao_dados(VERSAO_INVALIDA)
+        produtos = list(produtos)
+        if produtos:
+            self._garantir_capacidade(max(produto.id_produto for produto in produtos))
+        presentes = {produto.id_produto for produto in produtos}
+        for id_produto in range(self._capacidade()):
+            if id_produto in presentes:
+                continue
+            # Slots de produtos que saíram, ou com sequência ímpar deixada por um escritor interrompido
+            sequencia, _, _, presente = self._slot(id_produto)
+            if presente or sequencia % 2:
+                with self.travar_slot(id_produto):
+                    self._escrever(id_produto, 0, 0.0, presente=0)
+        for produto in produtos:
+            self.definir(produto.id_produto, produto.quantidade_estoque, produto.preco_unitario)
+        self.avancar_versao_catalogo()
+        self.definir_versao_dados(versao)
+
+    def fechar(self):
+        """Desfaz o mapeamento e fecha o arquivo"""
+        self._mapa.close()
+        os.close(self._fd)
@@ -1,10 +1,38 @@
 import unittest
+import contextlib
+import io
 import pandas as pd
 import os
 import shutil
 import threading
 import time
-from main import SistemaPedidos
+import atexit
+import json
+import asyncio
+import subprocess
+import urllib.request
+import urllib.error
+import sys
+import importlib.util
+from datetime import date
+from main import SistemaPedidos, MODO_RESIDENTE
+from tabela_estoque import VERSAO_INVALIDA
+from armazenamento import (ArmazenamentoExcel, ArmazenamentoSQLite, ArmazenamentoParquet, migrar,
+                           COLUNAS_PRODUTOS, COLUNAS_HISTORICO)
+from estado import EstadoPedidos
+from modelos import Produto, Pedido, IndiceNomes, normalizar_nome, normalizar_nomes, pedidos_do_dataframe
+from sistema_async import AsyncSistemaPedidos
+from coordenacao import ConflitoVersao
+from journal import Journal
+import benchmark
+import main
+from importacao import ModuloAdiado
+import servidor
+from servidor import criar_servidor, LeiturasAgrupadas
+from metricas import Histograma, MetricasOperacoes
+from cache_leituras import CacheLeituras
+
+PYARROW_DISPONIVEL = importlib.util.find_spec('pyarrow') is not None
 
 class TestSistemaPedidos(unittest.TestCase):
     
@@ -142,6 +170,41 @@ class TestSistemaPedidos(unittest.TestCase):
         self.assertEqual(historico.iloc[0]['status'], 'cancelado')
         self.assertEqual(produtos.iloc[0]['quantidade_estoque'], 10)  # Restaurado
     
+    def test_historico_lido_por_pagina(self):
+        """Testa que o histórico é lido do armazenamento uma página por vez, a partir do cursor"""
+        self.sistema.adicionar_produto("Produto", "Desc", 10.00, 10)
+        for _ in range(5):
+            self.sistema.fazer_pedido(1, 1)
+        self.sistema.cancelar_pedido(2)
+        armazenamento = self.sistema.armazenamento
+        
+        pagina = armazenamento.carregar_pagina_historico(1, 2)
+        self.assertListEqual(list(pagina['id_pedido']), [2, 3])
+        self.assertListEqual(list(pagina['status']), ['cancelado', 'ativo'])
+        self.assertTrue(armazenamento.carregar_pagina_historico(5, 2).empty)
+        
+        def completo(*args, **kwargs):
+            raise AssertionError("histórico completo lido para paginar")
+        armazenamento.carregar_historico = completo
+        paginas = list(self.sistema.iterar_historico(tamanho_pagina=2))
+        ativos = list(self.sistema.iterar_historico(apenas_ativos=True, tamanho_pagina=2))
+        self.assertListEqual([[pedido.id_pedido for pedido in pagina] for pagina in paginas], [[1, 2], [3, 4], [5]])
+        self.assertListEqual([[pedido.id_pedido for pedido in pagina] for pagina in ativos], [[1, 3], [4, 5]])
+    
+    def test_busca_por_chave(self):
+        """Testa a leitura de um único produto ou pedido pelo ID"""
+        self.sistema.adicionar_produto("Produto A", "Desc", 10.00, 10)
+        self.sistema.adicionar_produto("Produto B", "Desc", 20.00, 5)
+        self.sistema.fazer_pedido(2, 2)
+        armazenamento = self.sistema.armazenamento
+        
+        produto = armazenamento.buscar_produto(2)
+        self.assertListEqual(list(produto['nome']), ["Produto B"])
+        self.assertEqual(produto.iloc[0]['quantidade_estoque'], 3)
+        self.assertTrue(armazenamento.buscar_produto(99).empty)
+        self.assertListEqual(list(armazenamento.buscar_pedido(1)['id_produto']), [2])
+        self.assertTrue(armazenamento.buscar_pedido(99).empty)
+    
     def test_concorrencia_pedidos_simultaneos(self):
         """Testa atomicidade com pedidos concorrentes - teste crítico para thread safety"""
         self.sistema.adicionar_produto("Produto Limitado", "Desc", 100.00, 5)
@@ -182,6 +245,2188 @@ class TestSistemaPedidos(unittest.TestCase):
         else:
             self.assertEqual(estoque_final, 5)  # Nenhum pedido processado
 
+class TestPedidosEmLote(unittest.TestCase):
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.arquivo_teste = 'dados_teste/sistema_lote.xlsx'
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+        self.sistema = SistemaPedidos(self.arquivo_teste)
+        self.sistema.adicionar_produto("Produto A", "Desc", 100.00, 5)
+        self.sistema.adicionar_produto("Produto B", "Desc", 10.00, 0)
+    
+    def tearDown(self):
+        """Limpeza após cada teste"""
+        self.sistema.fechar()
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+    
+    def test_resultados_por_item(self):
+        """Testa validações item a item, considerando o estoque já consumido pelo lote"""
+        resultados = self.sistema.fazer_pedidos_em_lote([
+            (1, 3, "Primeiro"),
+            (999, 1, "Inexistente"),
+            (1, 3, "Excede o que sobrou"),
+            (2, 1, "Sem estoque"),
+            (1, 0, "Quantidade inválida"),
+            (1, 2),
+        ])
+        
+        self.assertListEqual([sucesso for sucesso, _ in resultados], [True, False, False, False, False, True])
+        self.assertIn("Pedido #1 realizado com sucesso", resultados[0][1])
+        self.assertIn("não existe", resultados[1][1])
+        self.assertIn("Quantidade solicitada (3) maior que disponível (2)", resultados[2][1])
+        self.assertIn("está fora de estoque", resultados[3][1])
+        self.assertIn("Quantidade deve ser maior que zero", resultados[4][1])
+        self.assertIn("Pedido #2 realizado com sucesso", resultados[5][1])
+        
+        produtos, historico = self.sistema._carregar_dados()
+        self.assertEqual(produtos.iloc[0]['quantidade_estoque'], 0)
+        self.assertListEqual(list(historico['descricao_pedido']), ["Primeiro", "Pedido de 2x Produto A"])
+    
+    def test_persiste_uma_unica_vez(self):
+        """Testa que o lote inteiro gera uma só gravação no armazenamento"""
+        gravacoes = []
+        registrar_original = self.sistema.armazenamento.registrar
+        
+        def registrar(registros, produtos, historico):
+            gravacoes.append(len(registros))
+            registrar_original(registros, produtos, historico)
+        
+        self.sistema.armazenamento.registrar = registrar
+        self.sistema.fazer_pedidos_em_lote([(1, 1, "")] * 4)
+        
+        self.assertListEqual(gravacoes, [4])
+        
+        # Pedido com vários itens: também uma única gravação
+        self.sistema.adicionar_produto("Produto C", "Desc", 1.00, 3)
+        gravacoes.clear()
+        self.sistema.fazer_pedido_multiplo([(3, 2), (1, 1)])
+        self.assertListEqual(gravacoes, [2])
+    
+    def test_pedido_multiplo_tudo_ou_nada(self):
+        """Testa que um item recusado impede o pedido inteiro"""
+        self.sistema.adicionar_produto("Produto C", "Desc", 1.00, 3)
+        
+        sucesso, mensagem = self.sistema.fazer_pedido_multiplo([(1, 2), (3, 2), (3, 2)])
+        self.assertFalse(sucesso)
+        self.assertIn("Item 3: Quantidade solicitada (2) maior que disponível (1)", mensagem)
+        self.assertIn("Item 2:", self.sistema.fazer_pedido_multiplo([(1, 1), (2, 1)])[1])
+        self.assertIn("Item 1:", self.sistema.fazer_pedido_multiplo([(99, 1)])[1])
+        self.assertIn("ao menos um item", self.sistema.fazer_pedido_multiplo([])[1])
+        self.assertEqual(self.sistema.obter_estatisticas()['total_pedidos'], 0)
+        
+        sucesso, mensagem = self.sistema.fazer_pedido_multiplo([(1, 2), (3, 3)], "Carrinho")
+        self.assertTrue(sucesso)
+        self.assertIn("Pedidos: #1, #2", mensagem)
+        self.assertIn("R$ 203.00", mensagem)
+        produtos, historico = self.sistema._carregar_dados()
+        self.assertListEqual(list(produtos['quantidade_estoque']), [3, 0, 0])
+        self.assertListEqual(list(historico['descricao_pedido']), ["Carrinho", "Carrinho"])
+    
+    def test_pedido_multiplo_concorrente_sem_deadlock(self):
+        """Testa carrinhos simultâneos com os mesmos produtos em ordens diferentes"""
+        self.sistema.fechar()
+        shutil.rmtree(os.path.dirname(self.arquivo_teste))
+        self.sistema = SistemaPedidos(self.arquivo_teste, modo=MODO_RESIDENTE, journal=False, faixas_lock=4)
+        for indice in range(6):
+            self.sistema.adicionar_produto(f"Produto {indice}", "Desc", 1.00, 40)
+        
+        resultados = []
+        def comprar(ids_produto):
+            for _ in range(10):
+                resultados.append(self.sistema.fazer_pedido_multiplo([(id_produto, 1) for id_produto in ids_produto]))
+        
+        ordens = [[1, 2, 3, 4, 5, 6], [6, 5, 4, 3, 2, 1], [3, 1, 6, 2], [5, 2, 6, 1]]
+        threads = [threading.Thread(target=comprar, args=(ordem,)) for ordem in ordens]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=30)
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+        
+        self.assertTrue(all(sucesso for sucesso, _ in resultados))
+        produtos, historico = self.sistema._carregar_dados()
+        self.assertEqual(len(historico), 200)
+        self.assertListEqual(list(produtos['quantidade_estoque']), [0, 0, 10, 20, 10, 0])
+
+class TestReservas(unittest.TestCase):
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.arquivo_teste = 'dados_teste/sistema_reservas.xlsx'
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+        self.sistemas = []
+    
+    def tearDown(self):
+        """Limpeza após cada teste"""
+        for sistema in self.sistemas:
+            sistema.fechar()
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+    
+    def _criar_sistema(self, **kwargs):
+        sistema = SistemaPedidos(self.arquivo_teste, **kwargs)
+        self.sistemas.append(sistema)
+        sistema.adicionar_produto("Produto A", "Desc", 10.00, 5)
+        return sistema
+    
+    def test_reserva_desconta_do_disponivel(self):
+        """Testa que o estoque reservado não pode ser pedido nem reservado de novo"""
+        sistema = self._criar_sistema()
+        sucesso, token = sistema.reservar_estoque(1, 3)
+        self.assertTrue(sucesso)
+        
+        sucesso, mensagem = sistema.fazer_pedido(1, 3)
+        self.assertFalse(sucesso)
+        self.assertIn("maior que disponível (2)", mensagem)
+        sucesso, _ = sistema.reservar_estoque(1, 3)
+        self.assertFalse(sucesso)
+        self.assertTrue(sistema.fazer_pedido(1, 2)[0])
+        
+        # O estoque reservado continua lá até a confirmação
+        sucesso, mensagem = sistema.confirmar_reserva(token, "Após o pagamento")
+        self.assertTrue(sucesso)
+        self.assertIn("Pedido #2", mensagem)
+        historico = sistema.ver_historico()
+        self.assertEqual(historico.iloc[-1]['quantidade_pedida'], 3)
+        self.assertEqual(historico.iloc[-1]['descricao_pedido'], "Após o pagamento")
+        self.assertTrue(sistema.listar_estoque().empty)
+        
+        # Token já usado
+        sucesso, mensagem = sistema.confirmar_reserva(token)
+        self.assertFalse(sucesso)
+        self.assertIn("não encontrada", mensagem)
+    
+    def test_liberar_reserva(self):
+        """Testa que liberar a reserva devolve o estoque imediatamente"""
+        sistema = self._criar_sistema()
+        _, token = sistema.reservar_estoque(1, 5)
+        self.assertFalse(sistema.fazer_pedido(1, 1)[0])
+        
+        self.assertTrue(sistema.liberar_reserva(token)[0])
+        self.assertFalse(sistema.liberar_reserva(token)[0])
+        self.assertTrue(sistema.fazer_pedido(1, 5)[0])
+    
+    def test_validacoes(self):
+        """Testa reservas recusadas"""
+        sistema = self._criar_sistema()
+        self.assertIn("maior que zero", sistema.reservar_estoque(1, 0)[1])
+        self.assertIn("Validade", sistema.reservar_estoque(1, 1, ttl=0)[1])
+        self.assertIn("não existe", sistema.reservar_estoque(99, 1)[1])
+        self.assertIn("maior que disponível", sistema.reservar_estoque(1, 6)[1])
+        self.assertFalse(sistema.confirmar_reserva('inexistente')[0])
+        self.assertEqual(len(sistema._reservas), 0)
+    
+    def test_reserva_expirada_liberada_pela_varredura(self):
+        """Testa que a thread de varredura devolve o estoque de reservas vencidas"""
+        sistema = self._criar_sistema(intervalo_reservas=0.02)
+        _, token = sistema.reservar_estoque(1, 5, ttl=0.05)
+        self.assertIsNotNone(sistema._thread_reservas)
+        
+        limite = time.time() + 5
+        while len(sistema._reservas) and time.time() < limite:
+            time.sleep(0.02)
+        self.assertEqual(len(sistema._reservas), 0)
+        self.assertFalse(sistema.confirmar_reserva(token)[0])
+        self.assertTrue(sistema.fazer_pedido(1, 5)[0])
+    
+    def test_reserva_pela_tabela_sem_ler_armazenamento(self):
+        """Testa que, no modo síncrono, a reserva usa a tabela de estoque mapeada"""
+        sistema = self._criar_sistema()
+        sistema.listar_estoque()
+        cargas = []
+        original = sistema.armazenamento.carregar
+        sistema.armazenamento.carregar = lambda *args: cargas.append(1) or original(*args)
+        
+        self.assertTrue(sistema.reservar_estoque(1, 2)[0])
+        self.assertEqual(len(cargas), 0)
+    
+    def test_reservas_concorrentes_modo_residente(self):
+        """Testa que reservas simultâneas nunca prometem mais que o estoque"""
+        sistema = self._criar_sistema(modo=MODO_RESIDENTE, journal=False)
+        resultados = []
+        
+        def reservar():
+            resultados.append(sistema.reservar_estoque(1, 1))
+        
+        threads = [threading.Thread(target=reservar) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        tokens = [token for sucesso, token in resultados if sucesso]
+        self.assertEqual(len(tokens), 5)
+        for token in tokens:
+            self.assertTrue(sistema.confirmar_reserva(token)[0])
+        self.assertEqual(sistema.obter_estatisticas()['pedidos_ativos'], 5)
+        self.assertEqual(sistema.obter_estatisticas()['produtos_sem_estoque'], 1)
+    
+    def test_confirmacao_com_falha_mantem_reserva(self):
+        """Testa que a reserva continua válida se a gravação do pedido falhar"""
+        sistema = self._criar_sistema()
+        _, token = sistema.reservar_estoque(1, 2)
+        original = sistema.armazenamento.registrar
+        def falhar(*args):
+            raise Exception("Erro ao salvar dados: disco cheio")
+        sistema.armazenamento.registrar = falhar
+        with self.assertRaises(Exception):
+            sistema.confirmar_reserva(token)
+        
+        sistema.armazenamento.registrar = original
+        self.assertEqual(sistema._reservas.reservado(1), 2)
+        self.assertTrue(sistema.confirmar_reserva(token)[0])
+
+
+class TestImportacaoProdutos(unittest.TestCase):
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.arquivo_teste = 'dados_teste/sistema_importacao.xlsx'
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+        self.sistema = SistemaPedidos(self.arquivo_teste)
+        self.sistema.adicionar_produto("Existente", "Desc", 10.00, 1)
+        self.origem = pd.DataFrame({
+            'nome': ["Novo A", " ", "Novo B", "existente", "novo a", "Novo C", "Novo D", "Novo E"],
+            'descricao': ["a", "b", None, "d", "e", "f", "g", "h"],
+            'preco_unitario': [1.0, 2.0, 3.0, 4.0, 5.0, -1.0, "abc", 8.0],
+            'quantidade_estoque': [1, 2, 3, 4, 5, 6, 7, 2.5],
+        })
+    
+    def tearDown(self):
+        """Limpeza após cada teste"""
+        self.sistema.fechar()
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+    
+    def _verificar(self, importados, recusas):
+        """Confere o resultado da importação de self.origem"""
+        self.assertEqual(importados, 2)
+        self.assertEqual([(recusa['linha'], recusa['motivo']) for recusa in recusas], [
+            (3, "Nome do produto não pode estar vazio!"),
+            (5, "Produto 'existente' já existe!"),
+            (6, "Produto 'novo a' já existe!"),
+            (7, "Preço deve ser maior que zero!"),
+            (8, "Preço inválido!"),
+            (9, "Quantidade em estoque deve ser um número inteiro!"),
+        ])
+        produtos = self.sistema.armazenamento.carregar_produtos()
+        self.assertListEqual(list(produtos['nome']), ["Existente", "Novo A", "Novo B"])
+        self.assertListEqual(list(produtos['id_produto']), [1, 2, 3])
+    
+    def test_importar_csv_em_blocos(self):
+        """Testa a importação de um CSV lido em blocos, com uma única gravação"""
+        caminho = os.path.join(os.path.dirname(self.arquivo_teste), 'produtos.csv')
+        self.origem.to_csv(caminho, index=False)
+        gravacoes = []
+        registrar = self.sistema.armazenamento.registrar
+        self.sistema.armazenamento.registrar = lambda *args: (gravacoes.append(1), registrar(*args))
+        
+        self._verificar(*self.sistema.adicionar_produtos_em_lote(caminho, tamanho_bloco=3))
+        self.assertEqual(len(gravacoes), 1)
+    
+    def test_importar_excel(self):
+        """Testa a importação de uma planilha Excel"""
+        caminho = os.path.join(os.path.dirname(self.arquivo_teste), 'produtos.xlsx')
+        self.origem.astype(str).replace({'None': ''}).to_excel(caminho, index=False)
+        self._verificar(*self.sistema.adicionar_produtos_em_lote(caminho))
+    
+    def test_colunas_ausentes(self):
+        """Testa que uma origem sem as colunas obrigatórias é rejeitada"""
+        with self.assertRaises(Exception):
+            self.sistema.adicionar_produtos_em_lote(pd.DataFrame({'nome': ["X"]}))
+        self.assertEqual(len(self.sistema.armazenamento.carregar_produtos()), 1)
+
+class TestIndiceNomes(unittest.TestCase):
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.arquivo_teste = 'dados_teste/sistema_nomes.xlsx'
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+    
+    def tearDown(self):
+        """Limpeza após cada teste"""
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+    
+    def test_normalizacao(self):
+        """Testa a normalização escalar e por coluna, com e sem remoção de acentos"""
+        decomposto = "Cafe\u0301"  # 'é' como 'e' + acento combinante
+        self.assertEqual(normalizar_nome("  Café "), normalizar_nome(decomposto))
+        self.assertNotEqual(normalizar_nome("Café"), normalizar_nome("cafe"))
+        self.assertEqual(normalizar_nome("Pão de Açúcar", remover_acentos=True), "pao de acucar")
+        nomes = pd.Series(["  Café ", decomposto, "Pão", None])
+        for remover_acentos in (False, True):
+            self.assertListEqual(list(normalizar_nomes(nomes, remover_acentos)),
+                                 [normalizar_nome(nome, remover_acentos) for nome in nomes])
+    
+    def test_indice(self):
+        """Testa busca, pertinência e colisões (vale o menor id)"""
+        indice = IndiceNomes([Produto(2, "cafe", "", 1.0, 1), Produto(1, "Café", "", 1.0, 1)], remover_acentos=True)
+        self.assertEqual(len(indice), 1)
+        self.assertEqual(indice.buscar("CAFÉ"), 1)
+        self.assertIn(" cafe ", indice)
+        self.assertIsNone(indice.buscar("Chá"))
+    
+    def test_duplicatas_sem_acentos(self):
+        """Testa duplicatas e busca por nome com acentos removidos, também após reiniciar"""
+        sistema = SistemaPedidos(self.arquivo_teste, remover_acentos=True)
+        self.assertTrue(sistema.adicionar_produto("Café", "Desc", 10.00, 5)[0])
+        sucesso, mensagem = sistema.adicionar_produto("CAFE ", "Desc", 10.00, 5)
+        self.assertFalse(sucesso)
+        self.assertIn("já existe", mensagem)
+        sistema.fazer_pedido(1, 2)
+        self.assertEqual(sistema.buscar_produto_por_nome("cafe").quantidade_estoque, 3)
+        sistema.fechar()
+        
+        for kwargs in ({'tabela_estoque': False}, {'modo': MODO_RESIDENTE}):
+            sistema = SistemaPedidos(self.arquivo_teste, remover_acentos=True, **kwargs)
+            self.assertFalse(sistema.adicionar_produto("café", "Desc", 1.00, 1)[0])
+            produto = sistema.buscar_produto_por_nome("CAFÉ")
+            self.assertEqual((produto.id_produto, produto.quantidade_estoque), (1, 3))
+            self.assertIsNone(sistema.buscar_produto_por_nome("Chá"))
+            sistema.fechar()
+    
+    def test_sem_remover_acentos(self):
+        """Testa que, por padrão, nomes que diferem só nos acentos são produtos distintos"""
+        sistema = SistemaPedidos(self.arquivo_teste)
+        self.assertTrue(sistema.adicionar_produto("Café", "Desc", 10.00, 5)[0])
+        self.assertTrue(sistema.adicionar_produto("Cafe", "Desc", 10.00, 5)[0])
+        self.assertFalse(sistema.adicionar_produto("CAFÉ", "Desc", 10.00, 5)[0])
+        self.assertEqual(sistema.buscar_produto_por_nome("cafe").id_produto, 2)
+        sistema.fechar()
+    
+    def test_importacao_em_lote_usa_indice(self):
+        """Testa que a importação em lote atualiza e respeita o índice de nomes"""
+        sistema = SistemaPedidos(self.arquivo_teste, modo=MODO_RESIDENTE, remover_acentos=True)
+        sistema.adicionar_produto("Açaí", "Desc", 10.00, 5)
+        importados, recusas = sistema.adicionar_produtos_em_lote(pd.DataFrame({
+            'nome': ["acai", "Maçã", "MACA", "Pêra"],
+            'preco_unitario': [1.0] * 4,
+            'quantidade_estoque': [1] * 4,
+        }))
+        self.assertEqual(importados, 2)
+        self.assertEqual([recusa['linha'] for recusa in recusas], [2, 4])
+        self.assertEqual(sistema.buscar_produto_por_nome("pera").nome, "Pêra")
+        self.assertFalse(sistema.adicionar_produto("maca", "Desc", 1.00, 1)[0])
+        sistema.fechar()
+
+class TestSistemaAsync(unittest.TestCase):
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.arquivo_teste = 'dados_teste/sistema_async.xlsx'
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+        self.sistema = SistemaPedidos(self.arquivo_teste)
+        self.sistema.adicionar_produto("Produto", "Desc", 10.00, 10)
+    
+    def tearDown(self):
+        """Limpeza após cada teste"""
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+    
+    def _contar_chamadas(self, nome):
+        """Substitui um método do sistema por um que conta as chamadas"""
+        original = getattr(self.sistema, nome)
+        chamadas = []
+        def contando(*args, **kwargs):
+            chamadas.append(args)
+            return original(*args, **kwargs)
+        setattr(self.sistema, nome, contando)
+        return chamadas
+    
+    def test_pedidos_concorrentes_agrupados_em_lotes(self):
+        """Testa que pedidos simultâneos são gravados em poucos lotes sem vender além do estoque"""
+        lotes = self._contar_chamadas('fazer_pedidos_em_lote')
+        
+        async def cenario():
+            async with AsyncSistemaPedidos(self.sistema, max_workers=2) as sistema:
+                return await asyncio.gather(*(sistema.fazer_pedido(1, 1) for _ in range(15)))
+        
+        resultados = asyncio.run(cenario())
+        self.assertEqual(sum(1 for sucesso, _ in resultados if sucesso), 10)
+        self.assertLess(len(lotes), 15)
+        produtos, historico = self.sistema._carregar_dados()
+        self.assertEqual(produtos.iloc[0]['quantidade_estoque'], 0)
+        self.assertEqual(len(historico), 10)
+    
+    def test_item_malformado_nao_derruba_o_lote(self):
+        """Testa que um pedido inválido no lote falha só para quem o enviou"""
+        lotes = self._contar_chamadas('fazer_pedidos_em_lote')
+        
+        async def cenario():
+            async with AsyncSistemaPedidos(self.sistema) as sistema:
+                return await asyncio.gather(sistema.fazer_pedido(1, 1), sistema.fazer_pedido(1, "2"),
+                                            sistema.fazer_pedido(1, 3), return_exceptions=True)
+        
+        primeiro, malformado, terceiro = asyncio.run(cenario())
+        self.assertEqual(lotes[0][0], [(1, 1, ""), (1, "2", ""), (1, 3, "")])
+        self.assertIsInstance(malformado, Exception)
+        self.assertTrue(primeiro[0])
+        self.assertTrue(terceiro[0])
+        produtos, historico = self.sistema._carregar_dados()
+        self.assertEqual(produtos.iloc[0]['quantidade_estoque'], 6)
+        self.assertListEqual(list(historico['quantidade_pedida']), [1, 3])
+    
+    def test_leituras_simultaneas_coalescidas(self):
+        """Testa que leituras iguais em andamento compartilham uma execução"""
+        leituras = self._contar_chamadas('obter_estatisticas')
+        
+        async def cenario():
+            async with AsyncSistemaPedidos(self.sistema) as sistema:
+                await sistema.fazer_pedido(1, 2)
+                sucesso, _ = await sistema.cancelar_pedido(1)
+                self.assertTrue(sucesso)
+                return await asyncio.gather(*(sistema.obter_estatisticas() for _ in range(8)))
+        
+        resultados = asyncio.run(cenario())
+        self.assertEqual(len(leituras), 1)
+        self.assertTrue(all(stats['pedidos_cancelados'] == 1 for stats in resultados))
+        self.assertIsNot(resultados[0], resultados[1])
+    
+    def test_leituras_retornam_dados_sem_imprimir(self):
+        """Testa que estoque e histórico vêm como dados, em páginas, sem saída no terminal"""
+        impressoes = self._contar_chamadas('listar_estoque') + self._contar_chamadas('ver_historico')
+        
+        async def cenario():
+            async with AsyncSistemaPedidos(self.sistema) as sistema:
+                await sistema.fazer_pedidos_em_lote([(1, 1), (1, 1), (1, 1)])
+                await sistema.cancelar_pedido(2)
+                estoque = await sistema.listar_estoque()
+                primeira = await sistema.ver_historico(limite=2)
+                ativos = await sistema.ver_historico(apenas_ativos=True, cursor=primeira[-1].id_pedido)
+                return estoque, primeira, ativos
+        
+        saida = io.StringIO()
+        with contextlib.redirect_stdout(saida):
+            estoque, primeira, ativos = asyncio.run(cenario())
+        self.assertEqual(saida.getvalue(), "")
+        self.assertEqual([(produto.id_produto, produto.quantidade_estoque) for produto in estoque], [(1, 8)])
+        self.assertListEqual([pedido.id_pedido for pedido in primeira], [1, 2])
+        self.assertListEqual([pedido.id_pedido for pedido in ativos], [3])
+        self.assertEqual(impressoes, [])
+    
+    def test_iterar_historico_async(self):
+        """Testa a paginação do histórico sem bloquear o event loop"""
+        async def cenario():
+            async with AsyncSistemaPedidos(self.sistema) as sistema:
+                await sistema.fazer_pedidos_em_lote([(1, 1), (1, 1), (1, 1)])
+                return [pagina async for pagina in sistema.iterar_historico(tamanho_pagina=2)]
+        
+        paginas = asyncio.run(cenario())
+        self.assertListEqual([len(pagina) for pagina in paginas], [2, 1])
+
+class TestServidorHTTP(unittest.TestCase):
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.arquivo_teste = 'dados_teste/sistema_servidor.xlsx'
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+        self.sistema = SistemaPedidos(self.arquivo_teste)
+        self.sistema.adicionar_produto("Produto A", "Desc", 10.00, 5)
+        self.sistema.adicionar_produto("Produto B", "Desc", 20.00, 0)
+        self.servidor = criar_servidor(self.sistema, porta=0, max_workers=4, janela_leituras=0.05)
+        self.url = f"http://127.0.0.1:{self.servidor.server_address[1]}"
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+    
+    def tearDown(self):
+        """Limpeza após cada teste"""
+        self.servidor.shutdown()
+        self.servidor.server_close()
+        self.sistema.fechar()
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+    
+    def _requisitar(self, caminho, corpo=None):
+        """Retorna (status, JSON da resposta); com corpo, a requisição é um POST"""
+        dados = None if corpo is None else json.dumps(corpo).encode('utf-8')
+        requisicao = urllib.request.Request(self.url + caminho, data=dados, method='GET' if dados is None else 'POST')
+        try:
+            with urllib.request.urlopen(requisicao, timeout=10) as resposta:
+                return resposta.status, json.loads(resposta.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+    
+    def test_operacoes_por_http(self):
+        """Testa pedido, estoque, histórico, cancelamento e estatísticas pela API"""
+        status, corpo = self._requisitar('/pedidos', {'id_produto': 1, 'quantidade': 2, 'descricao': "HTTP"})
+        self.assertEqual(status, 200)
+        self.assertTrue(corpo['sucesso'])
+        
+        status, corpo = self._requisitar('/estoque')
+        self.assertEqual(status, 200)
+        self.assertEqual([(p['id_produto'], p['quantidade_estoque']) for p in corpo['produtos']], [(1, 3)])
+        
+        status, corpo = self._requisitar('/historico?apenas_ativos=1')
+        self.assertEqual([p['descricao_pedido'] for p in corpo['pedidos']], ["HTTP"])
+        self.assertEqual(corpo['cursor'], 1)
+        
+        status, corpo = self._requisitar('/pedidos/1/cancelar', {})
+        self.assertEqual(status, 200)
+        self.assertTrue(corpo['sucesso'])
+        
+        status, corpo = self._requisitar('/estatisticas')
+        self.assertEqual(status, 200)
+        self.assertEqual(corpo['pedidos_cancelados'], 1)
+        self.assertEqual(corpo['pedidos_ativos'], 0)
+        
+        # Sem limite, uma página de LIMITE_HISTORICO pedidos; o cursor continua dali
+        self._requisitar('/pedidos', {'id_produto': 1, 'quantidade': 1})
+        limite_historico = servidor.LIMITE_HISTORICO
+        servidor.LIMITE_HISTORICO = 1
+        try:
+            _, primeira = self._requisitar('/historico')
+            _, segunda = self._requisitar(f"/historico?cursor={primeira['cursor']}")
+        finally:
+            servidor.LIMITE_HISTORICO = limite_historico
+        self.assertEqual([p['id_pedido'] for p in primeira['pedidos'] + segunda['pedidos']], [1, 2])
+    
+    def test_erros(self):
+        """Testa pedido recusado, corpo inválido e rota inexistente"""
+        status, corpo = self._requisitar('/pedidos', {'id_produto': 2, 'quantidade': 1})
+        self.assertEqual(status, 409)
+        self.assertFalse(corpo['sucesso'])
+        status, corpo = self._requisitar('/pedidos', {'quantidade': 1})
+        self.assertEqual(status, 400)
+        status, corpo = self._requisitar('/pedidos', {'itens': [{'id_produto': 1, 'quantidade': 1},
+                                                                {'id_produto': 2, 'quantidade': 1}]})
+        self.assertEqual(status, 409)
+        self.assertIn("Item 2", corpo['mensagem'])
+        status, corpo = self._requisitar('/pedidos', {'itens': [{'id_produto': 1, 'quantidade': 2}]})
+        self.assertEqual(status, 200)
+        status, _ = self._requisitar('/nada')
+        self.assertEqual(status, 404)
+    
+    def test_reservas_por_http(self):
+        """Testa reserva, confirmação e liberação pela API"""
+        status, corpo = self._requisitar('/reservas', {'id_produto': 1, 'quantidade': 4, 'ttl': 60})
+        self.assertEqual(status, 200)
+        token = corpo['token']
+        
+        status, corpo = self._requisitar('/reservas', {'id_produto': 1, 'quantidade': 2})
+        self.assertEqual(status, 409)
+        self.assertIn("maior que disponível", corpo['mensagem'])
+        
+        status, corpo = self._requisitar(f'/reservas/{token}/confirmar', {'descricao': "Checkout"})
+        self.assertEqual(status, 200)
+        self.assertTrue(corpo['sucesso'])
+        status, _ = self._requisitar(f'/reservas/{token}/liberar', {})
+        self.assertEqual(status, 409)
+        
+        status, corpo = self._requisitar('/estoque')
+        self.assertEqual([p['quantidade_estoque'] for p in corpo['produtos']], [1])
+    
+    def test_leituras_simultaneas_agrupadas(self):
+        """Testa que leituras simultâneas pela API compartilham uma única execução"""
+        respostas = []
+        def ler():
+            respostas.append(self._requisitar('/estoque'))
+        leitores = [threading.Thread(target=ler) for _ in range(4)]
+        for leitor in leitores:
+            leitor.start()
+        for leitor in leitores:
+            leitor.join()
+        
+        self.assertEqual(len(respostas), 4)
+        self.assertTrue(all(status == 200 for status, _ in respostas))
+        self.assertLess(self.servidor.servico.leituras.execucoes, 4)
+    
+    def test_leituras_agrupadas(self):
+        """Testa o agrupamento por chave e a propagação de erros"""
+        leituras = LeiturasAgrupadas(janela=0.05)
+        chamadas = []
+        def ler():
+            chamadas.append(1)
+            return len(chamadas)
+        resultados = []
+        threads = [threading.Thread(target=lambda: resultados.append(leituras.obter('a', ler))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(resultados, [1] * 5)
+        # Chegada após a execução: novo grupo, nova leitura
+        self.assertEqual(leituras.obter('a', ler), 2)
+        
+        def falhar():
+            raise ValueError("falhou")
+        with self.assertRaises(ValueError):
+            leituras.obter('b', falhar)
+
+class TestMultiplosProcessos(unittest.TestCase):
+    """Duas instâncias sobre o mesmo arquivo, como dois processos: só o lock de
+    arquivo e a versão dos dados as coordenam"""
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.arquivo_teste = 'dados_teste/sistema_processos.xlsx'
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+        self.sistema_a = SistemaPedidos(self.arquivo_teste)
+        self.sistema_b = SistemaPedidos(self.arquivo_teste)
+        self.sistema_a.adicionar_produto("Produto", "Desc", 10.00, 20)
+    
+    def tearDown(self):
+        """Limpeza após cada teste"""
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+    
+    def test_sem_atualizacoes_perdidas(self):
+        """Testa pedidos simultâneos pelas duas instâncias sem perder gravações"""
+        resultados = []
+        
+        def fazer_pedidos(sistema):
+            for _ in range(15):
+                resultados.append(sistema.fazer_pedido(1, 1)[0])
+        
+        threads = [threading.Thread(target=fazer_pedidos, args=(sistema,))
+                   for sistema in (self.sistema_a, self.sistema_b)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        produtos, historico = self.sistema_a._carregar_dados()
+        self.assertEqual(sum(resultados), 20)
+        self.assertEqual(produtos.iloc[0]['quantidade_estoque'], 0)
+        self.assertEqual(len(historico), 20)
+        self.assertEqual(historico['id_pedido'].nunique(), 20)
+    
+    def test_conflito_detectado_na_gravacao(self):
+        """Testa que uma gravação sobre dados lidos antes de outra gravação é recusada"""
+        estado = self.sistema_a._obter_estado()
+        self.sistema_b.fazer_pedido(1, 5)
+        
+        registro = self.sistema_a._montar_pedido(estado, estado.produtos[1], 5, "")
+        with self.assertRaises(ConflitoVersao):
+            self.sistema_a._efetivar(estado, [registro])
+        
+        sucesso, _ = self.sistema_a.fazer_pedido(1, 5)
+        self.assertTrue(sucesso)
+        produtos, _ = self.sistema_b._carregar_dados()
+        self.assertEqual(produtos.iloc[0]['quantidade_estoque'], 10)
+    
+    def test_leitura_sem_recarga_com_versao_igual(self):
+        """Testa que listar_estoque só recarrega quando a versão dos dados muda"""
+        sistema = SistemaPedidos(self.arquivo_teste, tabela_estoque=False)
+        original = sistema.armazenamento.carregar_produtos
+        cargas = []
+        def contando():
+            cargas.append(1)
+            return original()
+        sistema.armazenamento.carregar_produtos = contando
+        
+        sistema.listar_estoque()
+        sistema.listar_estoque()
+        self.assertEqual(len(cargas), 1)
+        
+        self.sistema_b.fazer_pedido(1, 3)
+        estoque = sistema.listar_estoque()
+        self.assertEqual(len(cargas), 2)
+        self.assertEqual(estoque.iloc[0]['quantidade_estoque'], 17)
+
+class TestBenchmark(unittest.TestCase):
+    
+    def tearDown(self):
+        """Limpeza após cada teste"""
+        if os.path.exists('dados_teste'):
+            shutil.rmtree('dados_teste')
+    
+    def test_percentil(self):
+        """Testa o percentil pelo posto mais próximo"""
+        valores = list(range(1, 101))
+        self.assertEqual(benchmark.percentil(valores, 50), 50)
+        self.assertEqual(benchmark.percentil(valores, 99), 99)
+        self.assertEqual(benchmark.percentil([7], 95), 7)
+        self.assertIsNone(benchmark.percentil([], 50))
+    
+    def test_relatorio_json(self):
+        """Testa uma execução pequena e o formato do relatório"""
+        relatorio = benchmark.executar([30], [1, 2], 2, mecanismo='sqlite', pasta='dados_teste/benchmark')
+        
+        self.assertEqual(len(relatorio['resultados']), len(benchmark.OPERACOES) * 2)
+        for resultado in relatorio['resultados']:
+            self.assertEqual(resultado['operacoes'], 2)
+            self.assertEqual(resultado['falhas'], 0)
+            self.assertLessEqual(resultado['p50_ms'], resultado['p99_ms'])
+        json.dumps(relatorio)
+
+class TestMetricas(unittest.TestCase):
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.arquivo_teste = 'dados_teste/sistema_metricas.xlsx'
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+    
+    def tearDown(self):
+        """Limpeza após cada teste"""
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+    
+    def test_histograma(self):
+        """Testa contagem, máximo e percentis estimados pelos baldes"""
+        histograma = Histograma()
+        for ms in [0.05] * 90 + [7.0] * 9 + [20000.0]:
+            histograma.registrar(ms)
+        resumo = histograma.resumo()
+        self.assertEqual(resumo['contagem'], 100)
+        self.assertEqual(resumo['p50_ms'], 0.1)
+        self.assertEqual(resumo['p95_ms'], 10)
+        self.assertEqual(resumo['p99_ms'], 10)
+        self.assertEqual(resumo['maximo_ms'], 20000.0)
+        self.assertEqual(resumo['baldes'], {'<=0.1': 90, '<=10': 9, '>10000': 1})
+    
+    def test_fases_por_operacao(self):
+        """Testa a divisão do tempo em espera por lock, carga, lógica e gravação"""
+        sistema = SistemaPedidos(self.arquivo_teste)
+        sistema.adicionar_produto("Produto", "Desc", 10.00, 10)
+        
+        # Segurar o lock global para que o pedido espere por ele
+        sistema.lock.acquire()
+        thread = threading.Thread(target=sistema.fazer_pedido, args=(1, 1))
+        thread.start()
+        time.sleep(0.2)
+        sistema.lock.release()
+        thread.join()
+        # Leituras em cache: a primeira de cada carrega, a segunda reaproveita
+        for _ in range(2):
+            sistema.listar_estoque()
+            sistema.obter_estatisticas()
+        
+        metricas = sistema.metricas()
+        pedido = metricas['fazer_pedido']
+        self.assertEqual(pedido['total']['contagem'], 1)
+        self.assertGreaterEqual(pedido['espera_lock']['soma_ms'], 150)
+        self.assertGreater(pedido['carga']['soma_ms'], 0)
+        self.assertGreater(pedido['gravacao']['soma_ms'], 0)
+        for operacao in ('fazer_pedido', 'listar_estoque', 'obter_estatisticas'):
+            medidas = sum(metricas[operacao][fase]['soma_ms'] for fase in ('espera_lock', 'carga', 'gravacao'))
+            self.assertLessEqual(medidas, metricas[operacao]['total']['soma_ms'])
+            fases = medidas + metricas[operacao]['logica']['soma_ms']
+            self.assertAlmostEqual(fases, metricas[operacao]['total']['soma_ms'], places=3)
+        self.assertEqual(metricas['listar_estoque']['gravacao']['soma_ms'], 0)
+        self.assertGreater(metricas['obter_estatisticas']['carga']['soma_ms'], 0)
+        
+        # Carga dentro de carga (ex.: leitura em cache que lê o armazenamento) conta uma vez
+        metricas = MetricasOperacoes()
+        with metricas.operacao('leitura'):
+            with metricas.medir('carga'):
+                with metricas.medir('carga'):
+                    time.sleep(0.05)
+            time.sleep(0.05)
+        leitura = metricas.resumo()['leitura']
+        self.assertLess(leitura['carga']['soma_ms'], 100)
+        self.assertGreaterEqual(leitura['logica']['soma_ms'], 40)
+    
+    def test_paginas_do_historico_medidas(self):
+        """Testa que cada página de iterar_historico conta como uma operação, sem o tempo do consumidor"""
+        sistema = SistemaPedidos(self.arquivo_teste)
+        sistema.adicionar_produto("Produto", "Desc", 10.00, 10)
+        for _ in range(5):
+            sistema.fazer_pedido(1, 1)
+        
+        for pagina in sistema.iterar_historico(tamanho_pagina=2):
+            time.sleep(0.05)
+        
+        historico = sistema.metricas()['iterar_historico']
+        self.assertEqual(historico['total']['contagem'], 3)
+        self.assertGreater(historico['carga']['soma_ms'], 0)
+        self.assertLess(historico['total']['soma_ms'], 150)
+    
+    def test_gravacao_periodica(self):
+        """Testa o arquivo de métricas gravado em segundo plano e ao fechar"""
+        arquivo_metricas = 'dados_teste/metricas.json'
+        sistema = SistemaPedidos(self.arquivo_teste, arquivo_metricas=arquivo_metricas, intervalo_metricas=0.05)
+        sistema.adicionar_produto("Produto", "Desc", 10.00, 10)
+        sistema.fechar()
+        
+        with open(arquivo_metricas, encoding='utf-8') as arquivo:
+            conteudo = json.load(arquivo)
+        self.assertEqual(conteudo['operacoes']['adicionar_produto']['total']['contagem'], 1)
+
+class TestModelos(unittest.TestCase):
+    
+    def test_registros_compactos(self):
+        """Testa que produtos e pedidos não carregam um dict por instância"""
+        produto = Produto(1, "Produto", "", 10.0, 5)
+        pedido = Pedido(1, 1, "Produto", "", 2, 10.0, 20.0, "2025-01-01 10:00:00", 'ativo')
+        self.assertFalse(hasattr(produto, '__dict__'))
+        self.assertFalse(hasattr(pedido, '__dict__'))
+        with self.assertRaises(AttributeError):
+            produto.categoria = "Outra"
+    
+    def test_acesso_por_coluna(self):
+        """Testa a leitura dos campos pelo nome da coluna"""
+        produto = Produto(1, "Produto", "", 10.0, 5)
+        produto.quantidade_estoque -= 2
+        self.assertEqual(produto['quantidade_estoque'], 3)
+        with self.assertRaises(KeyError):
+            produto['inexistente']
+        
+        pedido = Pedido(1, 1, "Produto", "", 2, 10.0, 20.0, "2025-01-01 10:00:00", 'ativo')
+        self.assertEqual(pedido['valor_total'], 20.0)
+        self.assertEqual(pedido[0], 1)
+        cancelado = pedido.cancelado()
+        self.assertEqual((pedido.status, cancelado.status), ('ativo', 'cancelado'))
+    
+    def test_conversao_de_dataframe(self):
+        """Testa a conversão do histórico com tipos nativos e ida e volta"""
+        historico = pd.DataFrame([[1, 2, "Produto", None, 3, 10.0, 30.0, "2025-01-01 10:00:00", 'ativo']],
+                                 columns=COLUNAS_HISTORICO)
+        pedidos = pedidos_do_dataframe(historico)
+        self.assertIs(type(pedidos[0].id_pedido), int)
+        self.assertIsNone(pedidos[0].descricao_pedido)
+        _, volta = EstadoPedidos.montar_dataframes([], pedidos)
+        self.assertListEqual(list(volta.columns), COLUNAS_HISTORICO)
+        self.assertEqual(volta.iloc[0]['valor_total'], 30.0)
+
+class TestTabelaEstoque(unittest.TestCase):
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.arquivo_teste = 'dados_teste/sistema_tabela.xlsx'
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+        self.sistema = SistemaPedidos(self.arquivo_teste)
+        self.sistema.adicionar_produto("Produto A", "Desc", 10.00, 3)
+        self.sistema.adicionar_produto("Produto B", "Desc", 20.00, 0)
+    
+    def tearDown(self):
+        """Limpeza após cada teste"""
+        self.sistema.fechar()
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+    
+    def _contar_cargas(self, sistema):
+        """Conta as leituras do armazenamento feitas pelo sistema"""
+        cargas = []
+        for nome in ('carregar', 'carregar_produtos'):
+            original = getattr(sistema.armazenamento, nome)
+            def contando(*args, _original=original, **kwargs):
+                cargas.append(1)
+                return _original(*args, **kwargs)
+            setattr(sistema.armazenamento, nome, contando)
+        return cargas
+    
+    def test_tabela_espelha_estoque(self):
+        """Testa que pedidos e cancelamentos atualizam estoque e preço na tabela"""
+        tabela = self.sistema._tabela
+        self.assertEqual(tabela.ler(1), (3, 10.0))
+        self.sistema.fazer_pedido(1, 2)
+        self.assertEqual(tabela.ler(1), (1, 10.0))
+        self.sistema.cancelar_pedido(1)
+        self.assertEqual(tabela.ler(1), (3, 10.0))
+        self.assertIsNone(tabela.ler(99))
+    
+    def test_recusa_sem_ler_armazenamento(self):
+        """Testa que pedidos impossíveis são recusados apenas pela tabela mapeada"""
+        self.sistema.listar_estoque()
+        cargas = self._contar_cargas(self.sistema)
+        
+        sucesso, mensagem = self.sistema.fazer_pedido(2, 1)
+        self.assertFalse(sucesso)
+        self.assertIn("fora de estoque", mensagem)
+        sucesso, mensagem = self.sistema.fazer_pedido(1, 5)
+        self.assertFalse(sucesso)
+        self.assertIn("maior que disponível", mensagem)
+        sucesso, mensagem = self.sistema.fazer_pedido(99, 1)
+        self.assertFalse(sucesso)
+        self.assertIn("não existe", mensagem)
+        estoque = self.sistema.listar_estoque()
+        
+        self.assertEqual(len(cargas), 0)
+        self.assertListEqual(list(estoque['id_produto']), [1])
+    
+    def test_outro_processo_le_pela_tabela(self):
+        """Testa que outra instância vê o estoque atualizado pela tabela, sem reler o catálogo"""
+        outro = SistemaPedidos(self.arquivo_teste)
+        outro.listar_estoque()
+        cargas = self._contar_cargas(outro)
+        
+        self.sistema.fazer_pedido(1, 3)
+        sucesso, mensagem = outro.fazer_pedido(1, 1)
+        self.assertFalse(sucesso)
+        self.assertIn("fora de estoque", mensagem)
+        self.assertEqual(len(cargas), 0)
+        
+        self.sistema.adicionar_produto("Produto C", "Desc", 5.00, 4)
+        estoque = outro.listar_estoque()
+        self.assertListEqual(list(estoque['id_produto']), [3])
+        outro.fechar()
+    
+    def test_tabela_defasada_reconstruida(self):
+        """Testa que uma tabela que não espelha a versão atual é ignorada e reconstruída"""
+        self.sistema._tabela.definir(1, 0, 10.0)
+        self.sistema._tabela.definir_versao_dados(12345)
+        
+        sucesso, _ = self.sistema.fazer_pedido(1, 1)
+        self.assertTrue(sucesso)
+        self.assertEqual(self.sistema._tabela.ler(1), (2, 10.0))
+        self.assertTrue(self.sistema._tabela_em_dia())
+    
+    def test_escritor_interrompido(self):
+        """Testa que um slot deixado em escrita não trava leituras e é corrigido na próxima gravação"""
+        import struct
+        tabela = self.sistema._tabela
+        offset = tabela._offset(1)
+        sequencia = struct.unpack_from('<Q', tabela._mapa, offset)[0]
+        struct.pack_into('<Q', tabela._mapa, offset, sequencia + 1)  # escritor morreu no meio
+        
+        self.assertIsNone(tabela.ler(1))
+        self.assertEqual(self.sistema.buscar_produto_por_nome("Produto A").quantidade_estoque, 3)
+        sucesso, _ = self.sistema.fazer_pedido(1, 1)
+        self.assertTrue(sucesso)
+        self.assertEqual(struct.unpack_from('<Q', tabela._mapa, offset)[0] % 2, 0)
+        self.assertEqual(tabela.ler(1), (2, 10.0))
+        
+        struct.pack_into('<Q', tabela._mapa, tabela._offset(5), 1)
+        tabela.reconstruir(self.sistema._obter_estado().produtos.values(), tabela.versao_dados())
+        self.assertEqual(struct.unpack_from('<Q', tabela._mapa, tabela._offset(5))[0] % 2, 0)
+        self.assertEqual(tabela.ler(1), (2, 10.0))
+
+class TestCacheLeituras(unittest.TestCase):
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.arquivo_teste = 'dados_teste/sistema_cache.xlsx'
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+        self.sistemas = []
+    
+    def tearDown(self):
+        """Limpeza após cada teste"""
+        for sistema in self.sistemas:
+            sistema.fechar()
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+    
+    def _criar_sistema(self, **kwargs):
+        sistema = SistemaPedidos(self.arquivo_teste, **kwargs)
+        self.sistemas.append(sistema)
+        return sistema
+    
+    def _contar(self, objeto, nome):
+        """Conta as chamadas de um método do objeto"""
+        chamadas = []
+        original = getattr(objeto, nome)
+        def contando(*args, **kwargs):
+            chamadas.append(1)
+            return original(*args, **kwargs)
+        setattr(objeto, nome, contando)
+        return chamadas
+    
+    def test_lru_e_versao(self):
+        """Testa que o resultado vale só para a versão e que a chave menos usada sai primeiro"""
+        cache = CacheLeituras(capacidade=2)
+        calculos = []
+        def calcular(valor):
+            return lambda: calculos.append(valor) or valor
+        
+        self.assertEqual(cache.obter('a', 1, calcular('a1')), 'a1')
+        self.assertEqual(cache.obter('a', 1, calcular('outro')), 'a1')
+        self.assertEqual(cache.obter('a', 2, calcular('a2')), 'a2')
+        cache.obter('b', 2, calcular('b2'))
+        cache.obter('a', 2, calcular('outro'))
+        cache.obter('c', 2, calcular('c2'))  # descarta 'b', usada há mais tempo
+        
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.obter('a', 2, calcular('outro')), 'a2')
+        self.assertEqual(cache.obter('b', 2, calcular('b2 de novo')), 'b2 de novo')
+        self.assertListEqual(calculos, ['a1', 'a2', 'b2', 'c2', 'b2 de novo'])
+        self.assertEqual((cache.acertos, cache.faltas), (3, 5))
+    
+    def test_limite_de_linhas(self):
+        """Testa que o cache é limitado pelo total de linhas e não guarda resultados grandes demais"""
+        cache = CacheLeituras(capacidade=10, max_linhas=5)
+        calculos = []
+        def calcular(linhas):
+            return lambda: calculos.append(linhas) or list(range(linhas))
+        
+        cache.obter('a', 1, calcular(2), len)
+        cache.obter('b', 1, calcular(3), len)
+        self.assertEqual((len(cache), cache.linhas), (2, 5))
+        cache.obter('c', 1, calcular(1), len)  # descarta 'a' para caber
+        self.assertEqual((len(cache), cache.linhas), (2, 4))
+        
+        self.assertEqual(len(cache.obter('grande', 1, calcular(6), len)), 6)
+        cache.obter('grande', 1, calcular(6), len)  # não guardado: calculado de novo
+        self.assertEqual((len(cache), cache.linhas), (2, 4))
+        
+        cache.obter('b', 2, calcular(1), len)  # nova versão substitui as linhas da antiga
+        self.assertEqual(cache.linhas, 2)
+        self.assertListEqual(calculos, [2, 3, 1, 6, 6, 1])
+    
+    def test_historico_grande_nao_fica_em_cache(self):
+        """Testa que páginas do histórico acima do limite de linhas não ficam em memória"""
+        sistema = self._criar_sistema(max_linhas_cache=3)
+        sistema.adicionar_produto("Produto A", "Desc", 10.00, 10)
+        sistema.fazer_pedidos_em_lote([(1, 1)] * 5)
+        paginas = self._contar(sistema.armazenamento, 'carregar_pagina_historico')
+        
+        for _ in range(2):
+            list(sistema.iterar_historico(tamanho_pagina=10))       # 5 pedidos: não guardada
+            list(sistema.iterar_historico(tamanho_pagina=2, limite=2))  # 2 pedidos: guardada
+        self.assertEqual(len(paginas), 3)
+        self.assertEqual(sistema._cache_leituras.linhas, 2)
+    
+    def test_leituras_repetidas_sem_carga(self):
+        """Testa que leituras entre gravações não leem o armazenamento de novo"""
+        sistema = self._criar_sistema(tabela_estoque=False)
+        sistema.adicionar_produto("Produto A", "Desc", 10.00, 5)
+        sistema.fazer_pedido(1, 1)
+        cargas = self._contar(sistema.armazenamento, 'carregar_produtos')
+        historicos = self._contar(sistema.armazenamento, 'carregar_historico')
+        paginas = self._contar(sistema.armazenamento, 'carregar_pagina_historico')
+        
+        for _ in range(10):
+            estoque = sistema.listar_estoque()
+            estatisticas = sistema.obter_estatisticas()
+            historico = sistema.ver_historico()
+        self.assertEqual(len(cargas), 2)      # estoque e estatísticas
+        self.assertEqual(len(historicos), 1)  # estatísticas
+        self.assertEqual(len(paginas), 1)     # histórico
+        self.assertEqual(estoque.iloc[0]['quantidade_estoque'], 4)
+        self.assertEqual(estatisticas['pedidos_ativos'], 1)
+        self.assertEqual(len(historico), 1)
+        
+        # Alterar o resultado recebido não altera o cache
+        estoque.loc[0, 'quantidade_estoque'] = 999
+        self.assertEqual(sistema.listar_estoque().iloc[0]['quantidade_estoque'], 4)
+        
+        # Gravação muda a versão dos dados: o estoque é recarregado, e as estatísticas
+        # vêm dos contadores que a própria gravação atualizou
+        sistema.fazer_pedido(1, 2)
+        antes = len(cargas)
+        self.assertEqual(sistema.listar_estoque().iloc[0]['quantidade_estoque'], 2)
+        self.assertEqual(sistema.obter_estatisticas()['pedidos_ativos'], 2)
+        self.assertEqual(len(cargas), antes + 1)
+        self.assertEqual(len(historicos), 1)
+    
+    def test_estado_reaproveitado_entre_operacoes(self):
+        """Testa que operações seguidas do modo síncrono não recarregam o catálogo"""
+        sistema = self._criar_sistema(tabela_estoque=False)
+        sistema.adicionar_produto("Produto A", "Desc", 10.00, 10)
+        sistema.fazer_pedido(1, 1)
+        cargas = self._contar(sistema.armazenamento, 'carregar_produtos')
+        
+        for _ in range(3):
+            self.assertTrue(sistema.fazer_pedido(1, 1)[0])
+        self.assertTrue(sistema.cancelar_pedido(2)[0])
+        self.assertTrue(sistema.adicionar_produto("Produto B", "Desc", 5.00, 1)[0])
+        self.assertFalse(sistema.adicionar_produto("produto b", "Desc", 5.00, 1)[0])
+        self.assertEqual(len(cargas), 0)
+        self.assertEqual(ArmazenamentoExcel(self.arquivo_teste).carregar_produtos().iloc[0]['quantidade_estoque'], 7)
+        
+        # Gravação de outra instância: a próxima operação recarrega
+        self._criar_sistema(tabela_estoque=False).fazer_pedido(1, 7)
+        self.assertFalse(sistema.fazer_pedido(1, 1)[0])
+        self.assertEqual(len(cargas), 1)
+        
+        # Gravação que falha: o estado com o pedido aplicado é descartado
+        registrar = sistema.armazenamento.registrar
+        def falhar(*args, **kwargs):
+            raise OSError("disco cheio")
+        sistema.armazenamento.registrar = falhar
+        with self.assertRaises(OSError):
+            sistema.fazer_pedido(2, 1)
+        sistema.armazenamento.registrar = registrar
+        self.assertTrue(sistema.fazer_pedido(2, 1)[0])
+        self.assertEqual(len(cargas), 2)
+        self.assertEqual(ArmazenamentoExcel(self.arquivo_teste).carregar_produtos().iloc[1]['quantidade_estoque'], 0)
+    
+    def test_gravacao_de_outro_processo_invalida(self):
+        """Testa que a gravação de outra instância invalida o cache pela versão compartilhada"""
+        sistema = self._criar_sistema()
+        sistema.adicionar_produto("Produto A", "Desc", 10.00, 5)
+        self.assertEqual(sistema.obter_estatisticas()['pedidos_ativos'], 0)
+        
+        outro = self._criar_sistema()
+        outro.fazer_pedido(1, 5)
+        self.assertEqual(sistema.obter_estatisticas()['pedidos_ativos'], 1)
+        self.assertTrue(sistema.listar_estoque().empty)
+    
+    def test_estatisticas_gravadas_com_a_versao(self):
+        """Testa que, no modo síncrono, cada gravação soma os seus deltas às estatísticas, sem varredura"""
+        sistema = self._criar_sistema()
+        sistema.adicionar_produto("Produto A", "Desc", 10.00, 5)
+        sistema.adicionar_produto("Produto B", "Desc", 20.00, 1)
+        self.assertEqual(sistema.obter_estatisticas()['total_produtos'], 2)  # primeira leitura: varredura
+        outro = self._criar_sistema()
+        varreduras = self._contar(sistema, '_calcular_estatisticas')
+        varreduras_outro = self._contar(outro, '_calcular_estatisticas')
+        
+        sistema.fazer_pedido(1, 2)
+        outro.fazer_pedidos_em_lote([(2, 1), (1, 1)])
+        sistema.cancelar_pedido(1)
+        estatisticas = outro.obter_estatisticas()
+        self.assertDictEqual(sistema.obter_estatisticas(), estatisticas)
+        self.assertEqual(len(varreduras) + len(varreduras_outro), 0)
+        self.assertEqual(estatisticas['produtos_sem_estoque'], 1)
+        self.assertEqual(estatisticas['pedidos_ativos'], 2)
+        self.assertEqual(estatisticas['pedidos_cancelados'], 1)
+        self.assertAlmostEqual(estatisticas['valor_total_pedidos_ativos'], 30.0)
+        self.assertAlmostEqual(estatisticas['valor_total_geral'], 50.0)
+        self.assertEqual(sistema.recalcular_estatisticas(), (True, {}))
+    
+    def test_recalcular_confere_estatisticas_servidas(self):
+        """Testa que, no modo síncrono, as estatísticas gravadas são conferidas com a varredura completa"""
+        sistema = self._criar_sistema(remover_acentos=True)
+        sistema.adicionar_produto("Ação", "Desc", 10.00, 5)
+        sistema.fazer_pedido(1, 2)
+        self.assertEqual(sistema.recalcular_estatisticas(), (True, {}))
+        
+        # Contadores gravados divergentes dos dados (ex.: delta somado errado)
+        estatisticas = sistema.obter_estatisticas()
+        sistema._coordenacao.gravar_estatisticas(sistema._versao_dados(), {**estatisticas, 'pedidos_ativos': 99})
+        consistente, divergencias = sistema.recalcular_estatisticas()
+        self.assertFalse(consistente)
+        self.assertDictEqual(divergencias, {'pedidos_ativos': (99, 1)})
+        self.assertEqual(sistema.obter_estatisticas()['pedidos_ativos'], 1)
+        self.assertEqual(sistema.recalcular_estatisticas(), (True, {}))
+    
+    def test_historico_filtrado_limitado(self):
+        """Testa que cada período do histórico tem sua entrada, até a capacidade do cache"""
+        sistema = self._criar_sistema(capacidade_cache=2)
+        sistema.adicionar_produto("Produto A", "Desc", 10.00, 5)
+        sistema.fazer_pedido(1, 1)
+        historicos = self._contar(sistema.armazenamento, 'carregar_pagina_historico')
+        
+        for _ in range(3):
+            list(sistema.iterar_historico(desde='2000-01-01'))
+            list(sistema.iterar_historico(desde='2000-01-02'))
+        self.assertEqual(len(historicos), 2)
+        
+        list(sistema.iterar_historico(desde='2000-01-03'))
+        list(sistema.iterar_historico(desde='2000-01-01'))
+        self.assertEqual(len(historicos), 4)
+        self.assertEqual(len(sistema._cache_leituras), 2)
+    
+    def test_modo_residente(self):
+        """Testa o cache por versão publicada no modo residente"""
+        sistema = self._criar_sistema(modo=MODO_RESIDENTE, journal=False)
+        sistema.adicionar_produto("Produto A", "Desc", 10.00, 5)
+        estoque = sistema.listar_estoque()
+        self.assertIs(sistema._estoque_disponivel(), sistema._estoque_disponivel())
+        
+        sistema.fazer_pedido(1, 5)
+        self.assertFalse(estoque.empty)
+        self.assertTrue(sistema.listar_estoque().empty)
+        self.assertEqual(sistema.obter_estatisticas()['produtos_sem_estoque'], 1)
+
+
+class TestInicializacao(unittest.TestCase):
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.arquivo_teste = 'dados_teste/sistema_inicializacao.xlsx'
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+        sistema = SistemaPedidos(self.arquivo_teste)
+        sistema.adicionar_produto("Produto A", "Desc", 10.00, 3)
+        sistema.fechar()
+    
+    def tearDown(self):
+        """Limpeza após cada teste"""
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+    
+    def test_modulo_adiado(self):
+        """Testa que o módulo só é importado no primeiro acesso a um atributo"""
+        modulo = ModuloAdiado('json')
+        self.assertIsNone(modulo._modulo)
+        self.assertEqual(modulo.dumps([1]), '[1]')
+        self.assertIs(modulo._modulo, json)
+        self.assertTrue(modulo.carregado())
+    
+    def test_importar_main_sem_pandas(self):
+        """Testa que importar o sistema não importa pandas nem openpyxl"""
+        pasta = os.path.dirname(os.path.abspath(__file__))
+        saida = subprocess.run(
+            [sys.executable, '-c', "import sys, main; print('pandas' in sys.modules, 'openpyxl' in sys.modules)"],
+            cwd=pasta, capture_output=True, text=True, check=True
+        ).stdout
+        self.assertEqual(saida.strip(), "False False")
+    
+    def test_tabela_conferida_no_primeiro_uso(self):
+        """Testa que a abertura não lê os dados e a tabela defasada é reconstruída no primeiro uso"""
+        sistema = SistemaPedidos(self.arquivo_teste)
+        sistema._tabela.definir_versao_dados(12345)
+        sistema.fechar()
+        
+        sistema = SistemaPedidos(self.arquivo_teste)
+        self.assertEqual(sistema._tabela.versao_dados(), 12345)
+        estoque = sistema.listar_estoque()
+        self.assertListEqual(list(estoque['quantidade_estoque']), [3])
+        self.assertTrue(sistema._tabela_em_dia())
+        sistema.fechar()
+    
+    def test_medir_inicializacao(self):
+        """Testa o relatório de tempos de inicialização"""
+        tempos = main.medir_inicializacao(self.arquivo_teste)
+        for chave in ('importacao_ms', 'construcao_ms', 'menu_ms', 'ate_menu_ms', 'primeira_carga_ms'):
+            self.assertGreaterEqual(tempos[chave], 0)
+        self.assertIn('pandas_antes_do_menu', tempos)
+
+class TestLeiturasIsoladas(unittest.TestCase):
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.pasta_teste = 'dados_teste'
+        if os.path.exists(self.pasta_teste):
+            shutil.rmtree(self.pasta_teste)
+        self.sistemas = []
+    
+    def tearDown(self):
+        """Limpeza após cada teste"""
+        for sistema in self.sistemas:
+            sistema.fechar()
+        if os.path.exists(self.pasta_teste):
+            shutil.rmtree(self.pasta_teste)
+    
+    def _sistema(self, nome, **kwargs):
+        sistema = SistemaPedidos(os.path.join(self.pasta_teste, nome), **kwargs)
+        self.sistemas.append(sistema)
+        sistema.adicionar_produto("Produto A", "Desc", 10.00, 10)
+        sistema.adicionar_produto("Produto B", "Desc", 20.00, 10)
+        return sistema
+    
+    def test_retrato_excel(self):
+        """Testa que o retrato da planilha continua lendo a versão aberta após uma gravação"""
+        sistema = self._sistema('isolado.xlsx', tabela_estoque=False)
+        with sistema.armazenamento.retrato() as leitor:
+            sistema.fazer_pedido(1, 3)
+            self.assertEqual(leitor.carregar_produtos()['quantidade_estoque'].tolist(), [10, 10])
+            self.assertEqual(len(leitor.carregar_historico()), 0)
+        self.assertEqual(sistema.armazenamento.carregar_produtos()['quantidade_estoque'].tolist(), [7, 10])
+    
+    def test_retrato_sqlite(self):
+        """Testa que o retrato do SQLite é uma transação de leitura isolada"""
+        armazenamento = ArmazenamentoSQLite(os.path.join(self.pasta_teste, 'isolado.db'))
+        sistema = self._sistema('isolado.db', armazenamento=armazenamento, tabela_estoque=False)
+        with armazenamento.retrato() as leitor:
+            self.assertEqual(leitor.carregar_produtos()['quantidade_estoque'].tolist(), [10, 10])
+            sistema.fazer_pedido(1, 3)
+            self.assertEqual(leitor.carregar_produtos()['quantidade_estoque'].tolist(), [10, 10])
+            self.assertEqual(len(leitor.carregar_historico()), 0)
+        self.assertEqual(armazenamento.carregar_produtos()['quantidade_estoque'].tolist(), [7, 10])
+    
+    def test_tabela_em_alteracao_nao_e_usada(self):
+        """Testa que a leitura da tabela é descartada se uma gravação estiver alterando slots"""
+        sistema = self._sistema('tabela.xlsx')
+        self.assertIsNotNone(sistema._produtos_da_tabela())
+        versao = sistema._tabela.versao_dados()
+        sistema._tabela.definir_versao_dados(VERSAO_INVALIDA)
+        self.assertIsNone(sistema._produtos_da_tabela())
+        # Sem a tabela, a leitura vem do arquivo
+        self.assertEqual([p.quantidade_estoque for p in sistema.produtos_disponiveis()], [10, 10])
+        sistema._tabela.definir_versao_dados(versao)
+    
+    def test_retrato_residente_imutavel(self):
+        """Testa que um retrato não muda e que operações só aparecem após publicadas"""
+        sistema = self._sistema('residente.xlsx', modo=MODO_RESIDENTE, intervalo_flush=60)
+        estado = sistema._estado
+        retrato = estado.retrato()
+        sistema.fazer_pedido(1, 3)
+        self.assertEqual(retrato.produtos[1].quantidade_estoque, 10)
+        self.assertEqual(retrato.estatisticas['total_pedidos'], 0)
+        self.assertEqual(estado.retrato().produtos[1].quantidade_estoque, 7)
+        
+        # Registro aplicado e ainda não publicado: invisível aos leitores
+        registro = {'operacao': 'cancelamento', 'id_pedido': 1, 'id_produto': 1, 'quantidade_pedida': 3}
+        deltas = estado.aplicar(registro)
+        self.assertEqual(sistema.listar_estoque()['quantidade_estoque'].tolist(), [7, 10])
+        self.assertEqual(sistema.obter_estatisticas()['pedidos_ativos'], 1)
+        estado.publicar([registro], [deltas])
+        self.assertEqual(sistema.listar_estoque()['quantidade_estoque'].tolist(), [10, 10])
+        self.assertEqual(sistema.obter_estatisticas(), estado.estatisticas())
+        self.assertEqual(sistema.ver_historico()['status'].tolist(), ['cancelado'])
+    
+    def test_leitores_nao_esperam_escritores(self):
+        """Testa que leituras do modo residente concluem com todos os locks de escrita tomados"""
+        sistema = self._sistema('residente.xlsx', modo=MODO_RESIDENTE, intervalo_flush=60)
+        sistema.fazer_pedido(1, 1)
+        travado, liberar = threading.Event(), threading.Event()
+        def escritor():
+            with sistema._travar_tudo():
+                travado.set()
+                liberar.wait(10)
+        thread = threading.Thread(target=escritor)
+        thread.start()
+        travado.wait(10)
+        try:
+            resultados = []
+            leitor = threading.Thread(target=lambda: resultados.append((
+                sistema.listar_estoque(), sistema.ver_historico(), sistema.obter_estatisticas())))
+            leitor.start()
+            leitor.join(5)
+            self.assertFalse(leitor.is_alive())
+            estoque, historico, stats = resultados[0]
+            self.assertEqual(estoque['quantidade_estoque'].tolist(), [9, 10])
+            self.assertEqual(len(historico), 1)
+            self.assertEqual(stats['pedidos_ativos'], 1)
+        finally:
+            liberar.set()
+            thread.join()
+    
+    def test_pedidos_concorrentes_publicados(self):
+        """Testa que retratos acompanham pedidos concorrentes sem divergir do estado vivo"""
+        sistema = self._sistema('residente.xlsx', modo=MODO_RESIDENTE, intervalo_flush=60)
+        def comprar(id_produto):
+            for _ in range(5):
+                sistema.fazer_pedido(id_produto, 1)
+                sistema.obter_estatisticas()
+                sistema.listar_estoque()
+        threads = [threading.Thread(target=comprar, args=(1 + i % 2,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        retrato = sistema._estado.retrato()
+        self.assertEqual([p.quantidade_estoque for p in retrato.produtos.values()], [0, 0])
+        self.assertEqual(retrato.ids_pedidos, list(range(1, 21)))
+        self.assertEqual(retrato.estatisticas, sistema._estado.estatisticas())
+    
+    def test_pedido_aguarda_publicacao_do_produto_novo(self):
+        """Testa que um pedido para um produto recém-incluído só é feito depois que a inclusão é publicada"""
+        sistema = self._sistema('residente.xlsx', modo=MODO_RESIDENTE, intervalo_flush=60)
+        publicar = sistema._estado.publicar
+        pedidos = []
+        def publicar_com_pedido(registros, deltas):
+            if registros[0]['operacao'] != 'produto':
+                return publicar(registros, deltas)
+            # Pedido concorrente para o novo ID, já presente em estado.produtos
+            pedido = threading.Thread(target=sistema.fazer_pedido, args=(registros[0]['id_produto'], 2))
+            pedido.start()
+            pedido.join(0.2)
+            pedidos.append((pedido, pedido.is_alive()))
+            publicar(registros, deltas)
+        sistema._estado.publicar = publicar_com_pedido
+        sistema.adicionar_produto("Produto C", "Desc", 5.00, 5)
+        sistema._estado.publicar = publicar
+        
+        pedido, aguardou = pedidos[0]
+        pedido.join()
+        self.assertTrue(aguardou)
+        self.assertEqual(sistema._estado.retrato().produtos[3].quantidade_estoque, 3)
+
+class TestHistoricoPaginado(unittest.TestCase):
+    
+    def setUp(self):
+        """Histórico com 25 pedidos em dias diferentes, um a cada cinco cancelado"""
+        self.arquivo_teste = 'dados_teste/sistema_historico.xlsx'
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+        
+        produtos = pd.DataFrame([[1, "Produto", "", 10.0, 100]], columns=COLUNAS_PRODUTOS)
+        historico = pd.DataFrame([
+            [i, 1, "Produto", f"Pedido {i}", 1, 10.0, 10.0,
+             f"2025-01-{i:02d} 12:00:00", 'cancelado' if i % 5 == 0 else 'ativo']
+            for i in range(1, 26)
+        ], columns=COLUNAS_HISTORICO)
+        ArmazenamentoExcel(self.arquivo_teste).salvar(produtos, historico)
+        self.sistema = SistemaPedidos(self.arquivo_teste, modo=MODO_RESIDENTE, intervalo_flush=60)
+    
+    def tearDown(self):
+        """Limpeza após cada teste"""
+        self.sistema.fechar()
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+    
+    def test_paginas_em_ordem_de_id(self):
+        """Testa páginas completas e a última parcial, em ordem de id_pedido"""
+        paginas = list(self.sistema.iterar_historico(tamanho_pagina=10))
+        
+        self.assertListEqual([len(pagina) for pagina in paginas], [10, 10, 5])
+        ids = [pedido['id_pedido'] for pagina in paginas for pedido in pagina]
+        self.assertListEqual(ids, list(range(1, 26)))
+    
+    def test_cursor_continua_apos_ultimo_id(self):
+        """Testa a retomada da paginação a partir de um cursor"""
+        primeira = next(self.sistema.iterar_historico(tamanho_pagina=10))
+        cursor = primeira[-1]['id_pedido']
+        
+        seguinte = next(self.sistema.iterar_historico(tamanho_pagina=10, cursor=cursor))
+        self.assertEqual(seguinte[0]['id_pedido'], 11)
+    
+    def test_filtros_e_limite(self):
+        """Testa filtros de status e data e o limite total de pedidos"""
+        ativos = [pedido['id_pedido'] for pagina in self.sistema.iterar_historico(
+            apenas_ativos=True, desde='2025-01-04', ate='2025-01-11') for pedido in pagina]
+        self.assertListEqual(ativos, [4, 6, 7, 8, 9, 11])
+        
+        limitados = [pedido['id_pedido'] for pagina in self.sistema.iterar_historico(
+            limite=7, tamanho_pagina=3) for pedido in pagina]
+        self.assertListEqual(limitados, [1, 2, 3, 4, 5, 6, 7])
+    
+    def test_registros_somente_leitura(self):
+        """Testa que os registros entregues não alteram o estado"""
+        pedido = next(self.sistema.iterar_historico(tamanho_pagina=1))[0]
+        with self.assertRaises(TypeError):
+            pedido['status'] = 'cancelado'
+
+class TestGravacaoIncrementalExcel(unittest.TestCase):
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.arquivo_teste = 'dados_teste/sistema_incremental.xlsx'
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+        self.sistema = SistemaPedidos(self.arquivo_teste, tabela_estoque=False)
+        self.sistema.adicionar_produto("Produto A", "Desc", 10.00, 10)
+        self.sistema.adicionar_produto("Produto B", "Desc", 20.00, 5)
+    
+    def tearDown(self):
+        """Limpeza após cada teste"""
+        self.sistema.fechar()
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+    
+    def _conferir_com_arquivo(self):
+        """As abas em memória são iguais às relidas do arquivo"""
+        produtos, historico = self.sistema.armazenamento.carregar()
+        produtos_arquivo, historico_arquivo = ArmazenamentoExcel(self.arquivo_teste).carregar()
+        self.assertEqual(produtos.values.tolist(), produtos_arquivo.values.tolist())
+        self.assertEqual(historico.values.tolist(), historico_arquivo.values.tolist())
+        return produtos_arquivo, historico_arquivo
+    
+    def test_altera_apenas_celulas_afetadas(self):
+        """Testa que a gravação mantém o restante da planilha (ex.: abas de outros usuários)"""
+        import openpyxl
+        livro = openpyxl.load_workbook(self.arquivo_teste)
+        livro.create_sheet('Notas')['A1'] = "mantida"
+        livro.save(self.arquivo_teste)
+        
+        self.sistema.fazer_pedido(1, 3)
+        self.sistema.fazer_pedido(2, 1)
+        self.sistema.cancelar_pedido(1)
+        
+        livro = openpyxl.load_workbook(self.arquivo_teste)
+        self.assertEqual(livro['Notas']['A1'].value, "mantida")
+        produtos, historico = self._conferir_com_arquivo()
+        self.assertListEqual(list(produtos['quantidade_estoque']), [10, 4])
+        self.assertListEqual(list(historico['status']), ['cancelado', 'ativo'])
+    
+    def test_importacao_sem_varrer_a_aba(self):
+        """Testa que acrescentar linhas não percorre a aba inteira a cada registro (max_row)"""
+        from openpyxl.worksheet.worksheet import Worksheet
+        max_row = Worksheet.max_row
+        varreduras = []
+        def contando(aba):
+            varreduras.append(1)
+            return max_row.fget(aba)
+        Worksheet.max_row = property(contando)
+        try:
+            self.sistema.fazer_pedido(1, 1)  # abre a planilha: uma varredura por aba
+            varreduras.clear()
+            importados, _ = self.sistema.adicionar_produtos_em_lote(pd.DataFrame({
+                'nome': [f"Importado {i}" for i in range(500)], 'descricao': "Lote",
+                'preco_unitario': 1.0, 'quantidade_estoque': 1}))
+            self.sistema.fazer_pedido(3, 1)
+        finally:
+            Worksheet.max_row = max_row
+        
+        self.assertEqual(importados, 500)
+        self.assertEqual(len(varreduras), 0)
+        produtos, historico = self._conferir_com_arquivo()
+        self.assertListEqual(list(produtos['id_produto']), list(range(1, 503)))
+        self.assertListEqual(list(historico['id_produto']), [1, 3])
+    
+    def test_registros_idempotentes(self):
+        """Testa que registros já gravados não são aplicados de novo"""
+        self.sistema.fazer_pedido(1, 3)
+        registro = {'operacao': 'cancelamento', 'id_pedido': 1, 'id_produto': 1, 'quantidade_pedida': 3}
+        self.sistema.armazenamento.registrar([registro])
+        self.sistema.armazenamento.registrar([registro])
+        
+        produtos, historico = self._conferir_com_arquivo()
+        self.assertEqual(produtos.iloc[0]['quantidade_estoque'], 10)
+        self.assertEqual(len(historico), 1)
+    
+    def test_sem_reler_o_arquivo(self):
+        """Testa que operações seguidas não releem a planilha"""
+        self.sistema.fazer_pedido(1, 1)
+        leituras = []
+        excel_file = pd.ExcelFile
+        def contando(*args, **kwargs):
+            leituras.append(1)
+            return excel_file(*args, **kwargs)
+        pd.ExcelFile = contando
+        try:
+            for _ in range(3):
+                self.sistema.fazer_pedido(2, 1)
+            self.sistema.cancelar_pedido(1)
+            self.sistema.listar_estoque()
+        finally:
+            pd.ExcelFile = excel_file
+        
+        self.assertEqual(len(leituras), 0)
+        self._conferir_com_arquivo()
+    
+    def test_arquivo_substituido_por_outro_processo(self):
+        """Testa que a planilha é relida quando outro processo grava o arquivo"""
+        outro = SistemaPedidos(self.arquivo_teste, tabela_estoque=False)
+        self.sistema.fazer_pedido(1, 1)
+        outro.fazer_pedido(1, 2)
+        self.sistema.fazer_pedido(1, 3)
+        outro.fechar()
+        
+        produtos, historico = self._conferir_com_arquivo()
+        self.assertEqual(produtos.iloc[0]['quantidade_estoque'], 4)
+        self.assertListEqual(list(historico['id_pedido']), [1, 2, 3])
+    
+    def test_falha_ao_salvar(self):
+        """Testa que uma gravação que falha não altera o arquivo nem a planilha em memória"""
+        self.sistema.fazer_pedido(1, 1)
+        original = os.replace
+        def falhar(*args):
+            raise OSError("disco cheio")
+        os.replace = falhar
+        try:
+            with self.assertRaises(Exception):
+                self.sistema.fazer_pedido(1, 5)
+        finally:
+            os.replace = original
+        
+        self.assertTrue(self.sistema.fazer_pedido(2, 1)[0])
+        produtos, historico = self._conferir_com_arquivo()
+        self.assertListEqual(list(produtos['quantidade_estoque']), [9, 4])
+        self.assertEqual(len(historico), 2)
+        self.assertEqual([arquivo for arquivo in os.listdir(os.path.dirname(self.arquivo_teste))
+                          if arquivo.startswith('tmp')], [])
+
+class TestSistemaPedidosSQLite(TestSistemaPedidos):
+    """Executa os mesmos testes usando o mecanismo SQLite"""
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.arquivo_teste = 'dados_teste/sistema_teste.db'
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+        self.sistema = SistemaPedidos(armazenamento=ArmazenamentoSQLite(self.arquivo_teste))
+    
+    def test_migracao_e_exportacao_excel(self):
+        """Testa a migração de um Excel existente e a exportação de volta"""
+        excel = ArmazenamentoExcel('dados_teste/origem.xlsx')
+        SistemaPedidos(armazenamento=excel).adicionar_produto("Produto", "Desc", 100.00, 10)
+        
+        migrar(excel, self.sistema.armazenamento)
+        self.sistema.fazer_pedido(1, 4)
+        self.sistema.exportar_excel('dados_teste/exportado.xlsx')
+        
+        produtos, historico = ArmazenamentoExcel('dados_teste/exportado.xlsx').carregar()
+        self.assertEqual(produtos.iloc[0]['quantidade_estoque'], 6)
+        self.assertEqual(len(historico), 1)
+    
+    def test_operacoes_sem_ler_o_historico(self):
+        """Testa que pedidos, cancelamentos e reservas leem só as linhas usadas, nunca o histórico inteiro"""
+        self.sistema.adicionar_produto("Produto", "Desc", 100.00, 10)
+        self.sistema.fazer_pedido(1, 1)
+        sistema = SistemaPedidos(armazenamento=ArmazenamentoSQLite(self.arquivo_teste), tabela_estoque=False)
+        
+        def completo(*args, **kwargs):
+            raise AssertionError("histórico completo lido")
+        sistema.armazenamento.carregar = completo
+        sistema.armazenamento.carregar_historico = completo
+        
+        self.assertTrue(sistema.fazer_pedido(1, 2)[0])
+        self.sistema.fazer_pedido(1, 1)  # outra instância: a próxima operação recarrega os produtos
+        self.assertTrue(sistema.cancelar_pedido(1)[0])
+        sucesso, token = sistema.reservar_estoque(1, 3)
+        self.assertTrue(sucesso)
+        self.assertTrue(sistema.confirmar_reserva(token)[0])
+        sistema.fechar()
+        self.assertEqual(self.sistema.armazenamento.buscar_produto(1).iloc[0]['quantidade_estoque'], 4)
+    
+    def test_modo_residente_grava_por_linha(self):
+        """Testa o flush do modo residente aplicando registros no banco"""
+        with SistemaPedidos(modo=MODO_RESIDENTE, intervalo_flush=60,
+                            armazenamento=ArmazenamentoSQLite(self.arquivo_teste)) as sistema:
+            sistema.adicionar_produto("Produto", "Desc", 100.00, 10)
+            sistema.fazer_pedido(1, 3)
+            sistema.fazer_pedido(1, 2)
+            sistema.cancelar_pedido(2)
+        
+        produtos, historico = self.sistema.armazenamento.carregar()
+        self.assertEqual(produtos.iloc[0]['quantidade_estoque'], 7)
+        self.assertListEqual(list(historico['status']), ['ativo', 'cancelado'])
+
+@unittest.skipUnless(PYARROW_DISPONIVEL, "pyarrow não instalado")
+class TestSistemaPedidosParquet(TestSistemaPedidos):
+    """Executa os mesmos testes com o histórico em dataset Parquet"""
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.arquivo_teste = 'dados_teste/sistema_parquet'
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+        self.sistema = SistemaPedidos(armazenamento=ArmazenamentoParquet(self.arquivo_teste))
+    
+    @staticmethod
+    def _partes(pasta):
+        """Arquivos de dados em todas as partições mensais de uma pasta"""
+        return [
+            nome for raiz, _, nomes in os.walk(pasta) for nome in nomes if not nome.startswith('.')
+        ]
+    
+    def test_historico_append_only_com_projecao(self):
+        """Testa partes imutáveis por gravação e leitura só das colunas pedidas"""
+        self.sistema.adicionar_produto("Produto", "Desc", 100.00, 10)
+        self.sistema.fazer_pedido(1, 2)
+        self.sistema.fazer_pedido(1, 3)
+        self.sistema.cancelar_pedido(1)
+        
+        armazenamento = self.sistema.armazenamento
+        self.assertEqual(len(self._partes(armazenamento.pasta_historico)), 2)
+        self.assertEqual(len(self._partes(armazenamento.pasta_cancelamentos)), 1)
+        
+        historico = armazenamento.carregar_historico(['status', 'valor_total'])
+        self.assertListEqual(list(historico.columns), ['status', 'valor_total'])
+        self.assertListEqual(list(historico['status']), ['cancelado', 'ativo'])
+        
+        stats = self.sistema.obter_estatisticas()
+        self.assertEqual(stats['pedidos_cancelados'], 1)
+        self.assertAlmostEqual(stats['valor_total_pedidos_ativos'], 300.00)
+        
+        armazenamento.compactar()
+        self.assertEqual(len(self._partes(armazenamento.pasta_historico)), 1)
+        self.assertEqual(len(self._partes(armazenamento.pasta_cancelamentos)), 0)
+        produtos, historico = armazenamento.carregar()
+        self.assertListEqual(list(historico['status']), ['cancelado', 'ativo'])
+        self.assertEqual(produtos.iloc[0]['quantidade_estoque'], 7)
+    
+    def test_falha_nos_produtos_descarta_partes(self):
+        """Testa que, se a gravação dos produtos falhar, o pedido não fica registrado sem a baixa"""
+        self.sistema.adicionar_produto("Produto", "Desc", 100.00, 10)
+        armazenamento = self.sistema.armazenamento
+        gravar_tabela = armazenamento._gravar_tabela
+        def falhando(caminho, linhas, esquema):
+            if caminho == armazenamento.caminho_produtos:
+                raise OSError("disco cheio")
+            gravar_tabela(caminho, linhas, esquema)
+        armazenamento._gravar_tabela = falhando
+        try:
+            with self.assertRaises(Exception):
+                armazenamento.registrar([{
+                    'operacao': 'pedido', 'id_pedido': 1, 'id_produto': 1, 'nome_produto': "Produto",
+                    'descricao_pedido': "", 'quantidade_pedida': 4, 'preco_unitario': 100.0,
+                    'valor_total': 400.0, 'data_pedido': "2025-01-20 09:00:00", 'status': 'ativo'
+                }])
+        finally:
+            del armazenamento._gravar_tabela
+        
+        self.assertEqual(os.listdir(armazenamento.pasta_historico), ['mes=2025-01'])
+        self.assertEqual(os.listdir(os.path.join(armazenamento.pasta_historico, 'mes=2025-01')), [])
+        self.assertTrue(armazenamento.carregar_historico().empty)
+        self.assertEqual(armazenamento.carregar_produtos().iloc[0]['quantidade_estoque'], 10)
+        sucesso, mensagem = self.sistema.fazer_pedido(1, 4)
+        self.assertIn("Pedido #1", mensagem)
+        self.assertEqual(armazenamento.carregar_produtos().iloc[0]['quantidade_estoque'], 6)
+    
+    def test_queda_apos_confirmar_produtos(self):
+        """Testa que uma queda entre a troca dos produtos e a das partes não baixa o estoque duas vezes"""
+        sistema = SistemaPedidos(modo=MODO_RESIDENTE, intervalo_flush=60,
+                                 armazenamento=ArmazenamentoParquet(self.arquivo_teste))
+        sistema.adicionar_produto("Produto", "Desc", 100.00, 10)
+        sistema.sincronizar()
+        sistema.fazer_pedido(1, 4)
+        
+        def queda(caminho):
+            raise OSError("queda do processo")
+        sistema.armazenamento._concluir_parte = queda
+        with self.assertRaises(Exception):
+            sistema.sincronizar()
+        sistema._parar_flush.set()
+        sistema._thread_flush.join()
+        sistema._thread_flush = None
+        atexit.unregister(sistema.fechar)
+        sistema._journal.fechar()
+        
+        # Ao reabrir, as partes confirmadas entram no dataset e o diário reaplicado é ignorado
+        with SistemaPedidos(modo=MODO_RESIDENTE, intervalo_flush=60,
+                            armazenamento=ArmazenamentoParquet(self.arquivo_teste)) as sistema:
+            self.assertEqual(sistema.produtos_disponiveis()[0].quantidade_estoque, 6)
+        produtos, historico = ArmazenamentoParquet(self.arquivo_teste).carregar()
+        self.assertEqual(produtos.iloc[0]['quantidade_estoque'], 6)
+        self.assertListEqual(list(historico['id_pedido']), [1])
+    
+    def test_migracao_do_excel(self):
+        """Testa a conversão de um sistema_pedidos.xlsx existente"""
+        excel = ArmazenamentoExcel('dados_teste/origem.xlsx')
+        origem = SistemaPedidos(armazenamento=excel)
+        origem.adicionar_produto("Produto", "", 100.00, 10)
+        origem.fazer_pedido(1, 4)
+        
+        migrar(excel, self.sistema.armazenamento)
+        
+        produtos, historico = self.sistema._carregar_dados()
+        self.assertEqual(produtos.iloc[0]['quantidade_estoque'], 6)
+        self.assertEqual(historico.iloc[0]['valor_total'], 400.00)
+        sucesso, mensagem = self.sistema.fazer_pedido(1, 1)
+        self.assertIn("Pedido #2", mensagem)
+    
+    def _registrar_pedidos_por_mes(self):
+        """Registra um pedido em janeiro e dois em fevereiro diretamente no armazenamento"""
+        self.sistema.adicionar_produto("Produto", "", 10.00, 10)
+        registros = []
+        for id_pedido, data in ((1, "2025-01-20 09:00:00"), (2, "2025-02-03 10:00:00"), (3, "2025-02-28 23:00:00")):
+            registros.append({
+                'operacao': 'pedido', 'id_pedido': id_pedido, 'id_produto': 1, 'nome_produto': "Produto",
+                'descricao_pedido': "", 'quantidade_pedida': 1, 'preco_unitario': 10.0,
+                'valor_total': 10.0, 'data_pedido': data, 'status': 'ativo'
+            })
+        self.sistema.armazenamento.registrar(registros)
+        self.sistema._coordenacao.avancar_versao()  # como toda gravação coordenada
+    
+    def test_particoes_mensais(self):
+        """Testa uma partição por mês e o cancelamento gravado no mês do pedido"""
+        self._registrar_pedidos_por_mes()
+        armazenamento = self.sistema.armazenamento
+        
+        self.assertListEqual(armazenamento._meses(armazenamento.pasta_historico), ['2025-01', '2025-02'])
+        sucesso, _ = self.sistema.cancelar_pedido(1)
+        self.assertTrue(sucesso)
+        self.assertListEqual(armazenamento._meses(armazenamento.pasta_cancelamentos), ['2025-01'])
+        
+        sucesso, _ = self.sistema.fazer_pedido(1, 1)
+        self.assertTrue(sucesso)
+        self.assertEqual(armazenamento.buscar_pedido(4).iloc[0]['status'], 'ativo')
+        self.assertEqual(armazenamento.buscar_pedido(1).iloc[0]['status'], 'cancelado')
+        self.assertTrue(armazenamento.buscar_pedido(99).empty)
+    
+    def test_poda_de_particoes_por_periodo(self):
+        """Testa que consultas por período leem apenas as partições do intervalo"""
+        self._registrar_pedidos_por_mes()
+        armazenamento = self.sistema.armazenamento
+        
+        self.assertListEqual(armazenamento._meses_no_periodo(desde="2025-02-01 00:00:00"), ['2025-02'])
+        historico = armazenamento.carregar_historico(['id_pedido'], desde="2025-02-01 00:00:00",
+                                                     ate="2025-02-03 23:59:59")
+        self.assertListEqual(list(historico['id_pedido']), [2])
+        
+        paginas = list(self.sistema.iterar_historico(desde=date(2025, 2, 1), tamanho_pagina=1))
+        self.assertListEqual([pagina[0]['id_pedido'] for pagina in paginas], [2, 3])
+
+class TestModoResidente(unittest.TestCase):
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.arquivo_teste = 'dados_teste/sistema_residente.xlsx'
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+        
+        # Intervalo longo para que só as gravações explícitas aconteçam
+        self.sistema = SistemaPedidos(self.arquivo_teste, modo=MODO_RESIDENTE, intervalo_flush=60)
+    
+    def tearDown(self):
+        """Limpeza após cada teste"""
+        self.sistema.fechar()
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+    
+    def test_alteracoes_ficam_em_memoria_ate_sincronizar(self):
+        """Testa que as mutações só chegam ao Excel após o flush"""
+        self.sistema.adicionar_produto("Produto", "Desc", 100.00, 10)
+        self.sistema.fazer_pedido(1, 4)
+        
+        # Arquivo ainda não foi reescrito
+        produtos, historico = self.sistema.armazenamento.carregar()
+        self.assertTrue(produtos.empty)
+        self.assertTrue(historico.empty)
+        
+        # Estado em memória já reflete as operações
+        produtos, historico = self.sistema._carregar_dados()
+        self.assertEqual(produtos.iloc[0]['quantidade_estoque'], 6)
+        self.assertEqual(len(historico), 1)
+        
+        self.sistema.sincronizar()
+        produtos, historico = self.sistema.armazenamento.carregar()
+        self.assertEqual(produtos.iloc[0]['quantidade_estoque'], 6)
+        self.assertEqual(len(historico), 1)
+    
+    def test_fechar_persiste_e_reabre_estado(self):
+        """Testa que fechar grava o estado e uma nova instância o recarrega"""
+        self.sistema.adicionar_produto("Produto", "Desc", 100.00, 10)
+        self.sistema.fazer_pedido(1, 3)
+        self.sistema.cancelar_pedido(1)
+        self.sistema.fechar()
+        
+        with SistemaPedidos(self.arquivo_teste, modo=MODO_RESIDENTE) as reaberto:
+            stats = reaberto.obter_estatisticas()
+            self.assertEqual(stats['total_produtos'], 1)
+            self.assertEqual(stats['pedidos_cancelados'], 1)
+            produtos, _ = reaberto._carregar_dados()
+            self.assertEqual(produtos.iloc[0]['quantidade_estoque'], 10)
+    
+    def test_flush_em_segundo_plano(self):
+        """Testa que o flusher grava sozinho após o intervalo"""
+        self.sistema.fechar()
+        self.sistema = SistemaPedidos(self.arquivo_teste, modo=MODO_RESIDENTE, intervalo_flush=0.05)
+        self.sistema.adicionar_produto("Produto", "Desc", 100.00, 10)
+        
+        produtos = pd.DataFrame()
+        for _ in range(100):
+            time.sleep(0.05)
+            try:
+                produtos, _ = self.sistema.armazenamento.carregar()
+            except Exception:
+                continue  # Arquivo sendo gravado neste instante
+            if not produtos.empty:
+                break
+        
+        self.assertEqual(len(produtos), 1)
+
+class TestEstadoPedidos(unittest.TestCase):
+    
+    def setUp(self):
+        """Estado com dois produtos e três pedidos carregados"""
+        produtos = pd.DataFrame([
+            [1, "Produto A", "", 10.0, 5],
+            [2, "Produto B", "", 20.0, 5],
+        ], columns=COLUNAS_PRODUTOS)
+        historico = pd.DataFrame([
+            [1, 1, "Produto A", "", 1, 10.0, 10.0, "2025-01-01 10:00:00", "ativo"],
+            [2, 2, "Produto B", "", 2, 20.0, 40.0, "2025-01-01 11:00:00", "cancelado"],
+            [3, 1, "Produto A", "", 1, 10.0, 10.0, "2025-01-02 10:00:00", "ativo"],
+        ], columns=COLUNAS_HISTORICO)
+        self.estado = EstadoPedidos(produtos, historico)
+    
+    def _registro_pedido(self, id_pedido, id_produto=2, quantidade=1):
+        return {
+            'operacao': 'pedido', 'id_pedido': id_pedido, 'id_produto': id_produto,
+            'nome_produto': "Produto B", 'descricao_pedido': "", 'quantidade_pedida': quantidade,
+            'preco_unitario': 20.0, 'valor_total': 20.0 * quantidade,
+            'data_pedido': "2025-01-03 10:00:00", 'status': 'ativo'
+        }
+    
+    def test_indice_de_pedidos(self):
+        """Testa a busca por id_pedido após carga, inclusão e cancelamento"""
+        self.assertEqual(self.estado.buscar_pedido(3), (2, self.estado.historico[2]))
+        self.assertEqual(self.estado.buscar_pedido(99), (None, None))
+        
+        self.estado.aplicar(self._registro_pedido(self.estado.alocar_id_pedido()))
+        posicao, pedido = self.estado.buscar_pedido(4)
+        self.assertEqual(posicao, 3)
+        self.assertEqual(pedido['id_produto'], 2)
+        
+        self.estado.aplicar({'operacao': 'cancelamento', 'id_pedido': 4})
+        self.assertEqual(self.estado.buscar_pedido(4)[1]['status'], 'cancelado')
+        self.assertEqual(self.estado.produtos[2]['quantidade_estoque'], 5)
+    
+    def test_aplicar_pedido_repetido_e_ignorado(self):
+        """Testa a idempotência ao reaplicar um pedido já presente"""
+        self.estado.aplicar(self._registro_pedido(4))
+        self.estado.aplicar(self._registro_pedido(4))
+        
+        self.assertEqual(len(self.estado.historico), 4)
+        self.assertEqual(self.estado.produtos[2]['quantidade_estoque'], 4)
+
+    def test_contadores_incrementais(self):
+        """Testa que os contadores acompanham inclusões, pedidos e cancelamentos"""
+        self.estado.aplicar({'operacao': 'produto', 'id_produto': 3, 'nome': "Produto C",
+                             'descricao': "", 'preco_unitario': 5.0, 'quantidade_estoque': 0})
+        self.estado.aplicar(self._registro_pedido(4, quantidade=5))
+        self.estado.aplicar({'operacao': 'cancelamento', 'id_pedido': 1})
+        
+        stats = self.estado.estatisticas()
+        self.assertEqual(stats['total_produtos'], 3)
+        self.assertEqual(stats['produtos_em_estoque'], 1)
+        self.assertEqual(stats['produtos_sem_estoque'], 2)
+        self.assertEqual(stats['total_pedidos'], 4)
+        self.assertEqual(stats['pedidos_ativos'], 2)
+        self.assertEqual(stats['pedidos_cancelados'], 2)
+        self.assertAlmostEqual(stats['valor_total_pedidos_ativos'], 110.0)
+        self.assertAlmostEqual(stats['valor_total_geral'], 160.0)
+        self.assertDictEqual(self.estado.recalcular_estatisticas(), {})
+    
+    def test_recalcular_corrige_divergencia(self):
+        """Testa que a varredura completa detecta e corrige contadores divergentes"""
+        self.estado.estatisticas()
+        self.estado._contadores['pedidos_ativos'] = 10
+        
+        divergencias = self.estado.recalcular_estatisticas()
+        
+        self.assertDictEqual(divergencias, {'pedidos_ativos': (10, 2)})
+        self.assertEqual(self.estado.estatisticas()['pedidos_ativos'], 2)
+
+class TestLocksPorProduto(unittest.TestCase):
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.arquivo_teste = 'dados_teste/sistema_locks.xlsx'
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+        self.sistema = SistemaPedidos(self.arquivo_teste, modo=MODO_RESIDENTE, intervalo_flush=60)
+        self.sistema.adicionar_produto("Produto A", "Desc", 100.00, 50)
+        self.sistema.adicionar_produto("Produto B", "Desc", 200.00, 30)
+        self.sistema.adicionar_produto("Produto C", "Desc", 50.00, 10)
+    
+    def tearDown(self):
+        """Limpeza após cada teste"""
+        self.sistema.fechar()
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+    
+    def test_produtos_diferentes_nao_se_bloqueiam(self):
+        """Testa que um pedido do produto B não espera o lock do produto A"""
+        resultados = []
+        with self.sistema._lock_do_produto(1):
+            thread = threading.Thread(target=lambda: resultados.append(self.sistema.fazer_pedido(2, 1)))
+            thread.start()
+            thread.join(timeout=5)
+            self.assertFalse(thread.is_alive())
+        
+        self.assertTrue(resultados[0][0])
+    
+    def test_cancelamento_de_pedido_gravado_apos_a_busca(self):
+        """Testa que um pedido que não existia ao travar não é alterado sem o lock do produto"""
+        self.sistema.fazer_pedido(1, 5)
+        estado = self.sistema._estado
+        buscar_pedido = estado.buscar_pedido
+        buscas = []
+        def primeira_sem_o_pedido(id_pedido):
+            # Simula o pedido gravado por outra thread logo após a busca feita antes do lock
+            buscas.append(id_pedido)
+            return (None, None) if len(buscas) == 1 else buscar_pedido(id_pedido)
+        estado.buscar_pedido = primeira_sem_o_pedido
+        try:
+            sucesso, mensagem = self.sistema.cancelar_pedido(1)
+        finally:
+            del estado.buscar_pedido
+        
+        self.assertFalse(sucesso)
+        self.assertIn("não encontrado", mensagem)
+        self.assertEqual(estado.produtos[1].quantidade_estoque, 45)
+        self.assertTrue(self.sistema.cancelar_pedido(1)[0])
+        self.assertEqual(estado.produtos[1].quantidade_estoque, 50)
+    
+    def test_integridade_com_pedidos_e_cancelamentos_concorrentes(self):
+        """Testa estoque e numeração com muitas threads em produtos diferentes"""
+        estoque_inicial = {1: 50, 2: 30, 3: 10}
+        
+        def worker(id_produto):
+            for _ in range(15):
+                sucesso, mensagem = self.sistema.fazer_pedido(id_produto, 2)
+                if sucesso and id_produto == 1:
+                    id_pedido = int(mensagem.split('#')[1].split(' ')[0])
+                    self.sistema.cancelar_pedido(id_pedido)
+        
+        threads = [threading.Thread(target=worker, args=(id_produto,))
+                   for id_produto in (1, 2, 3) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        produtos, historico = self.sistema._carregar_dados()
+        
+        # IDs de pedido únicos e contíguos
+        self.assertListEqual(sorted(historico['id_pedido']), list(range(1, len(historico) + 1)))
+        
+        # Estoque final = inicial - pedidos ativos, e nunca negativo
+        for _, produto in produtos.iterrows():
+            ativos = historico[(historico['id_produto'] == produto['id_produto']) & (historico['status'] == 'ativo')]
+            self.assertGreaterEqual(produto['quantidade_estoque'], 0)
+            self.assertEqual(produto['quantidade_estoque'],
+                             estoque_inicial[produto['id_produto']] - ativos['quantidade_pedida'].sum())
+        self.assertEqual(produtos.set_index('id_produto').loc[3, 'quantidade_estoque'], 0)
+        
+        # Contadores incrementais batem com a varredura completa
+        consistente, divergencias = self.sistema.recalcular_estatisticas()
+        self.assertTrue(consistente, divergencias)
+
+class TestJournal(unittest.TestCase):
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.arquivo_teste = 'dados_teste/sistema_journal.xlsx'
+        self.arquivo_journal = 'dados_teste/sistema_journal.journal'
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+        self.sistema = SistemaPedidos(self.arquivo_teste, modo=MODO_RESIDENTE, intervalo_flush=60)
+    
+    def tearDown(self):
+        """Limpeza após cada teste"""
+        self.sistema.fechar()
+        pasta_teste = os.path.dirname(self.arquivo_teste)
+        if os.path.exists(pasta_teste):
+            shutil.rmtree(pasta_teste)
+    
+    def _simular_queda(self):
+        """Interrompe o sistema sem gravar o Excel, como numa queda do processo"""
+        self.sistema._parar_flush.set()
+        self.sistema._thread_flush.join()
+        self.sistema._thread_flush = None
+        atexit.unregister(self.sistema.fechar)
+        self.sistema._journal.fechar()
+    
+    def test_reaplica_journal_apos_queda(self):
+        """Testa que operações não compactadas são recuperadas na inicialização"""
+        self.sistema.adicionar_produto("Produto", "Desc", 100.00, 10)
+        self.sistema.fazer_pedido(1, 3)
+        self.sistema.fazer_pedido(1, 2)
+        self.sistema.cancelar_pedido(1)
+        self._simular_queda()
+        
+        # Excel continua vazio; o diário tem as quatro operações
+        produtos, _ = self.sistema.armazenamento.carregar()
+        self.assertTrue(produtos.empty)
+        
+        self.sistema = SistemaPedidos(self.arquivo_teste, modo=MODO_RESIDENTE, intervalo_flush=60)
+        produtos, historico = self.sistema._carregar_dados()
+        self.assertEqual(produtos.iloc[0]['quantidade_estoque'], 8)
+        self.assertListEqual(list(historico['status']), ['cancelado', 'ativo'])
+        
+        # Próximo pedido continua a numeração
+        sucesso, mensagem = self.sistema.fazer_pedido(1, 1)
+        self.assertTrue(sucesso)
+        self.assertIn("Pedido #3", mensagem)
+    
+    def test_compactacao_trunca_journal(self):
+        """Testa que sincronizar incorpora o diário ao Excel e o esvazia"""
+        self.sistema.adicionar_produto("Produto", "Desc", 100.00, 10)
+        self.sistema.fazer_pedido(1, 3)
+        self.assertGreater(os.path.getsize(self.arquivo_journal), 0)
+        
+        self.sistema.sincronizar()
+        
+        self.assertEqual(os.path.getsize(self.arquivo_journal), 0)
+        self.assertFalse(os.path.exists(self.arquivo_journal + '.compactando'))
+        produtos, historico = self.sistema.armazenamento.carregar()
+        self.assertEqual(produtos.iloc[0]['quantidade_estoque'], 7)
+        self.assertEqual(len(historico), 1)
+    
+    def test_reaplicacao_idempotente_apos_compactacao_interrompida(self):
+        """Testa que registros já presentes no Excel não são aplicados duas vezes"""
+        self.sistema.adicionar_produto("Produto", "Desc", 100.00, 10)
+        self.sistema.fazer_pedido(1, 3)
+        self.sistema.cancelar_pedido(1)
+        
+        # Excel gravado, mas o trecho compactado não chegou a ser descartado
+        with open(self.arquivo_journal, encoding='utf-8') as arquivo:
+            conteudo = arquivo.read()
+        self.sistema.sincronizar()
+        self._simular_queda()
+        with open(self.arquivo_journal + '.compactando', 'w', encoding='utf-8') as arquivo:
+            arquivo.write(conteudo)
+        
+        self.sistema = SistemaPedidos(self.arquivo_teste, modo=MODO_RESIDENTE, intervalo_flush=60)
+        produtos, historico = self.sistema._carregar_dados()
+        self.assertEqual(len(produtos), 1)
+        self.assertEqual(len(historico), 1)
+        self.assertEqual(produtos.iloc[0]['quantidade_estoque'], 10)
+    
+    def test_pedido_multiplo_uma_linha_no_diario(self):
+        """Testa que os itens de um pedido ficam numa única linha do diário, reaplicada inteira ou não"""
+        self.sistema.adicionar_produto("Produto", "Desc", 100.00, 10)
+        self.sistema.fazer_pedido_multiplo([(1, 1), (1, 2)])
+        self._simular_queda()
+        
+        with open(self.arquivo_journal, encoding='utf-8') as arquivo:
+            linhas = arquivo.readlines()
+        self.assertEqual(len(linhas), 2)
+        
+        # Queda no meio da gravação do pedido: nenhum dos itens é reaplicado
+        with open(self.arquivo_journal, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(linhas[0] + linhas[1][:len(linhas[1]) // 2])
+        self.sistema = SistemaPedidos(self.arquivo_teste, modo=MODO_RESIDENTE, intervalo_flush=60)
+        produtos, historico = self.sistema._carregar_dados()
+        self.assertEqual(produtos.iloc[0]['quantidade_estoque'], 10)
+        self.assertTrue(historico.empty)
+        self._simular_queda()
+        
+        with open(self.arquivo_journal, 'w', encoding='utf-8') as arquivo:
+            arquivo.writelines(linhas)
+        self.sistema = SistemaPedidos(self.arquivo_teste, modo=MODO_RESIDENTE, intervalo_flush=60)
+        produtos, historico = self.sistema._carregar_dados()
+        self.assertEqual(produtos.iloc[0]['quantidade_estoque'], 7)
+        self.assertEqual(len(historico), 2)
+    
+    def test_ignora_linha_truncada(self):
+        """Testa que um registro gravado pela metade é descartado"""
+        self.sistema.adicionar_produto("Produto", "Desc", 100.00, 10)
+        self._simular_queda()
+        with open(self.arquivo_journal, 'a', encoding='utf-8') as arquivo:
+            arquivo.write('{"operacao": "pedido", "id_ped')
+        
+        self.sistema = SistemaPedidos(self.arquivo_teste, modo=MODO_RESIDENTE, intervalo_flush=60)
+        sucesso, _ = self.sistema.fazer_pedido(1, 2)
+        self.assertTrue(sucesso)
+        self.sistema.fechar()
+        
+        produtos, historico = self.sistema.armazenamento.carregar()
+        self.assertEqual(produtos.iloc[0]['quantidade_estoque'], 8)
+        self.assertEqual(len(historico), 1)
+    
+    def test_fsync_compartilhado_entre_threads(self):
+        """Testa que escritas concorrentes são levadas ao disco por fsyncs compartilhados"""
+        diario = Journal('dados_teste/concorrente.journal')
+        fsyncs = []
+        original = os.fsync
+        def fsync_lento(fd):
+            fsyncs.append(fd)
+            time.sleep(0.01)
+            original(fd)
+        
+        def escrever(thread):
+            for i in range(10):
+                diario.registrar([{'operacao': 'produto', 'id_produto': thread * 10 + i}])
+        
+        os.fsync = fsync_lento
+        try:
+            threads = [threading.Thread(target=escrever, args=(thread,)) for thread in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            os.fsync = original
+        diario.fechar()
+        
+        self.assertListEqual(sorted(registro['id_produto'] for registro in diario.ler_pendentes()), list(range(80)))
+        self.assertLess(len(fsyncs), 40)
+
 def executar_todos_os_testes():
     """Executa todos os testes e mostra relatório detalhado"""
     print("EXECUTANDO TESTES COMPLETOS DO SISTEMA")
@@ -189,7 +2434,30 @@ def executar_todos_os_testes():
     
     # Criar suite de testes
     loader = unittest.TestLoader()
-    suite = loader.loadTestsFromTestCase(TestSistemaPedidos)
+    suite = unittest.TestSuite()
+    suite.addTests(loader.loadTestsFromTestCase(TestSistemaPedidos))
+    suite.addTests(loader.loadTestsFromTestCase(TestPedidosEmLote))
+    suite.addTests(loader.loadTestsFromTestCase(TestReservas))
+    suite.addTests(loader.loadTestsFromTestCase(TestImportacaoProdutos))
+    suite.addTests(loader.loadTestsFromTestCase(TestIndiceNomes))
+    suite.addTests(loader.loadTestsFromTestCase(TestSistemaAsync))
+    suite.addTests(loader.loadTestsFromTestCase(TestServidorHTTP))
+    suite.addTests(loader.loadTestsFromTestCase(TestMultiplosProcessos))
+    suite.addTests(loader.loadTestsFromTestCase(TestTabelaEstoque))
+    suite.addTests(loader.loadTestsFromTestCase(TestInicializacao))
+    suite.addTests(loader.loadTestsFromTestCase(TestCacheLeituras))
+    suite.addTests(loader.loadTestsFromTestCase(TestLeiturasIsoladas))
+    suite.addTests(loader.loadTestsFromTestCase(TestBenchmark))
+    suite.addTests(loader.loadTestsFromTestCase(TestMetricas))
+    suite.addTests(loader.loadTestsFromTestCase(TestHistoricoPaginado))
+    suite.addTests(loader.loadTestsFromTestCase(TestGravacaoIncrementalExcel))
+    suite.addTests(loader.loadTestsFromTestCase(TestSistemaPedidosSQLite))
+    suite.addTests(loader.loadTestsFromTestCase(TestSistemaPedidosParquet))
+    suite.addTests(loader.loadTestsFromTestCase(TestModoResidente))
+    suite.addTests(loader.loadTestsFromTestCase(TestEstadoPedidos))
+    suite.addTests(loader.loadTestsFromTestCase(TestModelos))
+    suite.addTests(loader.loadTestsFromTestCase(TestLocksPorProduto))
+    suite.addTests(loader.loadTestsFromTestCase(TestJournal))
     
     # Executar testes com relatório detalhado
     runner = unittest.TextTestRunner(verbosity=2)
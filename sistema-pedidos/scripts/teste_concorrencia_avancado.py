@@ -8,20 +8,20 @@ def teste_concorrencia_completo():
     print("🔬 TESTE AVANÇADO DE CONCORRÊNCIA")
     print("="*50)
     
-    sistema = SistemaPedidos('dados_concorrencia')
+    sistema = SistemaPedidos('dados_teste/concorrencia_avancado.xlsx')
     
     # Preparar dados de teste
     print("📦 Preparando produtos para teste...")
-    sistema.adicionar_produto("Produto A", 100.00, "Categoria", 10)
-    sistema.adicionar_produto("Produto B", 200.00, "Categoria", 5)
-    sistema.adicionar_produto("Produto C", 50.00, "Categoria", 20)
+    sistema.adicionar_produto("Produto A", "Categoria", 100.00, 10)
+    sistema.adicionar_produto("Produto B", "Categoria", 200.00, 5)
+    sistema.adicionar_produto("Produto C", "Categoria", 50.00, 20)
     
     resultados_globais = {
         'pedidos_criados': 0,
         'pedidos_falharam': 0,
         'cancelamentos_ok': 0,
         'cancelamentos_falha': 0,
-        'atualizacoes_estoque': 0
+        'consultas_estatisticas': 0
     }
     
     lock_resultados = threading.Lock()
@@ -30,7 +30,7 @@ def teste_concorrencia_completo():
         """Worker que cria pedidos aleatórios"""
         for i in range(max_pedidos):
             quantidade = random.randint(1, 3)
-            sucesso, _ = sistema.criar_pedido(produto_id, quantidade, f"Pedido worker {worker_id}-{i}")
+            sucesso, _ = sistema.fazer_pedido(produto_id, quantidade, f"Pedido worker {worker_id}-{i}")
             
             with lock_resultados:
                 if sucesso:
@@ -54,16 +54,14 @@ def teste_concorrencia_completo():
             
             time.sleep(random.uniform(0.01, 0.03))
     
-    def worker_atualizar_estoque(worker_id, max_atualizacoes=3):
-        """Worker que atualiza estoques"""
-        for i in range(max_atualizacoes):
-            produto_id = random.randint(1, 3)
-            nova_quantidade = random.randint(5, 15)
-            sucesso, _ = sistema.atualizar_estoque(produto_id, nova_quantidade)
+    def worker_consultar_estatisticas(worker_id, max_consultas=3):
+        """Worker que lê estatísticas enquanto os pedidos são gravados"""
+        for i in range(max_consultas):
+            stats = sistema.obter_estatisticas()
             
             with lock_resultados:
-                if sucesso:
-                    resultados_globais['atualizacoes_estoque'] += 1
+                if stats['total_pedidos'] >= 0:
+                    resultados_globais['consultas_estatisticas'] += 1
             
             time.sleep(random.uniform(0.02, 0.08))
     
@@ -92,9 +90,9 @@ def teste_concorrencia_completo():
         t = threading.Thread(target=worker_cancelar_pedidos, args=(f"Cancel{i}", 8))
         threads.append(t)
     
-    # 2 threads atualizando estoque
+    # 2 threads consultando estatísticas
     for i in range(2):
-        t = threading.Thread(target=worker_atualizar_estoque, args=(f"Stock{i}", 2))
+        t = threading.Thread(target=worker_consultar_estatisticas, args=(f"Stats{i}", 2))
         threads.append(t)
     
     # Iniciar todas as threads
@@ -114,7 +112,7 @@ def teste_concorrencia_completo():
     print(f"❌ Pedidos que falharam: {resultados_globais['pedidos_falharam']}")
     print(f"✅ Cancelamentos bem-sucedidos: {resultados_globais['cancelamentos_ok']}")
     print(f"❌ Cancelamentos que falharam: {resultados_globais['cancelamentos_falha']}")
-    print(f"✅ Atualizações de estoque: {resultados_globais['atualizacoes_estoque']}")
+    print(f"✅ Consultas de estatísticas: {resultados_globais['consultas_estatisticas']}")
     
     # Verificar integridade final
     print("\n🔍 VERIFICAÇÃO DE INTEGRIDADE:")
@@ -125,17 +123,15 @@ def teste_concorrencia_completo():
     print(f"Valor total pedidos ativos: R$ {stats['valor_total_pedidos_ativos']:.2f}")
     
     # Verificar se não há inconsistências
-    produtos, estoque, pedidos = sistema._carregar_dados()
+    produtos, historico = sistema._carregar_dados()
     
     print("\n📦 ESTOQUE FINAL:")
     for _, produto in produtos.iterrows():
-        estoque_produto = estoque[estoque['id_produto'] == produto['id_produto']]
-        if not estoque_produto.empty:
-            qtd = int(estoque_produto.iloc[0]['quantidade_disponivel'])
-            print(f"  {produto['nome']}: {qtd} unidades")
+        qtd = int(produto['quantidade_estoque'])
+        print(f"  {produto['nome']}: {qtd} unidades")
     
     # Validar que estoque não ficou negativo
-    estoques_negativos = estoque[estoque['quantidade_disponivel'] < 0]
+    estoques_negativos = produtos[produtos['quantidade_estoque'] < 0]
     if not estoques_negativos.empty:
         print("🚨 ERRO: Encontrados estoques negativos!")
         print(estoques_negativos)
@@ -149,32 +145,30 @@ def teste_stress_sistema():
     print("\n💪 TESTE DE STRESS DO SISTEMA")
     print("="*40)
     
-    sistema = SistemaPedidos('dados_stress')
+    sistema = SistemaPedidos('dados_teste/stress.xlsx')
     
     # Preparar muitos produtos
     print("📦 Criando 50 produtos...")
     for i in range(1, 51):
-        sistema.adicionar_produto(f"Produto {i}", random.uniform(10, 1000), f"Categoria {i%5}", random.randint(10, 100))
+        sistema.adicionar_produto(f"Produto {i}", f"Categoria {i%5}", random.uniform(10, 1000), random.randint(10, 100))
     
     def operacao_aleatoria(worker_id, num_operacoes=100):
         """Executa operações aleatórias no sistema"""
         for _ in range(num_operacoes):
-            operacao = random.choice(['criar_pedido', 'cancelar_pedido', 'atualizar_estoque'])
+            operacao = random.choice(['fazer_pedido', 'cancelar_pedido', 'obter_estatisticas'])
             
             try:
-                if operacao == 'criar_pedido':
+                if operacao == 'fazer_pedido':
                     produto_id = random.randint(1, 50)
                     quantidade = random.randint(1, 5)
-                    sistema.criar_pedido(produto_id, quantidade)
+                    sistema.fazer_pedido(produto_id, quantidade)
                 
                 elif operacao == 'cancelar_pedido':
                     pedido_id = random.randint(1, 200)
                     sistema.cancelar_pedido(pedido_id)
                 
-                elif operacao == 'atualizar_estoque':
-                    produto_id = random.randint(1, 50)
-                    nova_quantidade = random.randint(0, 50)
-                    sistema.atualizar_estoque(produto_id, nova_quantidade)
+                elif operacao == 'obter_estatisticas':
+                    sistema.obter_estatisticas()
                 
             except Exception as e:
                 print(f"Worker {worker_id} encontrou erro: {e}")
@@ -210,8 +204,8 @@ def teste_stress_sistema():
     print(f"Valor total: R$ {stats['valor_total_pedidos_ativos']:.2f}")
     
     # Verificar integridade dos dados
-    _, estoque, _ = sistema._carregar_dados()
-    estoques_negativos = estoque[estoque['quantidade_disponivel'] < 0]
+    produtos, _ = sistema._carregar_dados()
+    estoques_negativos = produtos[produtos['quantidade_estoque'] < 0]
     
     if not estoques_negativos.empty:
         print("🚨 FALHA: Sistema permitiu estoques negativos!")